@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Script checks stocks of a product on all marketplaces at once and answers
+if stocks are wrong everywhere or on some marketplaces only.
+
+Marketplaces are checked in parallel (-w at the same time). 1C hits are the same
+for every marketplace so they are requested from elastic only once, organization
+and product data are found in postgres only once too. The result is a matrix
+with one row per marketplace: number of 1C and mp records, last quantities and
+discrepancies found by reconciliation.
+
+Example of usage:
+    ./fleet_stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -o спб -p 12345
+    ./fleet_stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -o спб -p 12345 -m mailru uteka -w 2
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields
+
+from parsers.ecom_parsers import marketplaces_map
+from utils.ecom_argparse import get_args_fleet
+from utils.ecom_elastic import enable_hits_cache
+from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+from utils.ecom_reconcile import MarketplaceStocksSummary, summarize_stocks
+from utils.other import read_identifiers, write_down_csv
+
+
+def check_marketplace(args, ssh_tunnel, marketplace: str) -> MarketplaceStocksSummary:
+    # sqlalchemy sessions can not be shared between threads, connections come from the same pool
+    with get_postgres_session(ssh_tunnel) as pg_session:
+        try:
+            parser = marketplaces_map[marketplace](
+                pg_session,
+                args.datetime,
+                marketplace,
+                args.organization,
+                args.store,
+                args.product,
+            )
+            if args.products_file:
+                parser.add_products(read_identifiers(args.products_file))
+
+            stocks_1c = list(parser.get_1c_stocks())
+            stocks_mp = list(parser.get_mp_stocks())
+        except SystemExit as e:
+            # parsers exit with 0 when the marketplace is not supported, with error code on failures
+            status = 'skipped' if not e.code else f'error: exit code {e.code}'
+            return MarketplaceStocksSummary(marketplace=marketplace, status=status)
+        except Exception as e:
+            return MarketplaceStocksSummary(marketplace=marketplace, status=f'error: {e}')
+
+        return summarize_stocks(marketplace, stocks_1c, stocks_mp, parser.product_aliases)
+
+
+if __name__ == '__main__':
+    args = get_args_fleet()
+    marketplaces = args.marketplaces or list(marketplaces_map.keys())
+
+    enable_hits_cache()
+
+    with get_ssh_tunnel() as ssh_tunnel:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            summaries = list(executor.map(
+                lambda marketplace: check_marketplace(args, ssh_tunnel, marketplace),
+                marketplaces,
+            ))
+
+    fields_list = [field.name for field in fields(MarketplaceStocksSummary)]
+
+    print('\n' + ''.join(f'{field[:17]:>18}' for field in fields_list))
+    for summary in summaries:
+        print(''.join(f'{str(getattr(summary, field))[:17]:>18}' for field in fields_list))
+
+    write_down_csv('fleet_stocks_data.csv', fields_list, summaries)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""Script saves stocks, prices and stores parsed from elastic into the local
+sqlite store, so questions across days and marketplaces can be answered by
+local SQL instead of new elastic requests.
+
+Every parser method reads the period from the end of its previous ingestion
+(a bit earlier, hits may come late) to the datetime. The first ingestion reads
+the usual period of the method. Records that are already in the store are skipped.
+
+Example of usage:
+    ./ingest_records.py -d 2022-11-26T12:00:00.000Z -o спб
+    ./ingest_records.py -d 2022-11-26T12:00:00.000Z -o спб -m mailru uteka -k stocks
+    sqlite3 ~/.cache/ecom-tech-support/records.sqlite \\
+        "SELECT marketplace, day, count(*) FROM stocks GROUP BY marketplace, day"
+"""
+
+import sqlite3
+import traceback
+
+from parsers.ecom_parsers import marketplaces_map
+from parsers.ecom_parsers.base_mp import BaseParser
+from utils.ecom_argparse import get_args_ingest
+from utils.ecom_elastic import get_truncated_count
+from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+from utils.ecom_store import (
+    INGEST_OVERLAP_MINUTES,
+    get_record_datetime,
+    get_watermark,
+    open_store,
+    save_records,
+    save_watermark,
+)
+from utils.other import parse_datetime, read_identifiers
+
+# kind, parser method, setting with the period of the method
+INGEST_METHODS = (
+    ('stocks', 'get_1c_stocks', 'period_1c_stocks'),
+    ('stocks', 'get_mp_stocks', 'period_mp_stocks'),
+    ('prices', 'get_1c_prices', 'period_1c_prices'),
+    ('prices', 'get_mp_prices', 'period_mp_prices'),
+    ('stores', 'get_1c_stores', 'period_1c_stores'),
+    ('stores', 'get_mp_stores', 'period_mp_stores'),
+)
+
+
+def ingest_method(
+    store: sqlite3.Connection,
+    parser: BaseParser,
+    end_dt: str,
+    kind: str,
+    method_name: str,
+    period_name: str,
+) -> None:
+    products = ','.join(sorted(parser.product_identifiers))
+    watermark_name = f'{parser.marketplace}|{parser.passed_org_name}|{products}|{method_name}'
+    watermark = get_watermark(store, watermark_name)
+
+    if watermark:
+        hours = (parse_datetime(end_dt) - parse_datetime(watermark)).total_seconds() / 3600
+        if hours <= 0:
+            print(f'{method_name} is already ingested until {watermark}')
+            return
+        # settings are shared by all parsers of the marketplace, so the period is changed in a copy.
+        # copy.copy of pydantic settings would share their fields
+        parser.mp_settings = parser.mp_settings.copy()
+        setattr(parser.mp_settings, period_name, hours + INGEST_OVERLAP_MINUTES / 60)
+
+    truncated_count = get_truncated_count()
+
+    try:
+        records = list(getattr(parser, method_name)())
+        inserted = save_records(store, kind, parser.marketplace, records)
+    except SystemExit as e:
+        # parsers exit with 0 when the method is not supported by marketplace, with error code on failures
+        if e.code:
+            print(f'{method_name} failed: exit code {e.code}')
+        else:
+            print(f'{method_name} is skipped')
+        return
+    except Exception as e:
+        print(f'{method_name} failed: {e}')
+        traceback.print_exc()
+        return
+
+    print(f'{method_name}: {inserted} new {kind} records')
+
+    # hits after the cut were not read, the next run has to start from the last ingested record
+    if get_truncated_count() > truncated_count:
+        record_datetimes = [dt for dt in (get_record_datetime(record.datetime) for record in records) if dt]
+        ingested_until = max(record_datetimes, default=None)
+
+        if ingested_until is None or (watermark and ingested_until <= parse_datetime(watermark)):
+            print(f'{method_name} hits are truncated and nothing new is read, watermark is not moved.')
+            return
+
+        end_dt = ingested_until.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        print(f'{method_name} hits are truncated, it is ingested only until {end_dt}. run it again.')
+
+    save_watermark(store, watermark_name, end_dt)
+
+
+if __name__ == '__main__':
+    args = get_args_ingest()
+    marketplaces = args.marketplaces or list(marketplaces_map.keys())
+
+    with (get_ssh_tunnel() as ssh_tunnel,
+            get_postgres_session(ssh_tunnel) as pg_session,
+            open_store() as store):
+
+        for marketplace in marketplaces:
+            print('\n' f'ingesting {marketplace}...')
+
+            try:
+                parser = marketplaces_map[marketplace](
+                    pg_session,
+                    args.datetime,
+                    marketplace,
+                    args.organization,
+                    args.store,
+                    args.product,
+                )
+            except SystemExit:
+                print(f'{marketplace} is skipped')
+                continue
+
+            if args.products_file:
+                parser.add_products(read_identifiers(args.products_file))
+
+            for kind, method_name, period_name in INGEST_METHODS:
+                if kind in args.kinds and hasattr(parser, method_name):
+                    ingest_method(store, parser, args.datetime, kind, method_name, period_name)
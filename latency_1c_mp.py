@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""Script measures how long stocks and prices take to get from 1C to a marketplace.
+
+For every product of the organization the delay between a value coming from 1C
+and the same value being pushed to the marketplace is calculated. Statistics
+per product are written down slowest first, the overall histogram and the
+worst delays are printed.
+
+Example of usage:
+    ./latency_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб
+"""
+
+from dataclasses import fields
+from itertools import chain, islice
+from typing import Generator, Iterable
+
+from parsers.ecom_parsers import marketplaces_map
+from utils.ecom_argparse import get_args_stocks_prices
+from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+from utils.ecom_reconcile import LatencyAnalyzer, LatencySample, LatencyStats
+from utils.ecom_store import get_record_datetime
+from utils.other import read_identifiers, write_down_csv
+
+BATCH_SIZE = 10000
+
+
+def iter_dated_records(records: Iterable) -> Generator:
+    """Replace string datetimes (i.e. of feed records) with datetime objects, skip records without datetime."""
+    for record in records:
+        record.datetime = get_record_datetime(record.datetime)
+        if record.datetime is not None:
+            yield record
+
+
+def analyze(parser, kind: str, records_1c, records_mp) -> None:
+    analyzer = LatencyAnalyzer(parser.marketplace, kind, parser.product_aliases)
+
+    # feed and some marketplace records are not sorted by datetime
+    records = iter(sorted(iter_dated_records(chain(records_1c, records_mp)), key=lambda r: r.datetime))
+    while batch := list(islice(records, BATCH_SIZE)):
+        analyzer.add_batch(batch)
+
+    print('\n' f'{kind}:')
+    analyzer.print_histogram()
+
+    print('\n' 'worst delays:')
+    for sample in analyzer.get_worst():
+        print(f'{sample.latency_seconds:>10.0f} s  {sample.product_identifier}  {sample.hit_link_mp}')
+
+    write_down_csv(f'latency_{kind}.csv', [field.name for field in fields(LatencyStats)], analyzer.get_stats())
+    write_down_csv(f'latency_{kind}_worst.csv', [field.name for field in fields(LatencySample)], analyzer.get_worst())
+
+
+if __name__ == '__main__':
+    args = get_args_stocks_prices(('products_file',))
+
+    with (get_ssh_tunnel() as ssh_tunnel,
+            get_postgres_session(ssh_tunnel) as pg_session):
+
+        parser = marketplaces_map[args.marketplace](
+            pg_session,
+            args.datetime,
+            args.marketplace,
+            args.organization,
+            args.store,
+            args.product,
+        )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+
+        analyze(parser, 'stocks', parser.get_1c_stocks(), parser.get_mp_stocks())
+
+        if parser.mp_settings.stocks_instead_prices:
+            prices_mp = parser.get_mp_stocks()
+        else:
+            prices_mp = parser.get_mp_prices()
+        analyze(parser, 'prices', parser.get_1c_prices(), prices_mp)
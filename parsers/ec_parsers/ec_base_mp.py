@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from datetime import datetime
 
 from settings import StandardMarketplaceSettings
+from utils.ecom_checkpoint import iter_checkpointed
 from utils.ecom_elastic import get_hits
 from utils.other import (
     convert_timezone,
@@ -52,11 +53,8 @@ class BaseParser:
 
 class StocksClientParser(BaseParser):
 
-    def get_client_stocks(self):
-        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_1c_stocks)
+    def _get_client_stocks_segment(self, begin_dt: str, end_dt: str):
         endpoint = f'/v1.1/pharmacies/{self.store_identifier}/stocks'
-
-        results_count = 0
         hits = get_hits(begin_dt, end_dt, endpoint, project='ecom-client', method='HTTP_REQUEST')
 
         for hit in hits:
@@ -79,7 +77,17 @@ class StocksClientParser(BaseParser):
                 )
 
                 yield stock_record
-                results_count += 1
+
+    def get_client_stocks(self):
+        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_1c_stocks)
+
+        # periods can be a month long so they are extracted by resumable segments
+        job_name = f'{type(self).__name__}.get_client_stocks|{self.store_identifier}'
+
+        results_count = 0
+        for stock_record in iter_checkpointed(job_name, begin_dt, end_dt, self._get_client_stocks_segment):
+            yield stock_record
+            results_count += 1
 
         print(f'results: {results_count}')
 
@@ -2,6 +2,7 @@ import json
 
 from .ec_base_mp import StocksClientParser, StocksMPParser
 from settings import StandardMarketplaceSettings
+from utils.ecom_checkpoint import iter_checkpointed
 from utils.ecom_elastic import get_hits
 from utils.other import convert_timezone, generate_elk_doc_link, get_datetimes, parse_datetime
 
@@ -32,13 +33,8 @@ class ECUtekaParser(StocksClientParser, StocksMPParser):
         )
         self.mp_settings = _mp_settings
 
-    def get_mp_stocks(self):
-        print('\n' 'getting mp data...')
-
-        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_mp_stocks)
+    def _get_mp_stocks_segment(self, begin_dt: str, end_dt: str):
         endpoint = f'/v1.0/stocks?storeId={self.store_identifier}&page=0&size=10000'
-
-        results_count = 0
         hits = get_hits(begin_dt, end_dt, endpoint, project='ecom-client', method='HTTP_RESPONSE')
 
         for hit in hits:
@@ -60,7 +56,18 @@ class ECUtekaParser(StocksClientParser, StocksMPParser):
                 )
 
                 yield stock_record
-                results_count += 1
 
-        print(f'results: {results_count}')
+    def get_mp_stocks(self):
+        print('\n' 'getting mp data...')
+
+        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_mp_stocks)
+
+        # the period is a week long so it is extracted by resumable segments
+        job_name = f'{type(self).__name__}.get_mp_stocks|{self.store_identifier}'
 
+        results_count = 0
+        for stock_record in iter_checkpointed(job_name, begin_dt, end_dt, self._get_mp_stocks_segment):
+            yield stock_record
+            results_count += 1
+
+        print(f'results: {results_count}')
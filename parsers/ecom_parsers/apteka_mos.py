@@ -15,7 +15,7 @@ from utils.other import (
     get_datetimes,
     parse_datetime,
 )
-from utils.ecom_postgres import execute_query
+from utils.ecom_postgres import get_guids_filter, stream_query
 
 
 _mp_settings = StandardMarketplaceSettings(
@@ -76,7 +76,7 @@ class AptekamosParser(All1CParser, StocksMPParser):
                 org_address_guids.add(stock.org_address_guid)
 
         # make string for sql query
-        org_address_guids = "('" + "\', \'".join(org_address_guids) + "')"
+        org_address_guids_filter = get_guids_filter(self.pg_session, 'org_address.address_guid', org_address_guids)
 
         query_text = f'''
         select
@@ -87,10 +87,10 @@ class AptekamosParser(All1CParser, StocksMPParser):
             inner join core_organization organization
                 on org_address.organization_id = organization.id
         where
-            org_address.address_guid in {org_address_guids}
+            {org_address_guids_filter}
         '''
 
-        query_result = execute_query(self.pg_session, query_text)
+        query_result = stream_query(self.pg_session, query_text)
 
         org_dict = {}
         for row in query_result:
@@ -1,7 +1,10 @@
 import json
-from typing import Generator
+import sys
+from datetime import datetime
+from typing import Callable, Collection, Generator, Iterable
 
 import ijson
+from elasticsearch_dsl.utils import AttrList
 from sqlalchemy.orm.session import Session
 
 from settings import StandardMarketplaceSettings
@@ -13,7 +16,9 @@ from utils.ecom_dataclasses import (
     Store1C,
     StoreStandard,
 )
-from utils.ecom_elastic import get_hits
+from utils.ecom_dedup import PayloadCache
+from utils.ecom_elastic import follow_hits, get_hits, iter_hits_backwards
+from utils.ecom_records_cache import get_cached_records
 from utils.other import (
     convert_timezone,
     generate_elk_doc_link,
@@ -22,13 +27,16 @@ from utils.other import (
     parse_datetime,
 )
 from utils.ecom_postgres import (
-    execute_query,
+    BULK_GUIDS_THRESHOLD,
+    get_guids_filter,
     get_marketplace_guid,
-    get_organization_data,
+    get_organization_price_guids,
+    get_parser_context,
     get_price_settings,
     get_prices_data,
-    get_product_data,
-    get_store_data,
+    get_products_data,
+    get_stores_data,
+    stream_query,
 )
 
 
@@ -54,18 +62,28 @@ class BaseParser:
             product_data: product data dict. Contains code, guid etc.
         """
         self.pg_session = pg_session
-        self.store_data = get_store_data(pg_session, store_identifier)
+
+        # store, organization and product are resolved in one database round trip
+        self.store_data, self.org_data, product_data = get_parser_context(
+            pg_session,
+            org_identifier,
+            store_identifier,
+            product_identifier,
+        )
 
         if not org_identifier:
-            org_identifier = self.store_data.pop('org_name')
-        self.org_data = get_organization_data(pg_session, org_identifier)
+            self.store_data.pop('org_name')
 
         self.transaction_dt = transaction_dt
         self.marketplace = marketplace
         self.org_endpoint = self.org_data['endpoint']
         self.passed_org_name = self.org_data['org_name']
-        self.store_identifiers = self.store_data.values()
-        self.product_identifiers = get_product_data(self.pg_session, product_identifier).values()
+        # sets because every parsed record is checked against them
+        self.store_identifiers = set(self.store_data.values())
+        self.product_data = product_data
+        self.product_identifiers = set(product_data.values())
+        # mp may identify product by code while 1C always uses guid
+        self.product_aliases = {identifier: product_data['guid'] for identifier in self.product_identifiers}
 
         # dataclasses
         self.dt_price_1c = Price1C
@@ -77,6 +95,124 @@ class BaseParser:
 
         self.mp_settings = StandardMarketplaceSettings()
 
+        # poll elastic for new hits instead of reading the period once. set by scripts.
+        self.follow = False
+        # identical payloads are parsed once, repeated ones in a row are skipped if collapse_duplicates is set
+        self.payloads = PayloadCache()
+        self.collapse_duplicates = False
+        # parsed records of all products are cached per window. set by scripts.
+        self.cache_records = False
+
+    def add_products(self, identifiers: Iterable[str]) -> None:
+        """Add products to the filter, i.e. from a file. All of them are resolved by one query.
+
+        Args:
+            identifiers: product guids and codes. Not found ones are printed.
+        Raises:
+            SystemExit: if no product is found.
+        """
+        for product in get_products_data(self.pg_session, identifiers).values():
+            for identifier in product.values():
+                self.product_identifiers.add(identifier)
+                self.product_aliases[identifier] = product['guid']
+
+        # empty filter means all products, so the run would silently check every product
+        if not self.product_identifiers:
+            print('none of passed products is found.')
+            sys.exit(1)
+
+    def add_stores(self, identifiers: Iterable[str]) -> None:
+        """Add stores of passed organization to the filter. All of them are resolved by one query.
+
+        Args:
+            identifiers: store guids, ids or outlet ids. Not found ones are printed.
+        Raises:
+            SystemExit: if no store of passed organization is found.
+        """
+        for store in get_stores_data(self.pg_session, identifiers).values():
+            if store['org_name'] != self.passed_org_name:
+                print(f'store {store["guid"]} belongs to {store["org_name"]}, skipped.')
+                continue
+
+            self.store_identifiers.update(store[key] for key in ('guid', 'id', 'outlet') if store[key])
+
+        # empty filter means all stores, so the run would silently check every store
+        if not self.store_identifiers:
+            print(f'none of passed stores is found in {self.passed_org_name}.')
+            sys.exit(1)
+
+    def _get_hit_pages(
+        self,
+        begin_dt: str,
+        end_dt: str,
+        endpoint: str,
+        username: str = 'puls',
+        success_status: str = '200',
+    ) -> Iterable[AttrList]:
+        """Get hits of the period as one page or, in follow mode, endless pages of new hits.
+
+        In follow mode the period end is ignored and the watermark is kept per
+        marketplace, organization, products and endpoint.
+        """
+        if not self.follow:
+            return [get_hits(begin_dt, end_dt, endpoint, username, success_status)]
+
+        products = ','.join(sorted(self.product_identifiers))
+        watermark_name = f'{self.marketplace}|{self.passed_org_name}|{products}|{endpoint}'
+        return follow_hits(begin_dt, endpoint, username, success_status, watermark_name)
+
+    def _get_latest_records(
+        self,
+        hit_pages: Iterable[list],
+        parse_hits: Callable[[list], Iterable],
+        required_regions: Collection = (),
+    ) -> Generator:
+        """Get records of the latest hit per product and price guid from hits sorted backwards.
+
+        All rows of the product from that hit are kept, i.e. stocks of every expiration batch.
+        Reading stops as soon as every passed product (in every required region)
+        is found, so usually only a few latest pages are requested from elastic.
+        Hits are parsed by pages, so organizations are resolved once per page.
+
+        Args:
+            hit_pages: lists of Hit objects sorted by '@timestamp' descending.
+            parse_hits: parser method that makes filtered records from a list of hits.
+            required_regions: regions or price guids every product should be found in.
+        Yields:
+            Records, the latest first.
+        """
+        if not self.product_identifiers:
+            print('latest state can be found only for passed products.')
+            sys.exit(0)
+
+        # guid and code of the product are the same product
+        missing = {
+            (self.product_aliases.get(product, product), region)
+            for product in self.product_identifiers
+            for region in (required_regions or [None])
+        }
+
+        # (product, price guid): link of the hit the product is found in
+        found = {}
+        hits_count = 0
+        for hits in hit_pages:
+            hits_count += len(hits)
+
+            for record in parse_hits(hits):
+                product = self.product_aliases.get(record.product_identifier, record.product_identifier)
+                price_guid = getattr(record, 'price_guid', None)
+                if found.setdefault((product, price_guid), record.hit_link) != record.hit_link:
+                    continue
+
+                missing.discard((product, price_guid if required_regions else None))
+                yield record
+
+            if not missing:
+                break
+
+        print(f'hits read: {hits_count}')
+        if missing:
+            print(f'not found in the period: {sorted(missing, key=str)}')
 
 
 class Prices1CParser(BaseParser):
@@ -194,6 +330,49 @@ class Prices1CParser(BaseParser):
 
 class Stocks1CParser(BaseParser):
 
+    def _parse_1c_stocks(self, hits: Iterable, filter_products: bool = True) -> Generator[Stock1C, None, None]:
+        """Parse stocks of passed products (of all products if filter_products is False) from 1C hits."""
+        product_identifiers = self.product_identifiers if filter_products else ()
+
+        def parse_payload(payload: str, hit_datetime: datetime, hit_link: str) -> list[Stock1C]:
+            stocks = []
+            stocks_raw = json.loads(payload)
+            stocks_raw = stocks_raw.get('Data', [])
+
+            for stock_raw in stocks_raw:
+                product_identifier_curr = stock_raw['ProductGuid']
+
+                if not product_identifiers or product_identifier_curr in product_identifiers:
+                    stock_record = Stock1C(
+                        direction = '->e  ',
+                        datetime = hit_datetime,
+                        quantity = stock_raw.get('Quantity'),
+                        product_identifier = product_identifier_curr,
+                        expiration_date = stock_raw.get('ExpirationDate'),
+                        org_name = self.passed_org_name,
+                        hit_link = hit_link,
+                    )
+
+                    stocks.append(stock_record)
+
+            return stocks
+
+        for hit in hits:
+            hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
+            hit_datetime = convert_timezone(parse_datetime(hit['@timestamp']), 'msc')
+            payload = hit.transaction.custom.response_content
+
+            hit_stocks = self.payloads.get_records(
+                (hit.transaction.name, filter_products),
+                payload,
+                lambda: parse_payload(payload, hit_datetime, hit_link),
+                hit_datetime,
+                hit_link,
+                self.collapse_duplicates,
+            )
+            if hit_stocks:
+                yield from hit_stocks
+
     def get_1c_stocks(self) -> Generator[Stock1C, None, None]:
         """Get and parse 1c stocks data from elastic.
 
@@ -224,34 +403,26 @@ class Stocks1CParser(BaseParser):
         #     for product_guid in product_guids:
         #         product_identifiers.append(product_guid)
 
-        results_count = 0
-        hits = get_hits(begin_dt, end_dt, endpoint)
-
-        for hit in hits:
-            hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
-            hit_datetime = parse_datetime(hit['@timestamp'])
-
-            stocks_raw = json.loads(hit.transaction.custom.response_content)
-            stocks_raw = stocks_raw.get('Data', [])
-
-            for stock_raw in stocks_raw:
-                product_identifier_curr = stock_raw['ProductGuid']
-
-                if not self.product_identifiers or product_identifier_curr in self.product_identifiers:
-                    stock_record = Stock1C(
-                        direction = '->e  ',
-                        datetime = convert_timezone(hit_datetime, 'msc'),
-                        quantity = stock_raw.get('Quantity'),
-                        product_identifier = product_identifier_curr,
-                        expiration_date = stock_raw.get('ExpirationDate'),
-                        org_name = self.passed_org_name,
-                        hit_link = hit_link,
-                    )
+        if self.cache_records:
+            stocks = get_cached_records(
+                f'{type(self).__name__}|get_1c_stocks|{endpoint}|{self.collapse_duplicates}',
+                begin_dt,
+                end_dt,
+                self.dt_stock_1c,
+                lambda: self._parse_1c_stocks(get_hits(begin_dt, end_dt, endpoint), filter_products=False),
+                'product_identifier',
+                self.product_identifiers,
+            )
+        else:
+            stocks = self._parse_1c_stocks(get_hits(begin_dt, end_dt, endpoint))
 
-                    yield stock_record
-                    results_count += 1
+        results_count = 0
+        for stock_record in stocks:
+            yield stock_record
+            results_count += 1
 
         print(f'results: {results_count}')
+        self.payloads.print_stats()
 
         query_link = generate_elk_query_link(
             'stocks_1c',
@@ -262,6 +433,20 @@ class Stocks1CParser(BaseParser):
         )
         print(f'kibana query link: {query_link}')
 
+    def get_1c_stocks_latest(self) -> Generator[Stock1C, None, None]:
+        """Get the last stocks received from 1C for passed products before transaction datetime.
+
+        Returns:
+            Stocks of every expiration batch of the product from its latest hit.
+        """
+        print('\n' 'getting latest 1c data...')
+
+        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_1c_stocks)
+        endpoint = f'POST {self.org_endpoint}/v1/stocks*'
+
+        hit_pages = iter_hits_backwards(begin_dt, end_dt, endpoint)
+        yield from self._get_latest_records(hit_pages, self._parse_1c_stocks)
+
 
 class Stores1CParser(BaseParser):
 
@@ -365,56 +550,56 @@ class PricesMPParser(BaseParser):
         endpoint = self.mp_settings.prices_mp_endpoint
         success_status = self.mp_settings.prices_mp_success_status
 
-        prices = []
-        hits = get_hits(begin_dt, end_dt, endpoint, self.marketplace, success_status)
-
-        for hit in hits:
-            hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
-            hit_datetime = parse_datetime(hit['@timestamp'])
-
-            prices_raw = ijson.items(hit.transaction.custom[data_var_name], 'item')
-
-            if data_var_name == 'response_content':
-                prices_raw = prices_raw['results']
-
-            # TODO: remove try...except when logging will be fixed
-            try:
-                for price_raw in prices_raw:
-                    if not self.product_identifiers or price_raw[product_var_name] in self.product_identifiers:
-                        price_obj = PriceStandard(
-                            direction='  e->',
-                            datetime=convert_timezone(hit_datetime, 'msc'),
-                            product_identifier=price_raw.get(product_var_name),
-                            price=price_raw.get('price'),
-                            price_guid=price_raw.get(price_region_var_name),
-                            expiration_date=price_raw.get(expiration_date_var_name),
-                            # org_name': '',
-                            hit_link=hit_link,
-                        )
-
-                        if self.mp_settings.check_none_regions:
-                            # common error for aptekaforte - None as a region field
-                            try:
-                                price_obj.price_guid = int(price_raw.get(price_region_var_name))
-                            except ValueError as e:
-                                price_obj.price_guid = -1
-                                print(str(e) + '\n' + hit_link)
-
-                        if self.mp_settings.base_filter != 'organization':
-                            price_obj.org_name = self.passed_org_name
-
-                        prices.append(price_obj)
-            except ijson.IncompleteJSONError:
-                print('hit has not been logged completely.')
-                continue
-
-        if prices and self.mp_settings.base_filter == 'region':
-            prices = filter(lambda p: p.price_guid in related_regions, prices)
-
         results_count = 0
-        for price in prices:
-            yield price
-            results_count += 1
+        for hits in self._get_hit_pages(begin_dt, end_dt, endpoint, self.marketplace, success_status):
+            prices = []
+
+            for hit in hits:
+                hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
+                hit_datetime = parse_datetime(hit['@timestamp'])
+
+                prices_raw = ijson.items(hit.transaction.custom[data_var_name], 'item')
+
+                if data_var_name == 'response_content':
+                    prices_raw = prices_raw['results']
+
+                # TODO: remove try...except when logging will be fixed
+                try:
+                    for price_raw in prices_raw:
+                        if not self.product_identifiers or price_raw[product_var_name] in self.product_identifiers:
+                            price_obj = PriceStandard(
+                                direction='  e->',
+                                datetime=convert_timezone(hit_datetime, 'msc'),
+                                product_identifier=price_raw.get(product_var_name),
+                                price=price_raw.get('price'),
+                                price_guid=price_raw.get(price_region_var_name),
+                                expiration_date=price_raw.get(expiration_date_var_name),
+                                # org_name': '',
+                                hit_link=hit_link,
+                            )
+
+                            if self.mp_settings.check_none_regions:
+                                # common error for aptekaforte - None as a region field
+                                try:
+                                    price_obj.price_guid = int(price_raw.get(price_region_var_name))
+                                except ValueError as e:
+                                    price_obj.price_guid = -1
+                                    print(str(e) + '\n' + hit_link)
+
+                            if self.mp_settings.base_filter != 'organization':
+                                price_obj.org_name = self.passed_org_name
+
+                            prices.append(price_obj)
+                except ijson.IncompleteJSONError:
+                    print('hit has not been logged completely.')
+                    continue
+
+            if prices and self.mp_settings.base_filter == 'region':
+                prices = filter(lambda p: p.price_guid in related_regions, prices)
+
+            for price in prices:
+                yield price
+                results_count += 1
 
         print(f'results: {results_count}')
 
@@ -445,10 +630,8 @@ class StocksMPParser(BaseParser):
                 price_guids.add(stock.price_guid)
             elif self.marketplace in ('uteka',) and stock.region:
                 price_guids.add(stock.region)
-        # make string for sql query
-        price_guids = "('" + "\', \'".join(price_guids) + "')"
-
         if self.marketplace in ('aptekaforte',):
+            price_guids_filter = get_guids_filter(self.pg_session, 'co.guid', price_guids)
             query_text = f'''
             select
                 co.guid,
@@ -456,10 +639,11 @@ class StocksMPParser(BaseParser):
             from
                 core_organization co
             where
-                co.guid in {price_guids}
+                {price_guids_filter}
             '''
 
         else:
+            price_guids_filter = get_guids_filter(self.pg_session, 'price.guid', price_guids)
             query_text = f'''
             select
                 price.guid,
@@ -470,13 +654,13 @@ class StocksMPParser(BaseParser):
                 inner join
                     core_organization org
                         on price.organization_id = org.id
-                        and price.guid in {price_guids}
+                        and {price_guids_filter}
             group by
                 price.guid,
                 price.price_type
             '''
 
-        query_result = execute_query(self.pg_session, query_text)
+        query_result = stream_query(self.pg_session, query_text)
 
         org_dict = {}
         for row in query_result:
@@ -503,44 +687,65 @@ class StocksMPParser(BaseParser):
 
         return stocks
 
-    def get_mp_stocks(self) -> Generator[StockStandard, None, None]:
-        """Get and parse mp stocks data from elastic.
-
-        Returns:
-            List of stocks which are instances of corresponding dataclass.
-        """
-        print('\n' 'getting mp data...')
-
-        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_mp_stocks)
+    def _filter_org_stocks_mp(self, stocks: list[StockStandard]) -> Iterable[StockStandard]:
+        """Keep only stocks of passed organization and set their org_name."""
         store_org_id = self.org_data['org_id']
         passed_org_name = self.org_data['org_name']
         related_regions = self.org_data['related_region_codes']
 
+        if self.mp_settings.base_filter != 'organization':
+            for stock in stocks:
+                stock.org_name = passed_org_name
+
+        if stocks and self.mp_settings.base_filter == 'organization':
+            stocks = self._add_orgs_stocks_mp(stocks)
+            stocks = filter(lambda s: s.org_name == passed_org_name, stocks)
+
+        elif stocks and self.mp_settings.base_filter == 'region':
+            stocks = filter(lambda s: s.price_guid in related_regions, stocks)
+
+        elif stocks and self.mp_settings.base_filter == 'organization_id':
+            stocks = filter(lambda s: s.price_guid == store_org_id, stocks)
+
+        return stocks
+
+    def _parse_mp_stocks(
+        self,
+        hits: Iterable,
+        filter_products: bool = True,
+        filter_orgs: bool = True,
+    ) -> Iterable[StockStandard]:
+        """Parse stocks from mp hits and keep only stocks of passed products and organization.
+
+        Args:
+            hits: Hit objects of stocks_mp_endpoint.
+            filter_products: keep only stocks of passed products.
+            filter_orgs: keep only stocks of passed organization.
+        Returns:
+            Stocks which are instances of corresponding dataclass.
+        """
+        product_identifiers = self.product_identifiers if filter_products else ()
+
         product_var_name = self.mp_settings.product_var_name
         expiration_date_var_name = self.mp_settings.expiration_date_var_name
         price_region_var_name = self.mp_settings.price_region_var_name
         data_var_name = self.mp_settings.data_var_name  # request or response atm
 
-        endpoint = self.mp_settings.stocks_mp_endpoint
-        success_status = self.mp_settings.stocks_mp_success_status
-
         stocks = []
-        hits = get_hits(begin_dt, end_dt, endpoint, self.marketplace, success_status)
 
-        for hit in hits:
-            hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
-            hit_datetime = parse_datetime(hit['@timestamp'])
-            stocks_raw = json.loads(hit.transaction.custom[data_var_name])
+        def parse_payload(payload: str, hit_datetime: datetime, hit_link: str) -> list[StockStandard]:
+            hit_stocks = []
+            stocks_raw = json.loads(payload)
 
             # if we get information from response we get hit dict from additional field
             if data_var_name == 'response_content':
                 stocks_raw = stocks_raw['results']
 
             for stock_raw in stocks_raw:
-                if not self.product_identifiers or stock_raw[product_var_name] in self.product_identifiers:
+                if not product_identifiers or stock_raw[product_var_name] in product_identifiers:
                     stock = StockStandard(
                         direction='  e->',
-                        datetime=convert_timezone(hit_datetime, 'msc'),
+                        datetime=hit_datetime,
                         product_identifier=stock_raw.get(product_var_name),
                         quantity=stock_raw.get('quantity'),
                         price=stock_raw.get('price'),
@@ -558,27 +763,73 @@ class StocksMPParser(BaseParser):
                             print(e)
                             print(hit_link)
 
-                    if self.mp_settings.base_filter != 'organization':
-                        stock.org_name = passed_org_name
+                    hit_stocks.append(stock)
 
-                    stocks.append(stock)
+            return hit_stocks
 
-        if stocks and self.mp_settings.base_filter == 'organization':
-            stocks = self._add_orgs_stocks_mp(stocks)
-            stocks = filter(lambda s: s.org_name == passed_org_name, stocks)
+        for hit in hits:
+            hit_link = generate_elk_doc_link(hit.meta.index, hit.meta.id)
+            hit_datetime = convert_timezone(parse_datetime(hit['@timestamp']), 'msc')
+            payload = hit.transaction.custom[data_var_name]
 
-        elif stocks and self.mp_settings.base_filter == 'region':
-            stocks = filter(lambda s: s.price_guid in related_regions, stocks)
+            hit_stocks = self.payloads.get_records(
+                (hit.transaction.name, filter_products),
+                payload,
+                lambda: parse_payload(payload, hit_datetime, hit_link),
+                hit_datetime,
+                hit_link,
+                self.collapse_duplicates,
+            )
+            if hit_stocks:
+                stocks.extend(hit_stocks)
 
-        elif stocks and self.mp_settings.base_filter == 'organization_id':
-            stocks = filter(lambda s: s.price_guid == store_org_id, stocks)
+        if not filter_orgs:
+            return stocks
+
+        return self._filter_org_stocks_mp(stocks)
+
+    def get_mp_stocks(self) -> Generator[StockStandard, None, None]:
+        """Get and parse mp stocks data from elastic.
+
+        Returns:
+            List of stocks which are instances of corresponding dataclass.
+        """
+        print('\n' 'getting mp data...')
+
+        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_mp_stocks)
+        endpoint = self.mp_settings.stocks_mp_endpoint
+        success_status = self.mp_settings.stocks_mp_success_status
+
+        if self.cache_records and not self.follow:
+            stocks = get_cached_records(
+                f'{type(self).__name__}|get_mp_stocks|{self.marketplace}|{endpoint}|{success_status}|'
+                f'{self.collapse_duplicates}',
+                begin_dt,
+                end_dt,
+                self.dt_stock_mp,
+                lambda: self._parse_mp_stocks(
+                    get_hits(begin_dt, end_dt, endpoint, self.marketplace, success_status),
+                    filter_products=False,
+                    filter_orgs=False,
+                ),
+                'product_identifier',
+                self.product_identifiers,
+            )
+            stock_pages = [self._filter_org_stocks_mp(stocks)]
+        else:
+            stock_pages = (
+                self._parse_mp_stocks(hits)
+                for hits in self._get_hit_pages(begin_dt, end_dt, endpoint, self.marketplace, success_status)
+            )
 
         results_count = 0
-        for stock in stocks:
-            yield stock
-            results_count += 1
+        for stocks in stock_pages:
+            for stock in stocks:
+                yield stock
+                results_count += 1
 
         print(f'results: {results_count}')
+        self.payloads.print_stats()
 
         query_link = generate_elk_query_link(
             'stocks_mp',
@@ -588,6 +839,32 @@ class StocksMPParser(BaseParser):
         )
         print(f'kibana query link: {query_link}')
 
+    def get_mp_stocks_latest(self) -> Generator[StockStandard, None, None]:
+        """Get the last stocks sent to mp for passed products before transaction datetime.
+
+        Returns:
+            Stocks of every expiration batch of the product per region/price guid from its latest hit.
+        """
+        print('\n' 'getting latest mp data...')
+
+        begin_dt, end_dt = get_datetimes(self.transaction_dt, self.mp_settings.period_mp_stocks)
+        endpoint = self.mp_settings.stocks_mp_endpoint
+        success_status = self.mp_settings.stocks_mp_success_status
+
+        required_regions = ()
+        if self.mp_settings.base_filter == 'region':
+            required_regions = self.org_data['related_region_codes']
+        elif self.mp_settings.base_filter == 'organization':
+            # every price type of the organization configured for mp is sent with its own price guid
+            required_regions = get_organization_price_guids(
+                self.pg_session,
+                self.marketplace,
+                self.org_data['org_id'],
+            )
+
+        hit_pages = iter_hits_backwards(begin_dt, end_dt, endpoint, self.marketplace, success_status)
+        yield from self._get_latest_records(hit_pages, self._parse_mp_stocks, required_regions)
+
 
 class StoresMPParser(BaseParser):
 
@@ -623,6 +900,7 @@ class StoresMPParser(BaseParser):
         # print(f'store guids set {len(stores_guids)}')
 
         if self.mp_settings.stores_mp_identifier == 'mp_store_guid':
+            guids_column = 'mp_store.marketplace_guid'
             query_text = """
             select
                 mp_store.marketplace_guid,
@@ -633,12 +911,13 @@ class StoresMPParser(BaseParser):
                     on org_store.organization_id = organization.id
                 inner join delivery_marketplacestore mp_store
                     on org_store.marketplace_store_id = mp_store.id
-                    and mp_store.marketplace_guid in {guids}
+                    and {guids_filter}
             group by
                 mp_store.marketplace_guid,
                 organization.name
             """
         elif self.mp_settings.stores_mp_identifier == 'org_store_id':
+            guids_column = 'org_store.address_id'
             query_text = """
             select
                 org_store.address_id,
@@ -647,12 +926,13 @@ class StoresMPParser(BaseParser):
                 delivery_organizationaddress org_store
                 inner join core_organization organization
                     on org_store.organization_id = organization.id
-                    and org_store.address_id in {guids}
+                    and {guids_filter}
             group by
                 org_store.address_id,
                 organization.name
             """
         else:
+            guids_column = 'org_store.address_guid'
             query_text = """
             select
                 org_store.address_guid,
@@ -661,32 +941,32 @@ class StoresMPParser(BaseParser):
                 delivery_organizationaddress org_store
                 inner join core_organization organization
                     on org_store.organization_id = organization.id
-                    and org_store.address_guid in {guids}
+                    and {guids_filter}
             group by
                 org_store.address_guid,
                 organization.name
             """
 
-        chunks = (stores_guids[pos:pos + 500] for pos in range(0, len(stores_guids), 500))
+        # big sets are resolved at once through a temp table
+        if len(stores_guids) > BULK_GUIDS_THRESHOLD:
+            chunks = (stores_guids,)
+        else:
+            chunks = (stores_guids[pos:pos + 500] for pos in range(0, len(stores_guids), 500))
 
         org_dict = {}
 
         for chunk in chunks:
-            stores_guids_str = "('" + "\', \'".join(chunk) + "')"
-
-            try:
-                query_result = execute_query(
-                    self.pg_session,
-                    query_text.format(guids=stores_guids_str),
-                )
-            except StopIteration:
-                pass
-            else:
-                for row in query_result:
-                    row_store_guid = str(row[0])
-                    row_org_name = row[1]
-                    org_dict[row_store_guid] = row_org_name
-                    # print(row_store_guid, row_org_name)
+            stores_guids_filter = get_guids_filter(self.pg_session, guids_column, chunk)
+
+            query_result = stream_query(
+                self.pg_session,
+                query_text.format(guids_filter=stores_guids_filter),
+            )
+            for row in query_result:
+                row_store_guid = str(row[0])
+                row_org_name = row[1]
+                org_dict[row_store_guid] = row_org_name
+                # print(row_store_guid, row_org_name)
 
         org_price_guids = org_dict.keys()
 
@@ -18,6 +18,7 @@ from utils.ecom_dataclasses import (
 from utils.ecom_ftp import (
     get_sbermm_prices,
     get_sbermm_stocks,
+    get_sbermm_stocks_changes,
     get_sbermm_stores,
 )
 
@@ -34,6 +35,15 @@ class StockSbermm(StockBase):
     hit_link: str = ''
 
 
+@dataclass
+class StockChangeSbermm(StockBase):
+    change: str = ''
+    old_quantity: int = 0
+    price: int = 0
+    old_price: int = 0
+    hit_link: str = ''
+
+
 @dataclass
 class StoreSbermm(StoreBase):
     hit_link: str = ''
@@ -64,6 +74,7 @@ class SbermmParser(All1CParser):
         )
         self.dt_price_mp = PriceSbermm
         self.dt_stock_mp = StockSbermm
+        self.dt_stock_change_mp = StockChangeSbermm
         self.dt_store_mp = StoreSbermm
 
         self.mp_settings = _mp_settings
@@ -79,20 +90,20 @@ class SbermmParser(All1CParser):
         campaign_id = self.org_data['sbermm_campaign_id']
 
         prices_count = 0
-        offers = get_sbermm_prices(campaign_id)
+        offers = get_sbermm_prices(campaign_id, set(self.product_identifiers))
 
+        # offers are already filtered by product while the feed is being read
         for offer in offers['offers']:
-            if not self.product_identifiers or offer.attrib['id'] in self.product_identifiers:
-                price = self.dt_price_mp(
-                    direction='  e->',
-                    datetime=offers['datetime'],
-                    org_name=self.passed_org_name,
-                    product_identifier=offer.attrib['id'],
-                    price=offer.find('price').text,
-                    hit_link=offers['hit_link'],
-                )
-                yield price
-                prices_count += 1
+            price = self.dt_price_mp(
+                direction='  e->',
+                datetime=offers['datetime'],
+                org_name=self.passed_org_name,
+                product_identifier=offer['id'],
+                price=offer['price'],
+                hit_link=offers['hit_link'],
+            )
+            yield price
+            prices_count += 1
 
         print(f'results: {prices_count}')
 
@@ -107,24 +118,55 @@ class SbermmParser(All1CParser):
         campaign_id = self.org_data['sbermm_campaign_id']
 
         stocks_count = 0
-        offers = get_sbermm_stocks(campaign_id)
+        offers = get_sbermm_stocks(campaign_id, set(self.product_identifiers))
 
+        # offers are already filtered by product while the feed is being read
         for offer in offers['offers']:
-            if not self.product_identifiers or offer['offerId'] in self.product_identifiers:
-                stock = self.dt_stock_mp(
-                    direction='  e->',
-                    datetime=offers['datetime'],
-                    org_name=self.passed_org_name,
-                    quantity=offer['quantity'],
-                    product_identifier=offer['offerId'],
-                    price=offer['price'],
-                    hit_link=offers['hit_link'],
-                )
-                yield stock
-                stocks_count += 1
+            stock = self.dt_stock_mp(
+                direction='  e->',
+                datetime=offers['datetime'],
+                org_name=self.passed_org_name,
+                quantity=offer['quantity'],
+                product_identifier=offer['offerId'],
+                price=offer['price'],
+                hit_link=offers['hit_link'],
+            )
+            yield stock
+            stocks_count += 1
 
         print(f'results: {stocks_count}')
 
+    def get_mp_stocks_changes(self) -> Generator[StockChangeSbermm, None, None]:
+        """Get offers changed in sbermegamarket stocks feed since its previous version.
+
+        Returns:
+            List of changes which are instances of corresponding dataclass.
+        """
+        print('\n' 'getting sbermm data...')
+
+        campaign_id = self.org_data['sbermm_campaign_id']
+
+        changes_count = 0
+        changes = get_sbermm_stocks_changes(campaign_id, set(self.product_identifiers))
+
+        for change in changes['changes']:
+            stock_change = self.dt_stock_change_mp(
+                direction='  e->',
+                datetime=changes['datetime'],
+                org_name=self.passed_org_name,
+                product_identifier=change['record_id'],
+                change=change['change'],
+                quantity=change['new_quantity'],
+                old_quantity=change['old_quantity'],
+                price=change['new_price'],
+                old_price=change['old_price'],
+                hit_link=changes['hit_link'],
+            )
+            yield stock_change
+            changes_count += 1
+
+        print(f'results: {changes_count}')
+
     def get_mp_stores(self) -> Generator[StoreSbermm, None, None]:
         """Get prices sent from ecom to sbermegamarket mp. Stores come from feed so only current day is available.
 
@@ -136,19 +178,19 @@ class SbermmParser(All1CParser):
         campaign_id = self.org_data['sbermm_campaign_id']
 
         results_count = 0
-        outlets = get_sbermm_stores(campaign_id)
+        outlets = get_sbermm_stores(campaign_id, set(self.store_identifiers))
 
+        # outlets are already filtered by store while the feed is being read
         for outlet in outlets['outlets']:
-            if not self.store_identifiers or outlet['identification']['id'] in self.store_identifiers:
-                store = self.dt_store_mp(
-                    direction='  e->',
-                    datetime=outlets['datetime'],
-                    org_name=self.passed_org_name,
-                    store_guid=outlet['identification']['id'],
-                    address=outlet['location']['address']['plain'][:50] + '...',
-                    hit_link=outlets['hit_link'],
-                )
-                yield store
-                results_count += 1
+            store = self.dt_store_mp(
+                direction='  e->',
+                datetime=outlets['datetime'],
+                org_name=self.passed_org_name,
+                store_guid=outlet['identification']['id'],
+                address=outlet['location']['address']['plain'][:50] + '...',
+                hit_link=outlets['hit_link'],
+            )
+            yield store
+            results_count += 1
 
         print(f'results: {results_count}')
@@ -1,7 +1,6 @@
 import json
 import os
 import sys
-import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Generator, Union
@@ -18,7 +17,13 @@ from utils.ecom_dataclasses import (
     StockBase,
 )
 from utils.ecom_elastic import get_stocks_yandexdbs_hits, get_stores_yandexdbs_hits
-from utils.ecom_ftp import get_filelist, get_ftp_connection
+from utils.ecom_ftp import (
+    download_feed,
+    get_filelist,
+    get_ftp_connection,
+    iter_indexed_records,
+    iter_xml_offers,
+)
 from utils.other import (
     convert_timezone,
     generate_elk_doc_link,
@@ -105,20 +110,17 @@ class YandexdbsParser(All1CParser):
         dt = f'{fn[5]} {fn[6]} {fn[7]}'
         print(f'{feed_filename}\t{dt} - {naturalsize(fn[4])}')
 
-        with open(feed_filename, 'wb') as feed_file:
-            ftp_conn.retrbinary(f'RETR {feed_filename}', feed_file.write)
-            print('downloaded')
-
-        mytree = ET.parse(feed_filename)
-        myroot = mytree.getroot()
-        prices: ET.Element = myroot.find('shop').find('offers')
-
-        print(f'prices in feed: {len(prices)}')
+        feed_path = download_feed(ftp_conn, feed_filename, 'feeds2yandex', fn)
 
         result = {
             'datetime': datetime.now(),
             'hit_link': f'https://ftp.puls.ru/feeds2yandex/feeds/{feed_filename}',
-            'prices': prices,
+            'prices': iter_indexed_records(
+                feed_path,
+                iter_xml_offers,
+                lambda offer: offer['id'],
+                set(self.product_identifiers),
+            ),
         }
 
         return result
@@ -137,18 +139,18 @@ class YandexdbsParser(All1CParser):
         hit_link = offers['hit_link']
         prices_raw = offers['prices']
 
+        # offers are already filtered by product while the feed is being read
         for price_raw in prices_raw:
-            if not self.product_identifiers or price_raw.attrib['id'] in self.product_identifiers:
-                price = self.dt_price_mp(
-                    direction='  e->',
-                    datetime=dt,
-                    org_name=self.passed_org_name,
-                    product_identifier='\"' + str(price_raw.attrib['id']) + '\"',
-                    price=price_raw.find('price').text,
-                    hit_link=hit_link,
-                )
-                yield price
-                prices_count += 1
+            price = self.dt_price_mp(
+                direction='  e->',
+                datetime=dt,
+                org_name=self.passed_org_name,
+                product_identifier='\"' + str(price_raw['id']) + '\"',
+                price=price_raw['price'],
+                hit_link=hit_link,
+            )
+            yield price
+            prices_count += 1
 
         print(f'results: {prices_count}')
 
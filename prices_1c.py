@@ -14,12 +14,12 @@ from dataclasses import fields
 
 from parsers.ecom_parsers import *
 from utils.ecom_argparse import get_args_stocks_prices
-from utils.other import write_down_csv
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
 
 
 if __name__ == '__main__':
-    args = get_args_stocks_prices()
+    args = get_args_stocks_prices(('products_file',))
 
     with (get_ssh_tunnel() as ssh_tunnel,
             get_postgres_session(ssh_tunnel) as pg_session):
@@ -32,6 +32,9 @@ if __name__ == '__main__':
             args.store,
             args.product,
         )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+
         prices = parser.get_1c_prices()
 
         fields_list = [field.name for field in fields(parser.dt_price_1c)]
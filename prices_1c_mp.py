@@ -9,20 +9,26 @@ The data is aggregating by functions from prices_1c.py and pricces_mp.py.
 Filtering by product is optional but there must be one of two filters -
 organization or store. Though store is needed just to find its organization.
 
+With -r flag only discrepancies are written down: mp prices that differ
+from applicable 1C prices or were pushed with a delay.
+
 Example of usage:
     ./prices_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345
+    ./prices_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -r
 """
 
+import sys
 from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
 from utils.ecom_argparse import get_args_stocks_prices
-from utils.other import write_down_csv
-from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+from utils.other import read_identifiers, write_down_csv
+from utils.ecom_postgres import get_postgres_session, get_price_settings, get_ssh_tunnel
+from utils.ecom_reconcile import PriceDiscrepancy, reconcile_prices
 
 
 if __name__ == '__main__':
-    args = get_args_stocks_prices()
+    args = get_args_stocks_prices(('products_file', 'reconcile'))
 
     with (get_ssh_tunnel() as ssh_tunnel,
             get_postgres_session(ssh_tunnel) as pg_session):
@@ -35,12 +41,22 @@ if __name__ == '__main__':
             args.store,
             args.product,
         )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+
         prices_1c = list(parser.get_1c_prices())
         if parser.mp_settings.stocks_instead_prices:
             prices_mp = list(parser.get_mp_stocks())
         else:
             prices_mp = list(parser.get_mp_prices())
 
+        if args.reconcile:
+            price_settings = get_price_settings(pg_session, args.marketplace, parser.passed_org_name)
+            discrepancies = reconcile_prices(prices_1c, prices_mp, price_settings, parser.product_aliases)
+            fields_list = [field.name for field in fields(PriceDiscrepancy)]
+            write_down_csv('prices_discrepancies.csv', fields_list, discrepancies)
+            sys.exit(0)
+
         fields_list = [field.name for field in fields(parser.dt_price_1c)]
         fields_list.pop()  # remove 'hit_link' to avoid duplicate
         fields_list += [
@@ -7,20 +7,27 @@ if Ecom sent it correctly to marketplace.
 Filtering by product is optional but there must be one of two filters -
 organization or store. Though store is needed just to find its organization.
 
+With -f flag the script keeps polling elastic for new prices after the period
+is read and writes them down as they come. Next run with -f continues from the last
+processed hit.
+
 Example of usage:
     ./prices_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345
+    ./prices_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -f
 """
 
+import sys
 from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
+from parsers.ecom_parsers.base_mp import PricesMPParser, StocksMPParser
 from utils.ecom_argparse import get_args_stocks_prices
-from utils.other import write_down_csv
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
 
 
 if __name__ == '__main__':
-    args = get_args_stocks_prices()
+    args = get_args_stocks_prices(('products_file', 'follow'))
 
     with (get_ssh_tunnel() as ssh_tunnel,
             get_postgres_session(ssh_tunnel) as pg_session):
@@ -33,6 +40,19 @@ if __name__ == '__main__':
             args.store,
             args.product,
         )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+
+        if args.follow:
+            if parser.mp_settings.stocks_instead_prices:
+                follow_supported = type(parser).get_mp_stocks is StocksMPParser.get_mp_stocks
+            else:
+                follow_supported = type(parser).get_mp_prices is PricesMPParser.get_mp_prices
+            if not follow_supported:
+                print(f'follow mode is not supported for {args.marketplace}.')
+                sys.exit(0)
+            parser.follow = True
+
         if parser.mp_settings.stocks_instead_prices:
             prices = parser.get_mp_stocks()
         else:
@@ -40,4 +60,7 @@ if __name__ == '__main__':
 
         fields_list = [field.name for field in fields(parser.dt_price_mp)]
 
-        write_down_csv('prices_data.csv', fields_list, prices)
+        try:
+            write_down_csv('prices_data.csv', fields_list, prices, flush=args.follow)
+        except KeyboardInterrupt:
+            print('\n' 'stopped following.')
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+"""Script keeps ssh tunnel to postgres open until it is interrupted.
+While it is running every other script reuses its tunnel instead of
+negotiating a new ssh connection.
+
+Example of usage:
+    ./ssh_tunnel.py &
+"""
+
+import time
+
+from utils.ecom_postgres import get_ssh_tunnel
+
+
+if __name__ == '__main__':
+    with get_ssh_tunnel(share=True) as ssh_tunnel:
+        print(f'ssh tunnel is listening on port {ssh_tunnel.local_bind_port}. press ctrl+c to close it.')
+
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
@@ -6,20 +6,28 @@ Whith that data user can check if Ecom got correct data.
 Filtering by product is optional but there must be one of two filters -
 organization or store. Though store is needed just to find its organization.
 
+With -l flag only the last stock received before the datetime is found for
+every product. Elastic is read backwards and only until all of them are found.
+
+With -c flag payloads equal to the previous one of the same endpoint are
+skipped, so only pushes which changed something are written down.
+
 Example of usage:
     ./stocks_1c.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345
+    ./stocks_1c.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345 -l
+    ./stocks_1c.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -c
 """
 
 from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
 from utils.ecom_argparse import get_args_stocks_prices
-from utils.other import write_down_csv
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
 
 
 if __name__ == '__main__':
-    args = get_args_stocks_prices()
+    args = get_args_stocks_prices(('products_file', 'latest', 'collapse_duplicates', 'cache_records'))
 
     with (get_ssh_tunnel() as ssh_tunnel,
             get_postgres_session(ssh_tunnel) as pg_session):
@@ -32,7 +40,15 @@ if __name__ == '__main__':
             args.store,
             args.product,
         )
-        stocks = parser.get_1c_stocks()
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+        parser.collapse_duplicates = args.collapse_duplicates
+        parser.cache_records = args.cache_records
+
+        if args.latest:
+            stocks = parser.get_1c_stocks_latest()
+        else:
+            stocks = parser.get_1c_stocks()
 
         fields_list = [field.name for field in fields(parser.dt_stock_1c)]
         write_down_csv('stocks_data.csv', fields_list, stocks)
@@ -9,20 +9,37 @@ The data is aggregating by functions from stocks_1c.py and stocks_mp.py.
 Filtering by product is optional but there must be one of two filters -
 organization or store. Though store is needed just to find its organization.
 
+With -r flag only discrepancies are written down: mp quantities that differ
+from 1C ones and 1C quantities that were never pushed to mp.
+
+With --changes-only flag repeated quantities are folded: one row per value of
+a product with the first and last datetime it was sent and number of repeats.
+
+With --cache-records flag stocks of all products of the period are parsed once
+and saved, next runs for the same datetime with other products are local.
+
 Example of usage:
     ./stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345
+    ./stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -r
+    ./stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб --changes-only
+    ./stocks_1c_mp.py -d 2022-11-26T12:00:00.000Z -m mailru -o спб -p 12345 --cache-records
 """
 
+import sys
 from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
 from utils.ecom_argparse import get_args_stocks_prices
-from utils.other import write_down_csv
+from utils.ecom_changes import StockChange, iter_stock_changes
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+from utils.ecom_reconcile import StockDiscrepancy, reconcile_stocks
 
 
 if __name__ == '__main__':
-    args = get_args_stocks_prices()
+    args = get_args_stocks_prices(
+        ('products_file', 'reconcile', 'collapse_duplicates', 'changes_only', 'cache_records'),
+    )
 
     with (get_ssh_tunnel() as ssh_tunnel,
             get_postgres_session(ssh_tunnel) as pg_session):
@@ -35,9 +52,29 @@ if __name__ == '__main__':
             args.store,
             args.product,
         )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+        parser.collapse_duplicates = args.collapse_duplicates
+        parser.cache_records = args.cache_records
+
         stocks_1c = list(parser.get_1c_stocks())
         stocks_mp = list(parser.get_mp_stocks())
 
+        if args.reconcile:
+            discrepancies = reconcile_stocks(stocks_1c, stocks_mp, parser.product_aliases)
+            fields_list = [field.name for field in fields(StockDiscrepancy)]
+            write_down_csv('stocks_discrepancies.csv', fields_list, discrepancies)
+            sys.exit(0)
+
+        if args.changes_only:
+            stocks_sorted = sorted(stocks_1c + stocks_mp, key=lambda p: p.datetime)
+            changes = sorted(iter_stock_changes(stocks_sorted), key=lambda c: c.first_datetime)
+            print(f'changes: {len(changes)} of {len(stocks_sorted)} stocks')
+
+            fields_list = [field.name for field in fields(StockChange)]
+            write_down_csv('stocks_changes.csv', fields_list, changes)
+            sys.exit(0)
+
         fields_list = [field.name for field in fields(parser.dt_stock_1c)]
         fields_list.pop()  # remove 'hit_link' to avoid duplicate
         fields_list += [
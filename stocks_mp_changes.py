@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""Script generates report about offers changed in a marketplace stocks feed
+since its previous version: added, removed, price or quantity changed offers.
+Only marketplaces integrated with feeds (atm sbermm) are supported.
+
+Previous feed version is known only if the script has been launched for it,
+so the first launch only remembers the current version.
+
+Example of usage:
+    ./stocks_mp_changes.py -d 2022-11-26T12:00:00.000Z -m sbermm -o спб -p 12345
+"""
+
+import sys
+from dataclasses import fields
+
+from parsers.ecom_parsers import marketplaces_map
+from utils.ecom_argparse import get_args_stocks_prices
+from utils.other import read_identifiers, write_down_csv
+from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
+
+
+if __name__ == '__main__':
+    args = get_args_stocks_prices(('products_file',))
+
+    if not hasattr(marketplaces_map[args.marketplace], 'get_mp_stocks_changes'):
+        print(f'{args.marketplace} does not use feeds for stocks.')
+        sys.exit(0)
+
+    with (get_ssh_tunnel() as ssh_tunnel,
+            get_postgres_session(ssh_tunnel) as pg_session):
+
+        parser = marketplaces_map[args.marketplace](
+            pg_session,
+            args.datetime,
+            args.marketplace,
+            args.organization,
+            args.store,
+            args.product,
+        )
+        if args.products_file:
+            parser.add_products(read_identifiers(args.products_file))
+
+        changes = parser.get_mp_stocks_changes()
+
+        fields_list = [field.name for field in fields(parser.dt_stock_change_mp)]
+        write_down_csv('stocks_changes_data.csv', fields_list, changes)
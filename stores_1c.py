@@ -13,7 +13,7 @@ from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
 from utils.ecom_argparse import get_args_stores
-from utils.other import write_down_csv
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
 
 
@@ -30,6 +30,9 @@ if __name__ == '__main__':
             args.organization,
             args.store,
         )
+        if args.stores_file:
+            parser.add_stores(read_identifiers(args.stores_file))
+
         stores = parser.get_1c_stores()
 
         fields_list = [field.name for field in fields(parser.dt_store_1c)]
@@ -17,7 +17,7 @@ from dataclasses import fields
 
 from parsers.ecom_parsers import marketplaces_map
 from utils.ecom_argparse import get_args_stores
-from utils.other import write_down_csv
+from utils.other import read_identifiers, write_down_csv
 from utils.ecom_postgres import get_postgres_session, get_ssh_tunnel
 
 
@@ -34,6 +34,9 @@ if __name__ == '__main__':
             args.organization,
             args.store,
         )
+        if args.stores_file:
+            parser.add_stores(read_identifiers(args.stores_file))
+
         stores_1c = list(parser.get_1c_stores())
         stores_mp = list(parser.get_mp_stores())
 
@@ -0,0 +1,5 @@
+import os
+
+# settings require credentials which are not used by tests
+for variable in ('FTP_HOST', 'OZON_LOGIN', 'OZON_PASSWORD', 'YANDEX_LOGIN', 'YANDEX_PASSWORD'):
+    os.environ.setdefault(variable, 'test')
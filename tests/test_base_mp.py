@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import pytest
+
+from parsers.ecom_parsers import base_mp
+from parsers.ecom_parsers.base_mp import BaseParser
+from utils.ecom_dataclasses import Stock1C
+
+
+def get_parser(product_aliases: dict) -> BaseParser:
+    # database is not needed for parsing, so init is skipped
+    parser = BaseParser.__new__(BaseParser)
+    parser.product_identifiers = set(product_aliases)
+    parser.product_aliases = product_aliases
+    return parser
+
+
+def stock_1c(hour: int, product_identifier: str, expiration_date: str) -> Stock1C:
+    return Stock1C(
+        direction='->e  ',
+        datetime=datetime(2022, 11, 26, hour),
+        product_identifier=product_identifier,
+        expiration_date=expiration_date,
+        hit_link=f'link-{hour}',
+    )
+
+
+def test_latest_records_keep_every_batch_of_the_hit():
+    parser = get_parser({'guid_1': 'guid_1', 'guid_2': 'guid_2'})
+    hit_pages = [
+        [
+            [stock_1c(12, 'guid_1', '2023-01-01'), stock_1c(12, 'guid_1', '2024-01-01')],
+            [stock_1c(11, 'guid_1', '2023-01-01'), stock_1c(11, 'guid_2', '2023-01-01')],
+        ],
+        [
+            [stock_1c(10, 'guid_2', '2025-01-01')],
+        ],
+    ]
+    read_pages = []
+
+    def iter_pages():
+        for page in hit_pages:
+            read_pages.append(page)
+            yield page
+
+    def parse_hits(hits):
+        return [record for hit in hits for record in hit]
+
+    records = list(parser._get_latest_records(iter_pages(), parse_hits))
+
+    assert records == [
+        stock_1c(12, 'guid_1', '2023-01-01'),
+        stock_1c(12, 'guid_1', '2024-01-01'),
+        stock_1c(11, 'guid_2', '2023-01-01'),
+    ]
+    # every product is found in the first page, so the next one is not requested
+    assert len(read_pages) == 1
+
+
+def test_hit_pages_are_one_page_or_followed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(base_mp, 'get_hits', lambda *args: calls.append(('get_hits', args)) or ['hit'])
+    monkeypatch.setattr(base_mp, 'follow_hits', lambda *args: calls.append(('follow_hits', args)) or iter([]))
+    parser = get_parser({'guid_2': 'guid_2', 'guid_1': 'guid_1'})
+    parser.marketplace = 'mailru'
+    parser.passed_org_name = 'org'
+
+    parser.follow = False
+    assert list(parser._get_hit_pages('begin', 'end', 'POST /stocks')) == [['hit']]
+
+    parser.follow = True
+    parser._get_hit_pages('begin', 'end', 'POST /stocks')
+
+    assert calls == [
+        ('get_hits', ('begin', 'end', 'POST /stocks', 'puls', '200')),
+        # the period end is ignored, the watermark is kept per marketplace, organization, products and endpoint
+        ('follow_hits', ('begin', 'POST /stocks', 'puls', '200', 'mailru|org|guid_1,guid_2|POST /stocks')),
+    ]
+
+
+def test_add_products_keeps_guid_and_code_of_every_product(monkeypatch):
+    products = {
+        'guid_1': {'guid': 'guid_1', 'code': '111'},
+        'guid_2': {'guid': 'guid_2', 'code': '222'},
+    }
+    monkeypatch.setattr(base_mp, 'get_products_data', lambda pg_session, identifiers: products)
+    parser = get_parser({})
+    parser.pg_session = None
+
+    parser.add_products(['guid_1', '111', '222'])
+
+    assert parser.product_identifiers == {'guid_1', '111', 'guid_2', '222'}
+    assert parser.product_aliases == {'guid_1': 'guid_1', '111': 'guid_1', 'guid_2': 'guid_2', '222': 'guid_2'}
+
+
+def test_add_products_exits_if_nothing_is_found(monkeypatch):
+    monkeypatch.setattr(base_mp, 'get_products_data', lambda pg_session, identifiers: {})
+    parser = get_parser({})
+    parser.pg_session = None
+
+    with pytest.raises(SystemExit) as exit_info:
+        parser.add_products(['unknown'])
+
+    assert exit_info.value.code == 1
+
+
+def test_add_stores_skips_stores_of_other_organizations(monkeypatch):
+    stores = {
+        'guid_1': {'guid': 'guid_1', 'id': 'МСК1', 'outlet': '', 'org_name': 'org'},
+        'guid_2': {'guid': 'guid_2', 'id': 'СПБ2', 'outlet': '22', 'org_name': 'other org'},
+    }
+    monkeypatch.setattr(base_mp, 'get_stores_data', lambda pg_session, identifiers: stores)
+    parser = get_parser({})
+    parser.pg_session = None
+    parser.passed_org_name = 'org'
+    parser.store_identifiers = set()
+
+    parser.add_stores(['guid_1', 'СПБ2'])
+
+    assert parser.store_identifiers == {'guid_1', 'МСК1'}
+
+    monkeypatch.setattr(base_mp, 'get_stores_data', lambda pg_session, identifiers: {'guid_2': stores['guid_2']})
+    parser.store_identifiers = set()
+    with pytest.raises(SystemExit) as exit_info:
+        parser.add_stores(['СПБ2'])
+
+    assert exit_info.value.code == 1
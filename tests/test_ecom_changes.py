@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from utils.ecom_changes import StockChange, iter_stock_changes
+from utils.ecom_dataclasses import Stock1C, StockStandard
+
+
+def stock_1c(hour, quantity, expiration_date=''):
+    return Stock1C(
+        direction='->e  ',
+        datetime=datetime(2022, 11, 26, hour),
+        quantity=quantity,
+        product_identifier='guid',
+        expiration_date=expiration_date,
+        hit_link=f'link-{hour}',
+    )
+
+
+def test_equal_quantities_are_folded_into_runs():
+    stocks = [stock_1c(1, 5), stock_1c(2, 5), stock_1c(3, 7), stock_1c(4, 5)]
+
+    assert list(iter_stock_changes(stocks)) == [
+        StockChange(
+            direction='->e  ',
+            first_datetime=datetime(2022, 11, 26, 1),
+            last_datetime=datetime(2022, 11, 26, 2),
+            product_identifier='guid',
+            quantity=5,
+            repeats=2,
+            hit_link='link-1',
+        ),
+        StockChange(
+            direction='->e  ',
+            first_datetime=datetime(2022, 11, 26, 3),
+            last_datetime=datetime(2022, 11, 26, 3),
+            product_identifier='guid',
+            quantity=7,
+            hit_link='link-3',
+        ),
+        StockChange(
+            direction='->e  ',
+            first_datetime=datetime(2022, 11, 26, 4),
+            last_datetime=datetime(2022, 11, 26, 4),
+            product_identifier='guid',
+            quantity=5,
+            hit_link='link-4',
+        ),
+    ]
+
+
+def test_runs_are_kept_per_key():
+    stock_mp = StockStandard(
+        direction='e->  ',
+        datetime=datetime(2022, 11, 26, 2),
+        quantity=5,
+        product_identifier='guid',
+        price_guid='price',
+    )
+    stocks = [stock_1c(1, 5, '2023-01-01'), stock_1c(2, 5, '2024-01-01'), stock_mp, stock_1c(3, 5, '2023-01-01')]
+
+    changes = list(iter_stock_changes(stocks))
+
+    assert [(change.direction, change.expiration_date, change.repeats) for change in changes] == [
+        ('->e  ', '2023-01-01', 2),
+        ('->e  ', '2024-01-01', 1),
+        ('e->  ', '', 1),
+    ]
+    assert changes[2].price_guid == 'price'
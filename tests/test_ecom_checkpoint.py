@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from utils import ecom_checkpoint
+from utils.ecom_checkpoint import iter_checkpointed, split_period
+
+
+def test_split_period_evenly():
+    assert split_period('2022-11-26T00:00:00.000Z', '2022-11-26T12:00:00.000Z', 6) == [
+        ('2022-11-26T00:00:00.000Z', '2022-11-26T05:59:59.999Z'),
+        ('2022-11-26T06:00:00.000Z', '2022-11-26T12:00:00.000Z'),
+    ]
+
+
+def test_split_period_with_remainder():
+    assert split_period('2022-11-26T00:00:00.000Z', '2022-11-26T08:30:00.000Z', 6) == [
+        ('2022-11-26T00:00:00.000Z', '2022-11-26T05:59:59.999Z'),
+        ('2022-11-26T06:00:00.000Z', '2022-11-26T08:30:00.000Z'),
+    ]
+
+
+def test_split_period_of_one_moment():
+    assert split_period('2022-11-26T00:00:00.000Z', '2022-11-26T00:00:00.000Z', 6) == [
+        ('2022-11-26T00:00:00.000Z', '2022-11-26T00:00:00.000Z'),
+    ]
+
+
+def test_iter_checkpointed_resumes_from_missing_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(ecom_checkpoint, 'CHECKPOINTS_DIR', str(tmp_path))
+    extracted = []
+
+    def extract_segment(segment_begin, segment_end):
+        extracted.append(segment_begin)
+        if segment_begin == '2022-11-26T06:00:00.000Z' and len(extracted) == 2:
+            raise TimeoutError
+        return [segment_begin]
+
+    args = ('job', '2022-11-26T00:00:00.000Z', '2022-11-26T18:00:00.000Z', extract_segment, 6)
+
+    with pytest.raises(TimeoutError):
+        list(iter_checkpointed(*args))
+
+    records = list(iter_checkpointed(*args))
+
+    assert records == ['2022-11-26T00:00:00.000Z', '2022-11-26T06:00:00.000Z', '2022-11-26T12:00:00.000Z']
+    # the first segment is loaded from checkpoint, not extracted again
+    assert extracted == [
+        '2022-11-26T00:00:00.000Z',
+        '2022-11-26T06:00:00.000Z',
+        '2022-11-26T06:00:00.000Z',
+        '2022-11-26T12:00:00.000Z',
+    ]
+    # checkpoints are removed when the whole period is extracted
+    assert os.listdir(tmp_path) == []
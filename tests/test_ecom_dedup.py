@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from utils.ecom_dataclasses import Stock1C
+from utils.ecom_dedup import PayloadCache
+
+
+def parse_counted(parsed, hit_datetime, hit_link):
+    def parse():
+        parsed.append(hit_link)
+        return [Stock1C(direction='->e  ', datetime=hit_datetime, quantity=5, hit_link=hit_link)]
+    return parse
+
+
+def get_records(cache, parsed, payload, hour, collapse=False, labels='stocks'):
+    hit_datetime = datetime(2022, 11, 26, hour)
+    hit_link = f'link-{hour}'
+    return cache.get_records(
+        labels, payload, parse_counted(parsed, hit_datetime, hit_link), hit_datetime, hit_link, collapse,
+    )
+
+
+def test_repeated_payload_is_parsed_once():
+    cache = PayloadCache()
+    parsed = []
+
+    get_records(cache, parsed, '{"q": 5}', 1)
+    records = get_records(cache, parsed, '{"q": 5}', 2)
+
+    assert parsed == ['link-1']
+    assert cache.duplicates == 1
+    # copied records get datetime and link of their own hit
+    assert records == [
+        Stock1C(direction='->e  ', datetime=datetime(2022, 11, 26, 2), quantity=5, hit_link='link-2'),
+    ]
+
+
+def test_payloads_with_other_labels_are_parsed():
+    cache = PayloadCache()
+    parsed = []
+
+    get_records(cache, parsed, '{"q": 5}', 1, labels='stocks')
+    get_records(cache, parsed, '{"q": 5}', 2, labels='prices')
+
+    assert parsed == ['link-1', 'link-2']
+
+
+def test_least_recently_used_payloads_are_dropped():
+    cache = PayloadCache(size=2)
+    parsed = []
+
+    get_records(cache, parsed, 'a', 1)
+    get_records(cache, parsed, 'b', 2)
+    get_records(cache, parsed, 'a', 3)
+    get_records(cache, parsed, 'c', 4)
+    get_records(cache, parsed, 'b', 5)
+
+    assert parsed == ['link-1', 'link-2', 'link-4', 'link-5']
+
+
+def test_collapse_skips_only_consecutive_duplicates():
+    cache = PayloadCache()
+    parsed = []
+
+    assert get_records(cache, parsed, 'a', 1, collapse=True) is not None
+    assert get_records(cache, parsed, 'a', 2, collapse=True) is None
+    assert get_records(cache, parsed, 'b', 3, collapse=True) is not None
+    assert get_records(cache, parsed, 'a', 4, collapse=True) is not None
+
+    assert cache.collapsed == 1
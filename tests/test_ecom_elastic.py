@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import ecom_elastic
+from utils.ecom_elastic import follow_hits
+
+
+class StopFollowing(Exception):
+    pass
+
+
+def hit(number: int) -> SimpleNamespace:
+    return SimpleNamespace(number=number, meta=SimpleNamespace(sort=[number, f'id-{number}']))
+
+
+@pytest.fixture
+def elastic(tmp_path, monkeypatch):
+    """Fake elastic with 5 hits returned by pages of 2 after search_after of the query."""
+    monkeypatch.setattr(ecom_elastic, 'PAGE_SIZE', 2)
+    monkeypatch.setattr(ecom_elastic, 'WATERMARKS_DIR', str(tmp_path))
+    hits = [hit(number) for number in range(5)]
+    requests = []
+
+    def execute_dsl_query(dsl_query):
+        search_after = dsl_query.to_dict().get('search_after')
+        requests.append(search_after)
+        start = search_after[0] + 1 if search_after else 0
+        return hits[start:start + 2]
+
+    def sleep(seconds):
+        raise StopFollowing
+
+    monkeypatch.setattr(ecom_elastic, '_execute_dsl_query', execute_dsl_query)
+    monkeypatch.setattr(ecom_elastic.time, 'sleep', sleep)
+
+    return requests
+
+
+def read_pages(pages) -> list[list[int]]:
+    numbers = []
+    with pytest.raises(StopFollowing):
+        for page in pages:
+            numbers.append([hit.number for hit in page])
+
+    return numbers
+
+
+def test_follow_hits_pages_until_page_is_not_full(elastic):
+    pages = read_pages(follow_hits('2022-11-26T00:00:00.000Z', 'POST /stocks', watermark_name='stocks'))
+
+    assert pages == [[0, 1], [2, 3], [4]]
+    # it waits for new hits only after the last page is not full
+    assert elastic == [None, [1, 'id-1'], [3, 'id-3']]
+
+
+def test_follow_hits_continues_from_watermark(elastic):
+    follow = follow_hits('2022-11-26T00:00:00.000Z', 'POST /stocks', watermark_name='stocks')
+    assert [hit.number for hit in next(follow)] == [0, 1]
+    assert [hit.number for hit in next(follow)] == [2, 3]
+    follow.close()
+
+    # a page is processed when the next one is requested, so only the first page is not read again
+    pages = read_pages(follow_hits('2022-11-26T00:00:00.000Z', 'POST /stocks', watermark_name='stocks'))
+
+    assert pages == [[2, 3], [4]]
+    assert elastic[2] == [1, 'id-1']
@@ -0,0 +1,197 @@
+import ftplib
+import json
+import os
+import threading
+from zipfile import ZipFile
+
+import pytest
+
+from utils import ecom_ftp
+
+
+@pytest.fixture
+def ftp_conn(tmp_path, monkeypatch):
+    """Connection to a local ftp server serving tmp_path/ftp."""
+    pyftpdlib_servers = pytest.importorskip('pyftpdlib.servers')
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+
+    ftp_root = tmp_path / 'ftp'
+    ftp_root.mkdir()
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user('user', 'password', str(ftp_root), perm='elr')
+    handler = type('Handler', (FTPHandler,), {'authorizer': authorizer})
+    server = pyftpdlib_servers.ThreadedFTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'handle_exit': False}, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(ftplib.FTP, 'port', server.address[1])
+    ftp_conn = ecom_ftp.PooledFTP('127.0.0.1', 'user', 'password')
+
+    yield ftp_conn
+
+    ftp_conn.close()
+    server.close_all()
+
+
+def test_download_ranged(ftp_conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(ecom_ftp, 'FTP_DOWNLOAD_CONNECTIONS', 4)
+    content = os.urandom(1_000_003)
+    (tmp_path / 'ftp' / 'feed.xml').write_bytes(content)
+    local_path = tmp_path / 'feed.xml'
+
+    assert ecom_ftp.download_ranged(ftp_conn, 'feed.xml', str(local_path), len(content))
+    assert local_path.read_bytes() == content
+    # the main connection is still usable
+    assert ftp_conn.pwd() == '/'
+
+
+def save_snapshot(tmp_path, version: str, quantities: dict, mtime: float) -> str:
+    snapshot_path = ecom_ftp.save_feed_snapshot(
+        str(tmp_path / f'{version}_feed.xml'),
+        'feed',
+        quantities.items(),
+        lambda record: record[0],
+        lambda record: 100,
+        lambda record: record[1],
+    )
+    os.utime(snapshot_path, (mtime, mtime))
+
+    return snapshot_path
+
+
+def test_previous_snapshot_of_list_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(ecom_ftp, 'FEED_SNAPSHOTS_DIR', str(tmp_path / 'snapshots'))
+
+    # versions from LIST output, 'Nov' > 'Dec' by name
+    old_path = save_snapshot(tmp_path, 'Nov301200_100', {'a': 1, 'b': 2}, 1000)
+    new_path = save_snapshot(tmp_path, 'Dec011200_100', {'a': 1, 'b': 3, 'c': 4}, 2000)
+
+    assert ecom_ftp.get_previous_snapshot(old_path) is None
+    assert ecom_ftp.get_previous_snapshot(new_path) == old_path
+
+    changes = {change['record_id']: change['change'] for change in ecom_ftp.iter_feed_changes(old_path, new_path)}
+    assert changes == {'b': 'quantity', 'c': 'added'}
+
+
+def write_sbermm_feed(tmp_path, name: str, content: dict) -> str:
+    """Zip json feed the way sbermm feeds are named: '<version>_<campaign>_<kind>.zip'."""
+    zip_path = tmp_path / f'Nov301200_100_{name}.zip'
+    with ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr(f'{name}.json', json.dumps(content))
+
+    return str(zip_path)
+
+
+STOCKS_FEED = {
+    'outlets': [
+        {
+            'identification': {'id': 'store-1'},
+            'offers': [
+                {'offerId': 'a', 'price': 99.90, 'quantity': 1},
+                {'offerId': 'b', 'price': 100, 'quantity': 0},
+                {'offerId': 'c', 'price': 12.5, 'quantity': 3},
+            ],
+        },
+        # all outlets have the same offers
+        {
+            'identification': {'id': 'store-2'},
+            'offers': [{'offerId': 'a', 'price': 99.90, 'quantity': 1}],
+        },
+    ],
+}
+
+
+def get_offer_id(offer: dict) -> str:
+    return offer['offerId']
+
+
+def test_indexed_records_are_the_same_as_parsed_ones(tmp_path):
+    feed_path = write_sbermm_feed(tmp_path, '123_stocks_full', STOCKS_FEED)
+
+    parsed = list(ecom_ftp.iter_indexed_records(feed_path, ecom_ftp._iter_sbermm_offers, get_offer_id))
+    indexed = list(ecom_ftp.iter_indexed_records(feed_path, ecom_ftp._iter_sbermm_offers, get_offer_id, ['a', 'c']))
+    # the second request reads the index built by the first one
+    indexed_again = list(ecom_ftp.iter_indexed_records(feed_path, ecom_ftp._iter_sbermm_offers, get_offer_id, ['c']))
+
+    assert sorted(indexed, key=get_offer_id) == [parsed[0], parsed[2]]
+    assert indexed_again == [parsed[2]]
+    assert [type(offer['price']) for offer in indexed] == [type(offer['price']) for offer in (parsed[0], parsed[2])]
+
+
+XML_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<yml_catalog date="2022-11-30 12:00">
+  <shop>
+    <name>shop</name>
+    <offers>
+      <offer id="a" available="true"><price>99.90</price><outlets><outlet id="1" instock="2"/></outlets></offer>
+      <offer id="b" available="false"><price>100</price></offer>
+      <offer id="c" available="true"><price>12.5</price></offer>
+    </offers>
+  </shop>
+</yml_catalog>
+"""
+
+
+def test_iter_xml_offers(tmp_path, monkeypatch):
+    feed_path = tmp_path / 'feed.xml'
+    feed_path.write_text(XML_FEED, encoding='utf-8')
+
+    # keep <offers> to check that processed offers are dropped from it
+    offers_elements = []
+    iterparse = ecom_ftp.ET.iterparse
+
+    def iterparse_spy(*args, **kwargs):
+        for event, element in iterparse(*args, **kwargs):
+            if element.tag == 'offers':
+                offers_elements.append(element)
+            yield event, element
+
+    monkeypatch.setattr(ecom_ftp.ET, 'iterparse', iterparse_spy)
+
+    offers = list(ecom_ftp.iter_xml_offers(str(feed_path)))
+
+    assert offers == [
+        {'id': 'a', 'available': 'true', 'price': '99.90'},
+        {'id': 'b', 'available': 'false', 'price': '100'},
+        {'id': 'c', 'available': 'true', 'price': '12.5'},
+    ]
+    assert len(offers_elements[0]) == 0
+
+    assert [offer['id'] for offer in ecom_ftp.iter_xml_offers(str(feed_path), {'c', 'd'})] == ['c']
+
+
+def test_iter_sbermm_outlets(tmp_path):
+    feed_path = write_sbermm_feed(tmp_path, '123_outlets', {
+        'outlets': [
+            {'identification': {'id': 'store-1'}, 'address': 'Moscow'},
+            {'identification': {'id': 'store-2'}, 'address': 'Tula'},
+        ],
+    })
+
+    outlets = list(ecom_ftp._iter_sbermm_outlets(feed_path))
+    assert [outlet['address'] for outlet in outlets] == ['Moscow', 'Tula']
+
+    outlets = list(ecom_ftp._iter_sbermm_outlets(feed_path, {'store-2'}))
+    assert [outlet['identification']['id'] for outlet in outlets] == ['store-2']
+
+
+def test_iter_sbermm_offers_of_the_first_outlet(tmp_path, capsys):
+    feed_path = write_sbermm_feed(tmp_path, '123_stocks_full', STOCKS_FEED)
+
+    offers = list(ecom_ftp._iter_sbermm_offers(feed_path))
+
+    # offers of the second outlet are not parsed
+    assert [(offer['offerId'], offer['quantity']) for offer in offers] == [('a', 1), ('b', 0), ('c', 3)]
+    assert 'stocks in feed: 3' in capsys.readouterr().out
+
+    assert [offer['offerId'] for offer in ecom_ftp._iter_sbermm_offers(feed_path, {'b'})] == ['b']
+
+
+def test_zipped_json_with_other_name_is_read(tmp_path):
+    zip_path = tmp_path / 'Nov301200_100_123_outlets.zip'
+    with ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr('outlets.json', json.dumps({'outlets': [{'identification': {'id': 'store-1'}}]}))
+
+    assert len(list(ecom_ftp._iter_sbermm_outlets(str(zip_path)))) == 1
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from utils import ecom_metrics
+from utils.ecom_metrics import get_stages, measure
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    monkeypatch.setattr(ecom_metrics, 'METRICS_MODE', 'summary')
+    monkeypatch.setattr(ecom_metrics, '_stages', {})
+
+
+class BaseFakeParser:
+
+    def get_stocks(self, rows: int) -> None:
+        with measure('elastic') as record:
+            record.rows = rows
+
+
+class FakeParser(BaseFakeParser):
+    pass
+
+
+def query_postgres() -> None:
+    with measure('postgres') as record:
+        record.rows = 1
+
+
+def test_records_are_counted_by_source_and_caller(stages):
+    parser = FakeParser()
+    parser.get_stocks(10)
+    parser.get_stocks(5)
+    query_postgres()
+
+    stages = get_stages()
+
+    # the class where the method is defined is the label, not the class of the object
+    assert stages[('elastic', 'BaseFakeParser.get_stocks')]['queries'] == 2
+    assert stages[('elastic', 'BaseFakeParser.get_stocks')]['rows'] == 15
+    [postgres_stage] = [stage for (source, caller), stage in stages.items() if source == 'postgres']
+    assert postgres_stage['queries'] == 1
+    assert {caller for _, caller in stages} == {'BaseFakeParser.get_stocks', f'{__name__}.query_postgres'}
+
+
+def test_nothing_is_counted_when_metrics_are_off(stages, monkeypatch):
+    monkeypatch.setattr(ecom_metrics, 'METRICS_MODE', '')
+    monkeypatch.setattr(ecom_metrics, 'get_caller', lambda: pytest.fail('caller is looked for'))
+
+    FakeParser().get_stocks(10)
+
+    assert get_stages() == {}
+
+
+def test_jsonl_records_have_caller_label(stages, monkeypatch, tmp_path):
+    metrics_path = tmp_path / 'metrics.jsonl'
+    monkeypatch.setattr(ecom_metrics, 'METRICS_MODE', 'jsonl')
+    monkeypatch.setattr(ecom_metrics, 'METRICS_FILE', str(metrics_path))
+
+    FakeParser().get_stocks(3)
+    query_postgres()
+
+    records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+    assert [(r['source'], r['caller'], r['rows']) for r in records] == [
+        ('elastic', 'BaseFakeParser.get_stocks', 3),
+        ('postgres', f'{__name__}.query_postgres', 1),
+    ]
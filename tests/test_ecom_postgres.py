@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from utils import ecom_postgres
+from utils.ecom_postgres import get_guids_filter, get_products_data
+
+GUID = '85A2EF11-D2A9-48BF-AD7E-4309F05C9EC4'
+
+
+class FakeCursor:
+
+    def __init__(self, copied: list) -> None:
+        self.copied = copied
+
+    def copy_expert(self, sql: str, file) -> None:
+        self.copied.extend(file.read().split('\n'))
+
+    def close(self) -> None:
+        pass
+
+
+class FakeSession:
+    """Records sql statements instead of running them."""
+
+    def __init__(self) -> None:
+        self.statements = []
+        self.copied = []
+
+    def execute(self, statement) -> None:
+        self.statements.append(str(statement))
+
+    def connection(self) -> SimpleNamespace:
+        # raw psycopg2 connection of sqlalchemy connection
+        raw_connection = SimpleNamespace(cursor=lambda: FakeCursor(self.copied))
+        return SimpleNamespace(connection=raw_connection)
+
+
+def test_small_set_is_rendered_as_literals(monkeypatch):
+    monkeypatch.setattr(ecom_postgres, 'BULK_GUIDS_THRESHOLD', 2)
+    session = FakeSession()
+
+    guids_filter = get_guids_filter(session, 'mp_store.marketplace_guid', [GUID, 'МСК000246759'])
+
+    assert guids_filter == f"mp_store.marketplace_guid IN ('{GUID}', 'МСК000246759')"
+    assert session.statements == []
+
+
+def test_big_set_is_compared_as_text(monkeypatch):
+    monkeypatch.setattr(ecom_postgres, 'BULK_GUIDS_THRESHOLD', 2)
+    session = FakeSession()
+
+    guids_filter = get_guids_filter(session, 'mp_store.marketplace_guid', [GUID, 'a', 'b'], 'tmp_store_guids')
+
+    assert guids_filter == 'mp_store.marketplace_guid::text IN (SELECT guid FROM tmp_store_guids)'
+    assert 'CREATE TEMP TABLE tmp_store_guids (guid text PRIMARY KEY)' in session.statements
+    # uuid columns are casted to lowercase text
+    assert sorted(session.copied) == sorted([GUID, GUID.lower(), 'a', 'b'])
+
+
+def test_text_column_is_not_casted_twice(monkeypatch):
+    monkeypatch.setattr(ecom_postgres, 'BULK_GUIDS_THRESHOLD', 0)
+
+    guids_filter = get_guids_filter(FakeSession(), 'org_price.code::text', ['1'])
+
+    assert guids_filter == 'org_price.code::text IN (SELECT guid FROM tmp_guids)'
+
+
+def test_products_are_resolved_once_by_guid_or_code(monkeypatch):
+    queries = []
+
+    def stream_query(pg_session, query_text):
+        queries.append(query_text)
+        return [(GUID.lower(), 12345)]
+
+    monkeypatch.setattr(ecom_postgres, 'stream_query', stream_query)
+
+    # the same product by guid in both cases and by code twice, plus unknown code
+    products = get_products_data(FakeSession(), [GUID, GUID.lower(), '12345', '12345', '999'])
+
+    assert products == {GUID.lower(): {'guid': GUID.lower(), 'code': '12345'}}
+    assert len(queries) == 1
+    assert f"org_price.guid IN ('{GUID.lower()}')" in queries[0]
+    assert "org_price.code::text IN ('12345', '999')" in queries[0]
@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta
+
+from utils.ecom_dataclasses import Price1C, PriceStandard, Stock1C, StockStandard
+from utils.ecom_reconcile import (
+    LatencyAnalyzer,
+    _Columns,
+    _get_mp_price,
+    _reconcile_prices_key,
+    reconcile_prices,
+    reconcile_stocks,
+)
+
+BEGIN = datetime(2022, 11, 26, 12)
+
+
+def stock_1c(minute: int, quantity: float, expiration_date: str = '2024-01-01') -> Stock1C:
+    return Stock1C(
+        direction='->e  ',
+        datetime=BEGIN + timedelta(minutes=minute),
+        org_name='org',
+        quantity=quantity,
+        product_identifier='guid',
+        expiration_date=expiration_date,
+    )
+
+
+def stock_mp(minute: int, quantity: int, expiration_date: str = '2024-01-01') -> StockStandard:
+    return StockStandard(
+        direction='  e->',
+        datetime=BEGIN + timedelta(minutes=minute, seconds=10),
+        org_name='org',
+        quantity=quantity,
+        product_identifier='code',
+        expiration_date=expiration_date,
+    )
+
+
+def test_equal_stocks_have_no_discrepancies():
+    stocks_1c = [stock_1c(0, 5), stock_1c(10, 3)]
+    stocks_mp = [stock_mp(0, 5), stock_mp(10, 3)]
+
+    assert list(reconcile_stocks(stocks_1c, stocks_mp, {'code': 'guid'})) == []
+
+
+def test_two_batches_of_product_are_not_merged():
+    stocks_1c = []
+    stocks_mp = []
+    for minute in (0, 10, 20):
+        stocks_1c += [stock_1c(minute, 5, '2024-01-01'), stock_1c(minute, 7, '2025-01-01')]
+        stocks_mp += [stock_mp(minute, 5, '2024-01-01'), stock_mp(minute, 7, '2025-01-01')]
+
+    assert list(reconcile_stocks(stocks_1c, stocks_mp, {'code': 'guid'})) == []
+
+
+def test_kinds_of_discrepancies():
+    stocks_1c = [stock_1c(0, 5), stock_1c(10, 3), stock_1c(20, 8), stock_1c(30, 1)]
+    stocks_mp = [stock_mp(0, 5), stock_mp(10, 5), stock_mp(20, 9), stock_mp(40, 1)]
+
+    discrepancies = list(reconcile_stocks(stocks_1c, stocks_mp, {'code': 'guid'}))
+
+    assert [(d.kind, d.quantity_1c, d.quantity_mp) for d in discrepancies] == [
+        ('stale', 3, 5),
+        ('quantity mismatch', 8, 9),
+        ('not pushed', 3, None),
+        ('not pushed', 8, None),
+    ]
+    assert {d.expiration_date for d in discrepancies} == {'2024-01-01'}
+
+
+def test_regions_are_reconciled_separately():
+    stocks_1c = [stock_1c(0, 5), stock_1c(10, 3)]
+    stocks_mp = []
+    for region, quantities in (('77', (5, 3)), ('50', (5, 5))):
+        for minute, quantity in zip((0, 10), quantities):
+            stock = stock_mp(minute, quantity)
+            stock.region = region
+            stocks_mp.append(stock)
+
+    discrepancies = list(reconcile_stocks(stocks_1c, stocks_mp, {'code': 'guid'}))
+
+    assert [(d.kind, d.region, d.quantity_1c, d.quantity_mp) for d in discrepancies] == [
+        ('stale', '50', 3, 5),
+        ('not pushed', '50', 3, None),
+    ]
+
+
+def test_latency_of_two_batches_is_measured_per_batch():
+    analyzer = LatencyAnalyzer('mp', 'stocks', {'code': 'guid'})
+    records = [
+        stock_1c(0, 5, '2024-01-01'),
+        stock_1c(0, 7, '2025-01-01'),
+        stock_mp(1, 5, '2024-01-01'),
+        stock_mp(2, 7, '2025-01-01'),
+        stock_1c(10, 5, '2024-01-01'),
+        stock_1c(10, 7, '2025-01-01'),
+    ]
+    analyzer.add_batch(sorted(records, key=lambda r: r.datetime))
+
+    stats = {s.expiration_date: s for s in analyzer.get_stats()}
+    assert (stats['2024-01-01'].pushed, stats['2024-01-01'].max_seconds) == (1, 70)
+    assert (stats['2025-01-01'].pushed, stats['2025-01-01'].max_seconds) == (1, 130)
+    assert stats['2024-01-01'].not_pushed == stats['2025-01-01'].not_pushed == 0
+
+
+def price_1c(minute: int, price: int, promo: int = 0, b2c_used: bool = False) -> Price1C:
+    return Price1C(
+        direction='->e  ',
+        datetime=BEGIN + timedelta(minutes=minute),
+        org_name='org',
+        product_identifier='guid',
+        price_guid='price',
+        b2c_used=b2c_used,
+        price_inc_vat=price,
+        price_promo=promo,
+    )
+
+
+def price_mp(seconds: int, price: int) -> PriceStandard:
+    return PriceStandard(
+        direction='  e->',
+        datetime=BEGIN + timedelta(seconds=seconds),
+        org_name='org',
+        product_identifier='code',
+        price=price,
+        price_guid='price',
+    )
+
+
+def get_price_kinds(prices_1c, prices_mp, price_settings=None) -> list[tuple]:
+    discrepancies = reconcile_prices(prices_1c, prices_mp, price_settings, {'code': 'guid'})
+    return [(d.kind, d.price_mp) for d in discrepancies]
+
+
+def test_only_applicable_source_of_1c_prices_is_used():
+    prices_1c = [price_1c(0, 100, b2c_used=True), price_1c(0, 90, b2c_used=False)]
+    prices_mp = [price_mp(10, 100), price_mp(20, 90)]
+
+    assert get_price_kinds(prices_1c, prices_mp, {'price': True}) == [('price mismatch', 90)]
+    assert get_price_kinds(prices_1c, prices_mp, {'price': False}) == [('price mismatch', 100)]
+
+
+def test_promo_and_zero_prices_are_valid_values():
+    assert get_price_kinds([price_1c(0, 100, promo=80)], [price_mp(10, 80), price_mp(20, 100)]) == []
+    assert get_price_kinds([price_1c(0, 0)], [price_mp(10, 0)]) == []
+
+
+def test_stale_delayed_and_missing_prices():
+    prices_1c = [price_1c(1, 100), price_1c(10, 120), price_1c(20, 130)]
+    prices_mp = [
+        price_mp(0, 100),
+        price_mp(61, 100),
+        price_mp(10 * 60 + 1, 100),
+        price_mp(20 * 60 + 700, 130),
+    ]
+
+    discrepancies = list(reconcile_prices(prices_1c, prices_mp, {}, {'code': 'guid'}))
+
+    assert [(d.kind, d.price_mp, d.delay_seconds) for d in discrepancies] == [
+        ('no 1c price', 100, None),
+        ('stale', 100, None),
+        ('delayed', 130, 700),
+    ]
+
+
+def test_mp_prices_without_1c_prices_are_missing():
+    columns_mp = _Columns([price_mp(0, 100), price_mp(10, 110)], _get_mp_price)
+
+    discrepancies = list(_reconcile_prices_key(None, columns_mp))
+
+    assert [(d.kind, d.price_mp) for d in discrepancies] == [('no 1c price', 100), ('no 1c price', 110)]
+
+
+def test_price_latency_is_measured_per_price_guid():
+    analyzer = LatencyAnalyzer('mp', 'prices', {'code': 'guid'})
+    other_price_1c = price_1c(0, 90)
+    other_price_1c.price_guid = 'other price'
+    other_price_mp = price_mp(30, 90)
+    other_price_mp.price_guid = 'other price'
+
+    # the first price type gets 90 too but it is not its 1C value
+    analyzer.add_batch([price_1c(0, 100), other_price_1c, price_mp(10, 90), other_price_mp, price_mp(60, 100)])
+
+    stats = {s.price_guid: s for s in analyzer.get_stats()}
+    assert (stats['price'].pushed, stats['price'].max_seconds) == (1, 60)
+    assert (stats['other price'].pushed, stats['other price'].max_seconds) == (1, 30)
@@ -0,0 +1,70 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from utils import ecom_records_cache
+from utils.ecom_dataclasses import Stock1C
+from utils.ecom_records_cache import get_cached_records
+
+BEGIN_DT = '2022-11-26T00:00:00.000Z'
+END_DT = '2022-11-26T06:00:00.000Z'
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ecom_records_cache, 'RECORDS_CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def stock(product_identifier, quantity):
+    return Stock1C(
+        direction='->e  ',
+        datetime=datetime(2022, 11, 26, 1),
+        quantity=quantity,
+        product_identifier=product_identifier,
+    )
+
+
+def test_window_is_parsed_once(cache_dir):
+    parsed = []
+
+    def parse_records():
+        parsed.append(1)
+        return [stock('a', 1), stock('b', 2), stock('a', 3)]
+
+    args = ('stocks', BEGIN_DT, END_DT, Stock1C, parse_records, 'product_identifier')
+
+    assert get_cached_records(*args, {'a'}) == [stock('a', 1), stock('a', 3)]
+    assert get_cached_records(*args, {'b'}) == [stock('b', 2)]
+    assert get_cached_records(*args, ()) == [stock('a', 1), stock('b', 2), stock('a', 3)]
+    assert len(parsed) == 1
+
+
+def test_expired_windows_are_removed(cache_dir):
+    expired_path = cache_dir / 'expired.pickle'
+    expired_path.write_bytes(b'0')
+    expired_at = time.time() - (ecom_records_cache.RECORDS_CACHE_MAX_AGE_DAYS + 1) * 24 * 60 * 60
+    os.utime(expired_path, (expired_at, expired_at))
+    fresh_path = cache_dir / 'fresh.pickle'
+    fresh_path.write_bytes(b'0')
+
+    get_cached_records('stocks', BEGIN_DT, END_DT, Stock1C, lambda: [stock('a', 1)], 'product_identifier', ())
+
+    assert not expired_path.exists()
+    assert fresh_path.exists()
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_least_recently_used_windows_are_removed(cache_dir, monkeypatch):
+    monkeypatch.setattr(ecom_records_cache, 'RECORDS_CACHE_MAX_BYTES', 0)
+    old_path = cache_dir / 'old.pickle'
+    old_path.write_bytes(b'0' * 100)
+
+    get_cached_records('stocks', BEGIN_DT, END_DT, Stock1C, lambda: [stock('a', 1)], 'product_identifier', ())
+
+    # the window just saved is kept even if the cache does not fit
+    cached_files = os.listdir(cache_dir)
+    assert 'old.pickle' not in cached_files
+    assert len(cached_files) == 1
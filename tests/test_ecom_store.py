@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from utils.ecom_dataclasses import Stock1C, StockStandard
+from utils.ecom_store import get_watermark, open_store, save_records, save_watermark
+
+
+@pytest.fixture
+def store(tmp_path):
+    connection = open_store(str(tmp_path / 'store' / 'records.sqlite'))
+    yield connection
+    connection.close()
+
+
+def test_save_records_skips_saved_ones(store):
+    stock = Stock1C(
+        direction='->e  ',
+        datetime=datetime(2022, 11, 26, 12),
+        quantity=5,
+        product_identifier='guid',
+        hit_link='https://kibana/app/discover#/doc/pattern/index?id=doc-1',
+    )
+
+    assert save_records(store, 'stocks', 'mailru', [stock]) == 1
+    assert save_records(store, 'stocks', 'mailru', [stock]) == 0
+    assert save_records(store, 'stocks', 'uteka', [stock]) == 1
+
+    rows = store.execute('SELECT marketplace, day, hit_id, quantity FROM stocks ORDER BY marketplace').fetchall()
+    assert rows == [('mailru', '2022-11-26', 'doc-1', 5), ('uteka', '2022-11-26', 'doc-1', 5)]
+
+
+def test_save_records_adds_columns_of_other_dataclasses(store):
+    save_records(store, 'stocks', 'mailru', [Stock1C(direction='->e  ', datetime=datetime(2022, 11, 26))])
+    save_records(store, 'stocks', 'mailru', [
+        StockStandard(direction='  e->', datetime=datetime(2022, 11, 27), price=100, price_guid='77'),
+    ])
+
+    rows = store.execute('SELECT direction, price, price_guid FROM stocks ORDER BY day').fetchall()
+    assert rows == [('->e  ', None, None), ('  e->', 100, '77')]
+
+
+@pytest.mark.parametrize('feed_datetime, day', [
+    ('Nov 26 2021', '2021-11-26'),
+    ('2022-11-26T12:00:00.000Z', '2022-11-26'),
+    ('', ''),
+])
+def test_day_of_string_datetimes(store, feed_datetime, day):
+    save_records(store, 'stocks', 'sbermm', [Stock1C(direction='  e->', datetime=feed_datetime)])
+
+    assert store.execute('SELECT day FROM stocks').fetchone() == (day,)
+
+
+def test_watermarks(store):
+    assert get_watermark(store, 'mailru|stocks') is None
+
+    save_watermark(store, 'mailru|stocks', '2022-11-26T12:00:00.000Z')
+    save_watermark(store, 'mailru|stocks', '2022-11-26T13:00:00.000Z')
+
+    assert get_watermark(store, 'mailru|stocks') == '2022-11-26T13:00:00.000Z'
+    assert get_watermark(store, 'uteka|stocks') is None
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from utils.ecom_throttle import AIMDLimiter, CircuitBreaker
+
+
+def test_breaker_opens_after_overload_failures_in_a_row():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+
+    breaker.before_call()
+    breaker.record(success=False)
+    assert breaker.state == 'closed'
+
+    # errors which are not overload do not reset the failures
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    breaker.record(success=False)
+    assert breaker.state == 'open'
+
+
+def test_breaker_lets_one_probe_after_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.before_call()
+    breaker.record(success=False)
+    assert breaker.state == 'open'
+
+    breaker.before_call()
+    assert breaker.state == 'half-open'
+
+    # the second caller waits for the probe result
+    waiter = threading.Thread(target=breaker.before_call)
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+
+    breaker.record(success=True)
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert breaker.state == 'closed'
+
+
+def test_breaker_opens_again_when_probe_fails():
+    breaker = CircuitBreaker(failures=3, cooldown=0.05)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(success=False)
+
+    breaker.before_call()
+    assert breaker.state == 'half-open'
+
+    opened_at = breaker.opened_at
+    breaker.record(success=False)
+    assert breaker.state == 'open'
+    assert breaker.opened_at > opened_at
+
+
+def test_breaker_waits_for_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=0.1)
+    breaker.before_call()
+    breaker.record(success=False)
+
+    started_at = time.monotonic()
+    breaker.before_call()
+    assert time.monotonic() - started_at >= 0.09
+
+
+def test_limiter_keeps_limit_on_slow_responses():
+    limiter = AIMDLimiter(start=4, maximum=8)
+
+    limiter.acquire()
+    limiter.release(overloaded=False, slow=True)
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release(overloaded=False)
+    assert limiter.limit > 4
+
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit < 4
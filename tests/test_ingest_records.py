@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+from ingest_records import ingest_method
+from settings import StandardMarketplaceSettings
+from utils.ecom_dataclasses import Stock1C
+from utils.ecom_store import get_watermark, open_store, save_watermark
+
+WATERMARK_NAME = 'mailru|org|guid|get_1c_stocks'
+
+
+class FakeParser:
+
+    def __init__(self, mp_settings: StandardMarketplaceSettings) -> None:
+        self.marketplace = 'mailru'
+        self.passed_org_name = 'org'
+        self.product_identifiers = {'guid'}
+        self.mp_settings = mp_settings
+        self.periods = []
+
+    def get_1c_stocks(self):
+        self.periods.append(self.mp_settings.period_1c_stocks)
+        yield Stock1C(direction='->e  ', datetime=datetime(2022, 11, 26, 11), quantity=5, product_identifier='guid')
+
+
+@pytest.fixture
+def store(tmp_path):
+    connection = open_store(str(tmp_path / 'records.sqlite'))
+    yield connection
+    connection.close()
+
+
+def test_period_is_shortened_only_for_the_parser(store, monkeypatch):
+    monkeypatch.setattr('ingest_records.INGEST_OVERLAP_MINUTES', 0)
+    shared_settings = StandardMarketplaceSettings()
+    period = shared_settings.period_1c_stocks
+    save_watermark(store, WATERMARK_NAME, '2022-11-26T11:00:00.000Z')
+    parser = FakeParser(shared_settings)
+
+    ingest_method(store, parser, '2022-11-26T12:00:00.000Z', 'stocks', 'get_1c_stocks', 'period_1c_stocks')
+
+    assert parser.periods == [1]
+    assert shared_settings.period_1c_stocks == period
+    assert get_watermark(store, WATERMARK_NAME) == '2022-11-26T12:00:00.000Z'
+
+
+def test_failure_is_printed_with_traceback(store, capsys):
+    parser = FakeParser(StandardMarketplaceSettings())
+    parser.get_1c_stocks = lambda: iter([None])
+
+    ingest_method(store, parser, '2022-11-26T12:00:00.000Z', 'stocks', 'get_1c_stocks', 'period_1c_stocks')
+
+    output = capsys.readouterr()
+    assert 'get_1c_stocks failed' in output.out
+    assert 'Traceback' in output.err
+    assert get_watermark(store, WATERMARK_NAME) is None
@@ -0,0 +1,24 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import latency_1c_mp
+from utils.ecom_dataclasses import Stock1C, StockStandard
+
+
+def test_records_with_string_datetimes_are_analyzed(monkeypatch):
+    written = {}
+    monkeypatch.setattr(latency_1c_mp, 'write_down_csv', lambda name, _, rows: written.update({name: list(rows)}))
+    parser = SimpleNamespace(marketplace='sbermm', product_aliases={})
+
+    stocks_1c = [Stock1C(direction='->e  ', datetime=datetime(2022, 11, 26, 12), quantity=5, product_identifier='guid')]
+    # feed records keep datetime of ftp listing and are not sorted
+    stocks_mp = [
+        StockStandard(direction='  e->', datetime='2022-11-26T12:30:00', quantity=5, product_identifier='guid'),
+        StockStandard(direction='  e->', datetime='', quantity=5, product_identifier='guid'),
+        StockStandard(direction='  e->', datetime='2022-11-26T11:00:00', quantity=5, product_identifier='guid'),
+    ]
+
+    latency_1c_mp.analyze(parser, 'stocks', stocks_1c, stocks_mp)
+
+    [stats] = written['latency_stocks.csv']
+    assert (stats.pushed, stats.max_seconds) == (1, 1800)
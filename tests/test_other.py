@@ -0,0 +1,25 @@
+import io
+import sys
+
+from utils.other import read_identifiers
+
+IDENTIFIERS = '''# products of the order
+85a2ef11-d2a9-48bf-ad7e-4309f05c9ec4
+
+  12345  
+# 54321
+67890
+'''
+
+
+def test_read_identifiers_from_file(tmp_path):
+    identifiers_path = tmp_path / 'products.txt'
+    identifiers_path.write_text(IDENTIFIERS, encoding='utf-8')
+
+    assert read_identifiers(str(identifiers_path)) == ['85a2ef11-d2a9-48bf-ad7e-4309f05c9ec4', '12345', '67890']
+
+
+def test_read_identifiers_from_stdin(monkeypatch):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(IDENTIFIERS))
+
+    assert read_identifiers('-') == ['85a2ef11-d2a9-48bf-ad7e-4309f05c9ec4', '12345', '67890']
@@ -1,3 +1,5 @@
+from typing import Collection
+
 from sshtunnel import argparse
 
 
@@ -42,12 +44,28 @@ def get_args_stores():
              'or id like "МСК000246759".',
     )
 
+    parser.add_argument(
+        '-S',
+        '--stores-file',
+        type=str,
+        metavar='',
+        required=False,
+        help='file with store guids or ids of the organization, one per line, "-" for stdin. ' \
+             'all of them are checked in one run',
+    )
+
     args = parser.parse_args()
 
     return args
 
 
-def get_args_stocks_prices():
+def get_args_stocks_prices(flags: Collection[str] = ()):
+    """Parse common arguments of stocks and prices scripts.
+
+    Args:
+        flags: optional arguments the script supports, i.e. ('products_file', 'follow').
+            Other optional arguments are not added so they are rejected by argparse.
+    """
     parser = argparse.ArgumentParser(description='gets stocks data for mp')
     parser.add_argument(
         '-d',
@@ -96,6 +114,205 @@ def get_args_stocks_prices():
         # default=tuple(),
         help='product guid or code',
     )
+    if 'products_file' in flags:
+        parser.add_argument(
+            '-P',
+            '--products-file',
+            type=str,
+            metavar='',
+            required=False,
+            help='file with product guids or codes, one per line, "-" for stdin. all of them are checked in one run',
+        )
+    if 'reconcile' in flags:
+        parser.add_argument(
+            '-r',
+            '--reconcile',
+            action='store_true',
+            help='write down only discrepancies between 1C and mp data',
+        )
+    if 'follow' in flags:
+        parser.add_argument(
+            '-f',
+            '--follow',
+            action='store_true',
+            help='keep polling elastic for new hits after the period is read. stop with ctrl+c',
+        )
+    if 'latest' in flags:
+        parser.add_argument(
+            '-l',
+            '--latest',
+            action='store_true',
+            help='find only the last record per product before the datetime',
+        )
+    if 'collapse_duplicates' in flags:
+        parser.add_argument(
+            '-c',
+            '--collapse-duplicates',
+            action='store_true',
+            help='skip stocks payloads which are equal to the previous one of the same endpoint',
+        )
+    if 'changes_only' in flags:
+        parser.add_argument(
+            '--changes-only',
+            action='store_true',
+            help='write down only changes of quantity with the first and last datetime of every value',
+        )
+    if 'cache_records' in flags:
+        parser.add_argument(
+            '--cache-records',
+            action='store_true',
+            help='parse stocks of all products once per period and reuse them in next runs with other filters',
+        )
+
+    args = parser.parse_args()
+
+    # flags choosing different outputs or readings of elastic can not be combined
+    for flag_1, flag_2 in (
+        ('follow', 'latest'),
+        ('reconcile', 'changes_only'),
+        ('follow', 'cache_records'),
+        ('latest', 'cache_records'),
+    ):
+        if getattr(args, flag_1, False) and getattr(args, flag_2, False):
+            parser.error(f'--{flag_1.replace("_", "-")} can not be used with --{flag_2.replace("_", "-")}')
+
+    return args
+
+
+def get_args_fleet():
+    parser = argparse.ArgumentParser(description='checks stocks of all marketplaces at once')
+    parser.add_argument(
+        '-d',
+        '--datetime',
+        type=str,
+        metavar='',
+        required=True,
+        help='transaction datetime i.e. 2022-04-05T01:58:45.430Z',
+    )
+    parser.add_argument(
+        '-m',
+        '--marketplaces',
+        nargs='+',
+        type=str,
+        metavar='',
+        required=False,
+        help='marketplace names. all marketplaces by default',
+    )
+
+    org_store_group = parser.add_argument_group(
+        title='region/store. only one option in this group can be selected',
+    )
+    mxg = org_store_group.add_mutually_exclusive_group(required=True)
+    mxg.add_argument(
+        '-o',
+        '--organization',
+        type=str,
+        metavar='',
+        help='organization name or its region code like "77" for ФК Пульс.',
+    )
+    mxg.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        metavar='',
+        help='store guid like "85a2ef11-d2a9-48bf-ad7e-4309f05c9ec4" ' \
+             'or id like "МСК000246759".',
+    )
+
+    parser.add_argument(
+        '-p',
+        '--product',
+        type=str,
+        metavar='',
+        required=False,
+        help='product guid or code',
+    )
+    parser.add_argument(
+        '-P',
+        '--products-file',
+        type=str,
+        metavar='',
+        required=False,
+        help='file with product guids or codes, one per line, "-" for stdin',
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        metavar='',
+        default=4,
+        help='how many marketplaces are checked at the same time',
+    )
+    args = parser.parse_args()
+
+    return args
+
+
+def get_args_ingest():
+    parser = argparse.ArgumentParser(description='saves parsed records into the local store')
+    parser.add_argument(
+        '-d',
+        '--datetime',
+        type=str,
+        metavar='',
+        required=True,
+        help='end of ingestion period i.e. 2022-04-05T01:58:45.430Z',
+    )
+    parser.add_argument(
+        '-m',
+        '--marketplaces',
+        nargs='+',
+        type=str,
+        metavar='',
+        required=False,
+        help='marketplace names. all marketplaces by default',
+    )
+
+    org_store_group = parser.add_argument_group(
+        title='region/store. only one option in this group can be selected',
+    )
+    mxg = org_store_group.add_mutually_exclusive_group(required=True)
+    mxg.add_argument(
+        '-o',
+        '--organization',
+        type=str,
+        metavar='',
+        help='organization name or its region code like "77" for ФК Пульс.',
+    )
+    mxg.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        metavar='',
+        help='store guid like "85a2ef11-d2a9-48bf-ad7e-4309f05c9ec4" ' \
+             'or id like "МСК000246759".',
+    )
+
+    parser.add_argument(
+        '-p',
+        '--product',
+        type=str,
+        metavar='',
+        required=False,
+        help='product guid or code. all products by default',
+    )
+    parser.add_argument(
+        '-P',
+        '--products-file',
+        type=str,
+        metavar='',
+        required=False,
+        help='file with product guids or codes, one per line, "-" for stdin',
+    )
+    parser.add_argument(
+        '-k',
+        '--kinds',
+        nargs='+',
+        choices=('stocks', 'prices', 'stores'),
+        default=['stocks', 'prices', 'stores'],
+        metavar='',
+        help='kinds of records: stocks, prices, stores. all by default',
+    )
     args = parser.parse_args()
 
     return args
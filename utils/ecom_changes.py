@@ -0,0 +1,83 @@
+"""Change-only view of stocks.
+
+Ecom and 1C resend the same quantity of a product every few minutes, so most
+rows of a report repeat the previous one. Here consecutive stocks with the same
+quantity are folded into one run per (direction, product, organization,
+region/price guid, expiration date) key and only runs are written down.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Generator, Iterable, Union
+
+from utils.ecom_dataclasses import StockBase
+
+
+@dataclass
+class StockChange:
+    direction: str
+    first_datetime: datetime
+    last_datetime: datetime
+    org_name: str = ''
+    product_identifier: str = ''
+    price_guid: Union[str, int] = ''
+    region: str = ''
+    expiration_date: str = ''
+    quantity: int = 0
+    repeats: int = 1
+    hit_link: str = ''  # of the first stock of the run
+
+
+def _get_key(stock: StockBase) -> tuple:
+    # 1C stocks have no price guid and region
+    return (
+        stock.direction,
+        stock.product_identifier,
+        stock.org_name,
+        getattr(stock, 'price_guid', ''),
+        getattr(stock, 'region', ''),
+        stock.expiration_date,
+    )
+
+
+def iter_stock_changes(stocks: Iterable[StockBase]) -> Generator[StockChange, None, None]:
+    """Fold consecutive stocks with equal quantity into runs.
+
+    Only the current run of every key is kept in memory, so stocks can be
+    a generator of any length.
+
+    Args:
+        stocks: stocks of any direction in chronological order.
+    Yields:
+        Runs when the quantity of their key changes and the rest of runs in the end.
+        Runs are not ordered by first_datetime.
+    """
+    runs: dict[tuple, StockChange] = {}
+
+    for stock in stocks:
+        key = _get_key(stock)
+        run = runs.get(key)
+
+        if run is not None and run.quantity == stock.quantity:
+            run.last_datetime = stock.datetime
+            run.repeats += 1
+            continue
+
+        if run is not None:
+            yield run
+
+        _, product_identifier, org_name, price_guid, region, expiration_date = key
+        runs[key] = StockChange(
+            direction=stock.direction,
+            first_datetime=stock.datetime,
+            last_datetime=stock.datetime,
+            org_name=org_name,
+            product_identifier=product_identifier,
+            price_guid=price_guid,
+            region=region,
+            expiration_date=expiration_date,
+            quantity=stock.quantity,
+            hit_link=stock.hit_link,
+        )
+
+    yield from runs.values()
@@ -0,0 +1,113 @@
+"""Resumable extraction of long periods.
+
+The period is split into segments of CHECKPOINT_SEGMENT_HOURS. Records of every
+completed segment are saved under the cache dir, so if extraction dies
+(i.e. elastic request timeout) the next run with the same arguments loads
+completed segments from disk and continues from the first missing one.
+Checkpoints are removed when the whole period is extracted.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime, timedelta
+from typing import Callable, Generator, Iterable
+
+from utils.other import CACHE_DIR
+
+CHECKPOINTS_DIR = os.path.join(CACHE_DIR, 'checkpoints')
+CHECKPOINT_SEGMENT_HOURS = float(os.environ.get('CHECKPOINT_SEGMENT_HOURS', 6))
+# segments ending later than that before now can still get new hits, they are not saved
+CHECKPOINT_SETTLE_MINUTES = float(os.environ.get('CHECKPOINT_SETTLE_MINUTES', 5))
+
+ELASTIC_DT_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def _format_dt(dt: datetime) -> str:
+    """Format datetime the same way get_datetimes does."""
+    return dt.strftime(ELASTIC_DT_FORMAT)[:-4] + 'Z'
+
+
+def split_period(begin_dt: str, end_dt: str, segment_hours: float) -> list[tuple[str, str]]:
+    """Split elastic period into segments which do not overlap.
+
+    Args:
+        begin_dt: begin of the period like '2022-11-26T09:00:00.000Z'.
+        end_dt: end of the period.
+        segment_hours: length of a segment.
+    Returns:
+        List of (begin, end) strings. Segments end 1 ms before the next one begins
+        because elastic range includes both ends. The last segment ends at the end
+        of the period, a period with begin equal to end is one segment.
+    """
+    # get_datetimes drops milliseconds when they are zero so strptime is not used
+    begin = datetime.fromisoformat(begin_dt.rstrip('Z'))
+    end = datetime.fromisoformat(end_dt.rstrip('Z'))
+    step = timedelta(hours=segment_hours)
+
+    segments = []
+    segment_begin = begin
+    while segment_begin <= end:
+        next_begin = segment_begin + step
+        if next_begin >= end:
+            # the end is included into the last segment instead of a zero-length one
+            segments.append((_format_dt(segment_begin), _format_dt(end)))
+            break
+
+        segments.append((_format_dt(segment_begin), _format_dt(next_begin - timedelta(milliseconds=1))))
+        segment_begin = next_begin
+
+    return segments
+
+
+def iter_checkpointed(
+    job_name: str,
+    begin_dt: str,
+    end_dt: str,
+    extract_segment: Callable[[str, str], Iterable],
+    segment_hours: float = CHECKPOINT_SEGMENT_HOURS,
+) -> Generator:
+    """Extract records of the period segment by segment saving every completed segment.
+
+    Args:
+        job_name: identifies the extraction, i.e. parser class, method and filters.
+            Runs with the same name and period share checkpoints.
+        begin_dt: begin of the period.
+        end_dt: end of the period.
+        extract_segment: function getting records of a segment by its begin and end.
+        segment_hours: length of a segment.
+    Yields:
+        Records of all segments in chronological order.
+    """
+    job_key = hashlib.sha1(f'{job_name}|{begin_dt}|{end_dt}'.encode()).hexdigest()
+    job_dir = os.path.join(CHECKPOINTS_DIR, job_key)
+    os.makedirs(job_dir, exist_ok=True)
+
+    with open(os.path.join(job_dir, 'job.json'), 'w', encoding='utf-8') as job_file:
+        json.dump({'name': job_name, 'begin_dt': begin_dt, 'end_dt': end_dt}, job_file, ensure_ascii=False)
+
+    settled_before = _format_dt(datetime.utcnow() - timedelta(minutes=CHECKPOINT_SETTLE_MINUTES))
+    segments = split_period(begin_dt, end_dt, segment_hours)
+
+    for number, (segment_begin, segment_end) in enumerate(segments, 1):
+        segment_path = os.path.join(job_dir, f'{segment_begin}.pickle')
+
+        if os.path.exists(segment_path):
+            print(f'segment {number}/{len(segments)} {segment_begin} is loaded from checkpoint')
+            with open(segment_path, 'rb') as segment_file:
+                yield from pickle.load(segment_file)
+            continue
+
+        print(f'segment {number}/{len(segments)} {segment_begin} - {segment_end}')
+        records = list(extract_segment(segment_begin, segment_end))
+
+        if segment_end < settled_before:
+            with open(segment_path + '.part', 'wb') as segment_file:
+                pickle.dump(records, segment_file)
+            os.replace(segment_path + '.part', segment_path)
+
+        yield from records
+
+    shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,77 @@
+"""Deduplication of identical hit payloads.
+
+Ecom often sends byte-identical stocks to a marketplace and 1C resends
+unchanged stocks. Records of such payloads are parsed once and then copied
+with only datetime and hit_link replaced.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime
+from typing import Callable, Hashable, Optional
+
+PAYLOADS_CACHE_SIZE = int(os.environ.get('PAYLOADS_CACHE_SIZE', 64))
+
+
+class PayloadCache:
+    """Records parsed from recent payloads by payload hash, least recently used are dropped."""
+
+    def __init__(self, size: int = PAYLOADS_CACHE_SIZE) -> None:
+        self.size = size
+        self.records: OrderedDict[bytes, list] = OrderedDict()
+        # labels: hash of the last payload with these labels
+        self.last_hashes: dict[Hashable, bytes] = {}
+        self.duplicates = 0
+        self.collapsed = 0
+
+    def get_records(
+        self,
+        labels: Hashable,
+        payload: str,
+        parse: Callable[[], list],
+        hit_datetime: datetime,
+        hit_link: str,
+        collapse: bool = False,
+    ) -> Optional[list]:
+        """Get records of the payload parsing it only if the same payload has not been met recently.
+
+        Args:
+            labels: hit fields the records depend on besides payload, i.e. transaction name.
+            payload: raw request or response body.
+            parse: makes records of the payload with hit_datetime and hit_link.
+            hit_datetime: datetime for records of the hit.
+            hit_link: link for records of the hit.
+            collapse: skip the payload if it is equal to the previous one with the same labels.
+        Returns:
+            Records of the hit or None if it is collapsed.
+        """
+        payload_hash = hashlib.blake2b(f'{labels}\n{payload}'.encode(), digest_size=16).digest()
+
+        is_repeated = self.last_hashes.get(labels) == payload_hash
+        self.last_hashes[labels] = payload_hash
+        if collapse and is_repeated:
+            self.collapsed += 1
+            return None
+
+        records = self.records.get(payload_hash)
+        if records is None:
+            records = parse()
+            self.records[payload_hash] = records
+            if len(self.records) > self.size:
+                self.records.popitem(last=False)
+            return records
+
+        self.records.move_to_end(payload_hash)
+        self.duplicates += 1
+
+        return [replace(record, datetime=hit_datetime, hit_link=hit_link) for record in records]
+
+    def print_stats(self) -> None:
+        """Print and reset counters of duplicates."""
+        if self.duplicates or self.collapsed:
+            print(f'duplicate payloads: {self.duplicates + self.collapsed}, collapsed: {self.collapsed}')
+
+        self.duplicates = 0
+        self.collapsed = 0
@@ -5,12 +5,24 @@ An elasticsearch-dsl library is the preferred way to create es queries but atm
 it can have problems with execution time. In that case a requests liraty is acceptable.
 """
 
+import hashlib
+import json
+import os
 import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Generator, Optional
 
-from elasticsearch import Elasticsearch, RequestError
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch import Elasticsearch, RequestError, TransportError
 from elasticsearch_dsl import Q, Search
 from elasticsearch_dsl.utils import AttrList
 
+from utils.ecom_metrics import METRICS_MODE, measure
+from utils.ecom_throttle import call_elastic
+from utils.other import CACHE_DIR
+
 
 SOURCE_INCLUDES = [
     '_id',
@@ -28,6 +40,20 @@ SOURCE_INCLUDES = [
 ]
 ECOM_INDEX = 'apm-*prod-ecom-0*'
 ECOM_CLIENT_INDEX = 'k8s-production-*'
+PAGE_SIZE = 10000
+
+# follow mode polls elastic for new hits every FOLLOW_POLL_SECONDS
+FOLLOW_POLL_SECONDS = float(os.environ.get('ELASTIC_FOLLOW_POLL_SECONDS', 30))
+WATERMARKS_DIR = os.path.join(CACHE_DIR, 'watermarks')
+# latest state lookups read hits backwards by small pages
+LATEST_PAGE_SIZE = int(os.environ.get('ELASTIC_LATEST_PAGE_SIZE', 50))
+
+# number of get_hits results cut by PAGE_SIZE, the rest of their periods is not read
+_truncated_count = 0
+
+# get_hits results by query arguments, None when cache is disabled
+_hits_cache: Optional[dict[tuple, Future]] = None
+_hits_cache_lock = threading.Lock()
 
 es_client = Elasticsearch(
     hosts=['http://elasticsearch-balancer.infra.puls.local:80'],
@@ -38,7 +64,7 @@ es_client = Elasticsearch(
 
 def _create_dsl_query(
     begin_dt: str,
-    end_dt: str,
+    end_dt: Optional[str],
     endpoint: str = '',
     username: str = 'puls',
     success_status: str = '200',
@@ -47,7 +73,7 @@ def _create_dsl_query(
 
     Args:
         begin_dt: Begin of a query period.
-        end_dt: End of a query period.
+        end_dt: End of a query period. None means the period is not limited.
         endpoint: Value for ES 'transaction.name' parameter.
         username: Value for ES 'user.name' parameter.
         success_status: Value for ES 'transaction.result' parameter. Atm only successful transactions are being parsed.
@@ -59,9 +85,13 @@ def _create_dsl_query(
     else:
         endpoint_filter = 'match_phrase'
 
+    timestamp_range = {'gte': begin_dt}
+    if end_dt is not None:
+        timestamp_range['lte'] = end_dt
+
     dsl_query = Search(using=es_client, index=ECOM_INDEX) \
         .query('bool', filter=[
-            Q('range', **{'@timestamp': {'gte': begin_dt, 'lte': end_dt}}),
+            Q('range', **{'@timestamp': timestamp_range}),
             Q(endpoint_filter, transaction__name=endpoint),
             Q('match_phrase', user__name=username),
             Q('match', transaction__result=success_status),
@@ -70,7 +100,7 @@ def _create_dsl_query(
         ]) \
         .source(includes=SOURCE_INCLUDES) \
         .sort('@timestamp') \
-        .extra(size=10000)
+        .extra(size=PAGE_SIZE)
 
     print(dsl_query.to_dict())
 
@@ -114,14 +144,21 @@ def _create_ecom_client_query(
 
 def _execute_dsl_query(dsl_query) -> AttrList:
     """Execute query and log result."""
-    try:
-        resp = dsl_query.execute()
-    except ConnectionError:
-        print('Could not connect to elasticsearch. Check your vpn and internet connection.')
-        sys.exit(0)
-    except RequestError:
-        print(f'Wrong elasticsearch request. \n{dsl_query.to_dict()}')
-        sys.exit(0)
+    with measure('elastic', index=dsl_query._index) as record:
+        try:
+            resp = call_elastic(','.join(dsl_query._index), dsl_query.execute)
+        except RequestError:
+            print(f'Wrong elasticsearch request. \n{dsl_query.to_dict()}')
+            sys.exit(1)
+        except (ESConnectionError, TransportError):
+            print('Could not connect to elasticsearch. Check your vpn and internet connection.')
+            sys.exit(1)
+
+        record.rows = len(resp.hits)
+        record.es_took_ms = resp.took
+        if METRICS_MODE:
+            # elasticsearch-dsl does not expose raw response so its size is estimated
+            record.bytes_received = len(json.dumps(resp.to_dict(), default=str))
 
     print('executed elastic query')
     print('hits: ' + str(len(resp.hits)))
@@ -150,12 +187,158 @@ def get_hits(
     Returns:
         A list of Hit objects. It is still necessary to parse json request and response body.
     """
+    global _truncated_count
+
+    if _hits_cache is not None:
+        cache_key = (begin_dt, end_dt, endpoint, username, success_status, project, method)
+        with _hits_cache_lock:
+            hits_future = _hits_cache.get(cache_key)
+            is_owner = hits_future is None
+            if is_owner:
+                hits_future = _hits_cache[cache_key] = Future()
+
+        # the same query from other threads waits for the first one instead of repeating it
+        if not is_owner:
+            print('using hits of the same query')
+            return hits_future.result()
+
     if project == 'ecom-client':
         dsl_query = _create_ecom_client_query(begin_dt, end_dt, endpoint, method=method)
     else:
         dsl_query = _create_dsl_query(begin_dt, end_dt, endpoint, username, success_status)
 
-    return _execute_dsl_query(dsl_query)
+    try:
+        hits = _execute_dsl_query(dsl_query)
+    except BaseException as e:
+        if _hits_cache is not None:
+            hits_future.set_exception(e)
+        raise
+
+    if len(hits) >= PAGE_SIZE:
+        _truncated_count += 1
+        print(f'hits are truncated to {len(hits)}, the period is read only until {hits[-1]["@timestamp"]}')
+
+    if _hits_cache is not None:
+        hits_future.set_result(hits)
+
+    return hits
+
+
+def get_truncated_count() -> int:
+    """Get number of get_hits results that were cut by PAGE_SIZE since the start."""
+    return _truncated_count
+
+
+def enable_hits_cache() -> None:
+    """Share hits of identical get_hits calls, i.e. 1C hits between parsers of different marketplaces."""
+    global _hits_cache
+    _hits_cache = {}
+
+
+def _get_watermark_path(watermark_name: str) -> str:
+    filename = hashlib.sha1(watermark_name.encode()).hexdigest()
+    return os.path.join(WATERMARKS_DIR, f'{filename}.json')
+
+
+def _load_watermark(watermark_name: str) -> Optional[list]:
+    """Get sort values of the last processed hit."""
+    try:
+        with open(_get_watermark_path(watermark_name), encoding='utf-8') as watermark_file:
+            return json.load(watermark_file)['search_after']
+    except FileNotFoundError:
+        return None
+
+
+def _save_watermark(watermark_name: str, search_after: list) -> None:
+    os.makedirs(WATERMARKS_DIR, exist_ok=True)
+
+    watermark_path = _get_watermark_path(watermark_name)
+    with open(watermark_path + '.tmp', 'w', encoding='utf-8') as watermark_file:
+        json.dump({'name': watermark_name, 'search_after': search_after}, watermark_file)
+    os.replace(watermark_path + '.tmp', watermark_path)
+
+
+def follow_hits(
+    begin_dt: str,
+    endpoint: str,
+    username: str = 'puls',
+    success_status: str = '200',
+    watermark_name: str = '',
+) -> Generator[AttrList, None, None]:
+    """Get pages of hits newer than the last processed one, waiting for new hits forever.
+
+    Hits are sorted by '@timestamp' and '_id' and requested with search_after, so
+    every request returns only new hits regardless of the period length.
+    The last processed hit is saved as a watermark when the next page is requested,
+    next run with the same watermark name continues from it.
+
+    Args:
+        begin_dt: Begin of a query period, used only if there is no saved watermark.
+        endpoint: Value for ES 'transaction.name' parameter.
+        username: Value for ES 'user.name' parameter.
+        success_status: Value for ES 'transaction.result' parameter.
+        watermark_name: identifies the query, i.e. marketplace, organization and endpoint.
+    Yields:
+        Lists of Hit objects.
+    """
+    search_after = _load_watermark(watermark_name)
+    if search_after:
+        print(f'continuing from watermark {search_after}')
+
+    while True:
+        dsl_query = _create_dsl_query(begin_dt, None, endpoint, username, success_status) \
+            .sort('@timestamp', '_id')
+        if search_after:
+            dsl_query = dsl_query.extra(search_after=search_after)
+
+        hits = _execute_dsl_query(dsl_query)
+
+        if hits:
+            yield hits
+            search_after = list(hits[-1].meta.sort)
+            _save_watermark(watermark_name, search_after)
+
+        if len(hits) < PAGE_SIZE:
+            time.sleep(FOLLOW_POLL_SECONDS)
+
+
+def iter_hits_backwards(
+    begin_dt: str,
+    end_dt: str,
+    endpoint: str,
+    username: str = 'puls',
+    success_status: str = '200',
+) -> Generator:
+    """Get pages of hits from the end of the period to its beginning.
+
+    Hits are requested by LATEST_PAGE_SIZE pages with search_after only when
+    previous ones are consumed, so a caller can stop after a few pages.
+
+    Args:
+        begin_dt: Begin of a query period.
+        end_dt: End of a query period.
+        endpoint: Value for ES 'transaction.name' parameter.
+        username: Value for ES 'user.name' parameter.
+        success_status: Value for ES 'transaction.result' parameter.
+    Yields:
+        Lists of Hit objects, the latest first.
+    """
+    search_after = None
+
+    while True:
+        dsl_query = _create_dsl_query(begin_dt, end_dt, endpoint, username, success_status) \
+            .sort({'@timestamp': {'order': 'desc'}}, {'_id': {'order': 'desc'}}) \
+            .extra(size=LATEST_PAGE_SIZE)
+        if search_after:
+            dsl_query = dsl_query.extra(search_after=search_after)
+
+        hits = _execute_dsl_query(dsl_query)
+        if hits:
+            yield hits
+
+        if len(hits) < LATEST_PAGE_SIZE:
+            return
+        search_after = list(hits[-1].meta.sort)
 
 
 def get_rejects_hits(
@@ -1,45 +1,657 @@
-import json
+import atexit
+import itertools
 import ijson
 import os
+import pickle
+import posixpath
+import sqlite3
 import sys
+import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from datetime import datetime
-from ftplib import FTP
+from ftplib import FTP, all_errors, error_perm
+from typing import IO, Callable, Collection, Generator, Iterable, Optional
 from zipfile import ZipFile
 
 from dotenv import load_dotenv
 from humanize import naturalsize
 
+from utils.other import CACHE_DIR
+
 load_dotenv()
 
 HOST = os.environ['FTP_HOST']
 USER = os.environ['OZON_LOGIN']
 PASSWORD = os.environ['OZON_PASSWORD']
 
+# downloaded feeds are kept here and reused while they are not changed on ftp
+FEEDS_CACHE_DIR = os.path.join(CACHE_DIR, 'feeds')
+FEEDS_CACHE_MAX_BYTES = int(os.environ.get('FEEDS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# compact snapshots of feed versions used to find changes between them
+FEED_SNAPSHOTS_DIR = os.path.join(CACHE_DIR, 'feed_snapshots')
+FEED_SNAPSHOTS_KEEP = int(os.environ.get('FEED_SNAPSHOTS_KEEP', 5))
+# seconds while parsed directory listing is reused
+FTP_LISTING_TTL = float(os.environ.get('FTP_LISTING_TTL', 60))
+
+# feeds bigger than FTP_RANGED_MIN_BYTES are downloaded by FTP_DOWNLOAD_CONNECTIONS connections at once
+FTP_DOWNLOAD_CONNECTIONS = int(os.environ.get('FTP_DOWNLOAD_CONNECTIONS', 4))
+FTP_RANGED_MIN_BYTES = int(os.environ.get('FTP_RANGED_MIN_BYTES', 64 * 1024 ** 2))
+FTP_BLOCK_SIZE = 1024 ** 2
+
+
+class PooledFTP(FTP):
+    """FTP connection that remembers its login directory and caches directory listings."""
+
+    def __init__(self, host: str, user: str, password: str) -> None:
+        super().__init__(host, user, password)
+        self.credentials = (host, user, password)
+        self.home_dir = self.pwd()
+        # directory: (time of listing, split LIST lines)
+        self.listings: dict[str, tuple[float, list]] = {}
+
+
+_ftp_connections: dict[tuple[str, str], PooledFTP] = {}
+
+
+def _close_ftp_connections() -> None:
+    """Log out from every pooled connection."""
+    for ftp_conn in _ftp_connections.values():
+        try:
+            ftp_conn.quit()
+        except all_errors:
+            ftp_conn.close()
+    _ftp_connections.clear()
+
+
+atexit.register(_close_ftp_connections)
 
-def get_ftp_connection(host: str, user: str, password: str):
-    """Get instance of FTP class with passed credentials."""
-    ftp_conn = FTP(host, user, password)
+
+def get_ftp_connection(host: str, user: str, password: str) -> PooledFTP:
+    """Get instance of FTP class with passed credentials.
+
+    Connection is created once per host and user and reused by later calls
+    while it is alive.
+    """
+    ftp_conn = _ftp_connections.get((host, user))
+
+    if ftp_conn is not None:
+        try:
+            ftp_conn.voidcmd('NOOP')
+        except all_errors:
+            ftp_conn.close()
+        else:
+            return ftp_conn
+
+    ftp_conn = PooledFTP(host, user, password)
+    _ftp_connections[(host, user)] = ftp_conn
     print('connected to ftp')
 
     return ftp_conn
 
 
-def get_filelist(ftp_conn: FTP, directory: str) -> list:
-    """Get list of all files in passed ftp directory."""
-    ftp_conn.cwd(directory)
+def _mlsd_to_list_entry(filename: str, facts: dict) -> list:
+    """Convert MLSD entry to the same form as split LIST line.
+
+    Only fields used by this module are meaningful: [4] size, [5:8] date, [8] name.
+    """
+    modify = datetime.strptime(facts['modify'][:14], '%Y%m%d%H%M%S')
+
+    return [
+        facts.get('unix.mode', '-'), '1', facts.get('unix.owner', ''), facts.get('unix.group', ''),
+        facts.get('size', '0'), modify.strftime('%b'), str(modify.day), modify.strftime('%H:%M'), filename,
+    ]
+
+
+def get_filelist(ftp_conn: PooledFTP, directory: str) -> list:
+    """Get list of all files in passed ftp directory.
+
+    MLSD is used if server supports it, LIST otherwise. Listing is cached
+    for FTP_LISTING_TTL seconds.
+    """
+    ftp_conn.cwd(posixpath.join(ftp_conn.home_dir, directory))
+
+    listed_at, filenames_raw = ftp_conn.listings.get(directory, (0, []))
+    if time.monotonic() - listed_at < FTP_LISTING_TTL:
+        return filenames_raw
+
+    try:
+        filenames_raw = [
+            _mlsd_to_list_entry(filename, facts)
+            for filename, facts in ftp_conn.mlsd(facts=['type', 'size', 'modify'])
+            if facts.get('type') == 'file'
+        ]
+    except error_perm:
+        filenames_raw = []
+        ftp_conn.retrlines('LIST', callback=lambda x: filenames_raw.append(x.split()))
 
-    filenames_raw = []
-    ftp_conn.retrlines('LIST', callback=lambda x: filenames_raw.append(x.split()))
-    ftp_conn.retrlines('LIST')
+    ftp_conn.listings[directory] = (time.monotonic(), filenames_raw)
+
+    for filename_raw in filenames_raw:
+        print(' '.join(filename_raw))
 
     return filenames_raw
 
 
-def get_sbermm_prices(campaign_id: str) -> dict:
+def get_remote_file_version(ftp_conn: FTP, filename: str, listing_entry: Optional[list] = None) -> str:
+    """Get string that changes every time the file is changed on ftp.
+
+    MDTM and SIZE are used if server supports them, otherwise date and size
+    from LIST output.
+
+    Args:
+        ftp_conn: connection with current directory containing the file.
+        filename: file name.
+        listing_entry: split LIST line of the file.
+    Returns:
+        String like '20231005120000_1048576'.
+    """
+    try:
+        ftp_conn.voidcmd('TYPE I')
+        size = ftp_conn.size(filename)
+        mtime = ftp_conn.sendcmd(f'MDTM {filename}').split()[-1]
+    except error_perm:
+        if listing_entry is None:
+            raise
+        size = listing_entry[4]
+        mtime = ''.join(listing_entry[5:8]).replace(':', '')
+
+    return f'{mtime}_{size}'
+
+
+def _evict_feeds_cache(keep_path: str) -> None:
+    """Remove least recently used feeds until the cache fits FEEDS_CACHE_MAX_BYTES."""
+    cached_files = []
+    for dirpath, _, filenames in os.walk(FEEDS_CACHE_DIR):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            cached_files.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(cached_file[1] for cached_file in cached_files)
+
+    for _, size, path in sorted(cached_files):
+        if total_size <= FEEDS_CACHE_MAX_BYTES:
+            break
+        if path == keep_path:
+            continue
+
+        os.remove(path)
+        total_size -= size
+        print(f'removed cached feed {path}')
+
+
+def _supports_rest(ftp_conn: FTP) -> bool:
+    """Check if server can start transfers from an offset."""
+    try:
+        ftp_conn.voidcmd('TYPE I')
+        return ftp_conn.sendcmd('REST 0').startswith('350')
+    except error_perm:
+        return False
+
+
+def _download_range(
+    credentials: tuple,
+    directory: str,
+    filename: str,
+    local_path: str,
+    start: int,
+    end: int,
+) -> int:
+    """Download bytes [start, end) of the file into the same place of the local file.
+
+    Own connection is opened for every range because one ftp connection can
+    transfer only one file at a time.
+
+    Args:
+        credentials: host, user and password of the main connection.
+        directory: ftp directory of the file.
+        filename: file name.
+        local_path: preallocated local file.
+        start: first byte of the range.
+        end: byte after the last one of the range.
+    Returns:
+        Number of downloaded bytes.
+    """
+    received = 0
+
+    with FTP(*credentials) as range_conn, open(local_path, 'r+b') as local_file:
+        range_conn.cwd(directory)
+        range_conn.voidcmd('TYPE I')
+        local_file.seek(start)
+
+        with range_conn.transfercmd(f'RETR {filename}', rest=start) as data_conn:
+            while received < end - start:
+                block = data_conn.recv(min(FTP_BLOCK_SIZE, end - start - received))
+                if not block:
+                    break
+                local_file.write(block)
+                received += len(block)
+
+        # the rest of the file is not needed so the transfer is left unfinished,
+        # the server closes the connection itself and QUIT would only wait for it
+        range_conn.close()
+
+    return received
+
+
+def download_ranged(ftp_conn: PooledFTP, filename: str, local_path: str, size: int) -> bool:
+    """Download the file by byte ranges through several connections at once.
+
+    Args:
+        ftp_conn: connection with current directory containing the file.
+        filename: file name.
+        local_path: path to write the file to.
+        size: size of the file on ftp.
+    Returns:
+        False if server does not support REST or the file is not completely downloaded,
+        it should be downloaded by single stream then.
+    """
+    if FTP_DOWNLOAD_CONNECTIONS < 2 or not _supports_rest(ftp_conn):
+        return False
+
+    part_size = -(-size // FTP_DOWNLOAD_CONNECTIONS)
+    ranges = [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+
+    # preallocate the file so every range is written to its own place
+    with open(local_path, 'wb') as local_file:
+        local_file.truncate(size)
+
+    # the main connection is not used by workers, one control connection can not run parallel commands
+    directory = ftp_conn.pwd()
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            received = list(executor.map(
+                lambda r: _download_range(ftp_conn.credentials, directory, filename, local_path, *r),
+                ranges,
+            ))
+    except all_errors as e:
+        print(f'ranged download of {filename} failed ({e}), downloading by single stream')
+        return False
+
+    if received != [end - start for start, end in ranges] or os.path.getsize(local_path) != size:
+        print(f'ranged download of {filename} is incomplete, downloading by single stream')
+        return False
+
+    print(f'downloaded by {len(ranges)} connections')
+    return True
+
+
+def download_feed(
+    ftp_conn: PooledFTP,
+    filename: str,
+    cache_subdir: str,
+    listing_entry: Optional[list] = None,
+) -> str:
+    """Download feed from current ftp directory unless the same version is cached.
+
+    Args:
+        ftp_conn: connection with current directory containing the file.
+        filename: feed file name.
+        cache_subdir: separates feeds of different ftp accounts, i.e. 'feeds2sber'.
+        listing_entry: split LIST line of the file. Used if MDTM/SIZE are not supported.
+    Returns:
+        Path to the local copy of the feed.
+    """
+    version = get_remote_file_version(ftp_conn, filename, listing_entry)
+    feed_dir = os.path.join(FEEDS_CACHE_DIR, cache_subdir)
+    feed_path = os.path.join(feed_dir, f'{version}_{filename}')
+
+    if os.path.exists(feed_path):
+        # touch the file so it is evicted later than unused ones
+        os.utime(feed_path)
+        print(f'feed {filename} is not changed, using cached copy')
+        return feed_path
+
+    os.makedirs(feed_dir, exist_ok=True)
+
+    # download into temporary file so interrupted downloads are never cached
+    size = int(version.rsplit('_', 1)[1])
+    if not (size >= FTP_RANGED_MIN_BYTES and download_ranged(ftp_conn, filename, feed_path + '.part', size)):
+        with open(feed_path + '.part', 'wb') as feed_file:
+            ftp_conn.retrbinary(f'RETR {filename}', feed_file.write)
+    os.replace(feed_path + '.part', feed_path)
+    print('downloaded')
+
+    _evict_feeds_cache(feed_path)
+
+    return feed_path
+
+
+def iter_xml_offers(
+    feed_filename: str,
+    offer_ids: Optional[Collection[str]] = None,
+) -> Generator[dict, None, None]:
+    """Read <offer> elements of xml/yml feed one by one without building the whole tree.
+
+    Every processed offer is removed from the tree so memory usage does not depend
+    on the feed size.
+
+    Args:
+        feed_filename: path to the downloaded feed.
+        offer_ids: if passed only offers with these ids are yielded.
+    Yields:
+        Dicts with offer attributes (id etc.) and its price.
+    """
+    offers_count = 0
+    parent = None
+
+    for event, element in ET.iterparse(feed_filename, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'offers':
+                parent = element
+            continue
+
+        if element.tag != 'offer':
+            continue
+
+        offers_count += 1
+        offer_id = element.attrib.get('id')
+
+        if not offer_ids or offer_id in offer_ids:
+            offer = dict(element.attrib)
+            offer['price'] = element.findtext('price')
+            yield offer
+
+        element.clear()
+        if parent is not None:
+            # drop already processed offers from <offers>
+            parent.clear()
+
+    print(f'prices in feed: {offers_count}')
+
+
+@contextmanager
+def _open_zipped_json(zip_path: str) -> Generator[IO[bytes], None, None]:
+    """Open json file packed in a zip feed as a stream without extracting it."""
+    with ZipFile(zip_path, 'r') as zp_file:
+        json_filename = os.path.basename(zip_path).split('_', 2)[-1].replace('.zip', '.json')
+        if json_filename not in zp_file.namelist():
+            json_filename = zp_file.namelist()[0]
+
+        with zp_file.open(json_filename) as js_file:
+            yield js_file
+
+
+def _iter_sbermm_outlets(
+    zip_path: str,
+    store_ids: Optional[Collection[str]] = None,
+) -> Generator[dict, None, None]:
+    """Parse outlets of zipped sbermm feed one by one.
+
+    Args:
+        zip_path: path to the downloaded *_outlets*.zip feed.
+        store_ids: if passed only outlets with these ids are yielded.
+    Yields:
+        Outlet dicts.
+    """
+    outlets_count = 0
+
+    with _open_zipped_json(zip_path) as js_file:
+        for outlet in ijson.items(js_file, 'outlets.item'):
+            outlets_count += 1
+            if not store_ids or outlet['identification']['id'] in store_ids:
+                yield outlet
+
+    print(f'stores in feed: {outlets_count}')
+
+
+def _iter_sbermm_offers(
+    zip_path: str,
+    offer_ids: Optional[Collection[str]] = None,
+) -> Generator[dict, None, None]:
+    """Parse offers of the first outlet of zipped sbermm stocks feed one by one.
+
+    Args:
+        zip_path: path to the downloaded *_stocks_full*.zip feed.
+        offer_ids: if passed only offers with these ids are yielded.
+    Yields:
+        Offer dicts.
+    """
+    offers_count = 0
+
+    with _open_zipped_json(zip_path) as js_file:
+        # all outlets have the same offers so parsing stops after the first one
+        events = itertools.takewhile(lambda e: e[:2] != ('outlets.item', 'end_map'), ijson.parse(js_file))
+
+        for offer in ijson.items(events, 'outlets.item.offers.item'):
+            offers_count += 1
+            if not offer_ids or offer['offerId'] in offer_ids:
+                yield offer
+
+    print(f'stocks in feed: {offers_count}')
+
+
+def _build_feed_index(
+    index_path: str,
+    records: Iterable[dict],
+    get_record_id: Callable[[dict], str],
+) -> None:
+    """Write feed records into sqlite table with record id as a primary key.
+
+    Records are pickled, so decimals parsed by ijson are read back as decimals.
+    """
+    part_path = index_path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    with closing(sqlite3.connect(part_path)) as index_conn:
+        index_conn.execute('CREATE TABLE records (record_id TEXT PRIMARY KEY, record BLOB)')
+        index_conn.executemany(
+            'INSERT OR REPLACE INTO records VALUES (?, ?)',
+            (
+                (str(get_record_id(record)), pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+                for record in records
+            ),
+        )
+        index_conn.commit()
+
+    os.replace(part_path, index_path)
+    print(f'built feed index {index_path}')
+
+
+def iter_indexed_records(
+    feed_path: str,
+    iter_records: Callable[[str], Iterable[dict]],
+    get_record_id: Callable[[dict], str],
+    record_ids: Optional[Collection[str]] = None,
+) -> Generator[dict, None, None]:
+    """Get feed records by ids using an index built once per feed version.
+
+    Index is a sqlite file next to the cached feed. As feed file names contain
+    their version a new feed always gets a new index. Records are the same as
+    parsed ones, whether they are read from the index or from the feed.
+
+    Args:
+        feed_path: path to the cached feed.
+        iter_records: function parsing all records of the feed.
+        get_record_id: function getting id of a record.
+        record_ids: ids of needed records. If empty the whole feed is parsed.
+    Yields:
+        Records with passed ids.
+    """
+    if not record_ids:
+        yield from iter_records(feed_path)
+        return
+
+    # v2 indexes keep pickled records, v1 ones had json with floats instead of decimals
+    index_path = feed_path + '.index.v2.sqlite'
+    if not os.path.exists(index_path):
+        _build_feed_index(index_path, iter_records(feed_path), get_record_id)
+
+    record_ids = [str(record_id) for record_id in record_ids]
+
+    with closing(sqlite3.connect(index_path)) as index_conn:
+        # sqlite limits number of query parameters
+        for pos in range(0, len(record_ids), 500):
+            chunk = record_ids[pos:pos + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            query_result = index_conn.execute(
+                f'SELECT record FROM records WHERE record_id IN ({placeholders})',
+                chunk,
+            )
+
+            for row in query_result:
+                yield pickle.loads(row[0])
+
+
+def save_feed_snapshot(
+    feed_path: str,
+    feed_key: str,
+    records: Iterable[dict],
+    get_record_id: Callable[[dict], str],
+    get_price: Callable[[dict], str],
+    get_quantity: Callable[[dict], str],
+) -> str:
+    """Save record id, price and quantity of every feed record into a sqlite snapshot.
+
+    Snapshots are kept per feed key (feed file names can change between versions)
+    and only FEED_SNAPSHOTS_KEEP latest of them are stored.
+
+    Args:
+        feed_path: path to the cached feed. Its name starts with the feed version.
+        feed_key: stable feed name, i.e. '12345_stocks_full'.
+        records: all records of the feed.
+        get_record_id: function getting id of a record.
+        get_price: function getting price of a record.
+        get_quantity: function getting quantity of a record.
+    Returns:
+        Path to the snapshot of this feed version.
+    """
+    snapshot_dir = os.path.join(FEED_SNAPSHOTS_DIR, feed_key)
+    version = '_'.join(os.path.basename(feed_path).split('_', 2)[:2])
+    snapshot_path = os.path.join(snapshot_dir, f'{version}.sqlite')
+
+    if os.path.exists(snapshot_path):
+        return snapshot_path
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    part_path = snapshot_path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    with closing(sqlite3.connect(part_path)) as snapshot_conn:
+        snapshot_conn.execute(
+            'CREATE TABLE snapshot (record_id TEXT PRIMARY KEY, price TEXT, quantity TEXT) WITHOUT ROWID',
+        )
+        snapshot_conn.executemany(
+            'INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?)',
+            (
+                (str(get_record_id(record)), str(get_price(record)), str(get_quantity(record)))
+                for record in records
+            ),
+        )
+        snapshot_conn.commit()
+
+    os.replace(part_path, snapshot_path)
+    print(f'saved feed snapshot {snapshot_path}')
+
+    for old_snapshot_path in _get_snapshots(snapshot_dir)[:-FEED_SNAPSHOTS_KEEP]:
+        os.remove(old_snapshot_path)
+
+    return snapshot_path
+
+
+def _get_snapshots(snapshot_dir: str) -> list[str]:
+    """Get snapshot paths in the order feed versions were saved.
+
+    Versions from LIST fallback look like 'Nov261200_1048576' and can not be
+    sorted by name, so modification time of snapshots is used.
+    """
+    snapshot_paths = [
+        os.path.join(snapshot_dir, filename)
+        for filename in os.listdir(snapshot_dir)
+        if filename.endswith('.sqlite')
+    ]
+
+    return sorted(snapshot_paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def get_previous_snapshot(snapshot_path: str) -> Optional[str]:
+    """Get snapshot of the feed version preceding the passed one."""
+    snapshots = _get_snapshots(os.path.dirname(snapshot_path))
+    index = snapshots.index(snapshot_path)
+
+    return snapshots[index - 1] if index else None
+
+
+def iter_feed_changes(
+    old_snapshot_path: str,
+    new_snapshot_path: str,
+    record_ids: Optional[Collection[str]] = None,
+) -> Generator[dict, None, None]:
+    """Compare two snapshots of the same feed and yield changed records.
+
+    The join is done by sqlite on disk so memory does not depend on feed size.
+
+    Args:
+        old_snapshot_path: snapshot of the previous feed version.
+        new_snapshot_path: snapshot of the current feed version.
+        record_ids: if passed only changes of these records are yielded.
+    Yields:
+        Dicts with record id, change type ('added', 'removed', 'price',
+    'quantity' or 'price, quantity'), old and new price and quantity.
+    """
+    query_text = """
+    SELECT
+        new.record_id, old.record_id IS NULL, 0, old.price, new.price, old.quantity, new.quantity
+    FROM main.snapshot new
+        LEFT JOIN old.snapshot old
+            ON new.record_id = old.record_id
+    WHERE
+        old.record_id IS NULL
+        OR old.price != new.price
+        OR old.quantity != new.quantity
+    UNION ALL
+    SELECT
+        old.record_id, 0, 1, old.price, NULL, old.quantity, NULL
+    FROM old.snapshot old
+        LEFT JOIN main.snapshot new
+            ON old.record_id = new.record_id
+    WHERE
+        new.record_id IS NULL
+    """
+    changes_count = 0
+
+    with closing(sqlite3.connect(new_snapshot_path)) as snapshot_conn:
+        snapshot_conn.execute('ATTACH DATABASE ? AS old', (old_snapshot_path,))
+
+        for row in snapshot_conn.execute(query_text):
+            record_id, added, removed, old_price, new_price, old_quantity, new_quantity = row
+
+            if record_ids and record_id not in record_ids:
+                continue
+
+            if added:
+                change = 'added'
+            elif removed:
+                change = 'removed'
+            else:
+                changed_fields = []
+                if old_price != new_price:
+                    changed_fields.append('price')
+                if old_quantity != new_quantity:
+                    changed_fields.append('quantity')
+                change = ', '.join(changed_fields)
+
+            changes_count += 1
+            yield {
+                'record_id': record_id,
+                'change': change,
+                'old_price': old_price,
+                'new_price': new_price,
+                'old_quantity': old_quantity,
+                'new_quantity': new_quantity,
+            }
+
+    print(f'changes between feed versions: {changes_count}')
+
+
+def get_sbermm_prices(campaign_id: str, offer_ids: Optional[Collection[str]] = None) -> dict:
     feed_filename = f'{campaign_id}.xml'
-    ftp_conn = FTP(HOST, USER, PASSWORD)
-    print('connected to ftp')
+    ftp_conn = get_ftp_connection(HOST, USER, PASSWORD)
 
     filenames_raw = get_filelist(ftp_conn, 'feeds')
 
@@ -52,20 +664,12 @@ def get_sbermm_prices(campaign_id: str) -> dict:
     dt = f'{fn[5]} {fn[6]} {fn[7]}'
     print(f'{feed_filename}\t{dt} - {naturalsize(fn[4])}')
 
-    with open(feed_filename, 'wb') as feed_file:
-        ftp_conn.retrbinary(f'RETR {feed_filename}', feed_file.write)
-        print('downloaded')
-
-    mytree = ET.parse(feed_filename)
-    myroot = mytree.getroot()
-    offers: ET.Element = myroot.find('shop').find('offers')
-
-    print(f'prices in feed: {len(offers)}')
+    feed_path = download_feed(ftp_conn, feed_filename, 'feeds2sber', fn)
 
     result = {
         'datetime': dt,
         'hit_link': f'https://ftp.puls.ru/feeds2sber/feeds/{feed_filename}',
-        'offers': offers,
+        'offers': iter_indexed_records(feed_path, iter_xml_offers, lambda offer: offer['id'], offer_ids),
     }
 
     return result
@@ -73,10 +677,9 @@ def get_sbermm_prices(campaign_id: str) -> dict:
     # os.remove(feed_file.name)
 
 
-def get_sbermm_stores(campaign_id: str) -> dict:
+def get_sbermm_stores(campaign_id: str, store_ids: Optional[Collection[str]] = None) -> dict:
     feed_filename = f'{campaign_id}.xml'
-    ftp_conn = FTP(HOST, USER, PASSWORD)
-    print('connected to ftp')
+    ftp_conn = get_ftp_connection(HOST, USER, PASSWORD)
 
     filenames_raw = get_filelist(ftp_conn, 'feeds')
 
@@ -90,36 +693,25 @@ def get_sbermm_stores(campaign_id: str) -> dict:
     dt = f'{fn[5]} {fn[6]} {fn[7]}'
     print(f'{filename_zip}\t{dt} - {naturalsize(fn[4])}')
 
-    with open(filename_zip, 'wb') as feed_file:
-        ftp_conn.retrbinary(f'RETR {filename_zip}', feed_file.write)
-        print('downloaded')
-
-    with ZipFile(filename_zip, 'r') as zp_file:
-        zp_file.extractall()
-        print('unzipped')
-        filename_json = filename_zip.replace('.zip', '.json')
-    os.remove(feed_file.name)
-
-    with open(filename_json) as js_file:
-        outlets = json.load(js_file).get('outlets', [])
-        print(len(outlets))
-    # os.remove(js_file.name)
-
-    print(f"stores in feed: {len(outlets)}")
+    feed_path = download_feed(ftp_conn, filename_zip, 'feeds2sber', fn)
 
     result = {
         'datetime': dt,
         'hit_link': f'https://ftp.puls.ru/feeds2sber/feeds/{filename_zip}',
-        'outlets': outlets,
+        'outlets': iter_indexed_records(
+            feed_path,
+            _iter_sbermm_outlets,
+            lambda outlet: outlet['identification']['id'],
+            store_ids,
+        ),
     }
 
     return result
 
 
-def get_sbermm_stocks(campaign_id: str) -> dict:
+def get_sbermm_stocks(campaign_id: str, offer_ids: Optional[Collection[str]] = None) -> dict:
     # feed_filename = f'{campaign_id}.xml'
-    ftp_conn = FTP(HOST, USER, PASSWORD)
-    print('connected to ftp')
+    ftp_conn = get_ftp_connection(HOST, USER, PASSWORD)
 
     filenames_raw = get_filelist(ftp_conn, 'feeds')
 
@@ -133,27 +725,47 @@ def get_sbermm_stocks(campaign_id: str) -> dict:
     dt = f'{fn[5]} {fn[6]} {fn[7]}'
     print(f'{filename_zip}\t{dt} - {naturalsize(fn[4])}')
 
-    with open(filename_zip, 'wb') as feed_file:
-        ftp_conn.retrbinary(f'RETR {filename_zip}', feed_file.write)
-        print('downloaded')
-
-    with ZipFile(filename_zip, 'r') as zp_file:
-        zp_file.extractall()
-        print('unzipped')
-        filename_json = filename_zip.replace('.zip', '.json')
-    os.remove(feed_file.name)
-
-    with open(filename_json) as js_file:
-        offers = next(ijson.items(js_file, 'outlets.item'))['offers']
-    # os.remove(js_file.name)
-
-    print(f"stocks in feed: {len(offers)}")
+    feed_path = download_feed(ftp_conn, filename_zip, 'feeds2sber', fn)
 
     result = {
         'datetime': dt,
         'hit_link': f'https://ftp.puls.ru/feeds2sber/feeds/{filename_zip}',
-        'offers': offers,
+        'offers': iter_indexed_records(feed_path, _iter_sbermm_offers, lambda offer: offer['offerId'], offer_ids),
+        'feed_path': feed_path,
     }
 
     return result
 
+
+def get_sbermm_stocks_changes(campaign_id: str, offer_ids: Optional[Collection[str]] = None) -> dict:
+    """Get offers changed since the previous version of sbermm stocks feed.
+
+    Previous version is known only if it was snapshotted by an earlier call.
+    """
+    feed = get_sbermm_stocks(campaign_id)
+    feed_path = feed['feed_path']
+
+    snapshot_path = save_feed_snapshot(
+        feed_path,
+        f'{campaign_id}_stocks_full',
+        _iter_sbermm_offers(feed_path),
+        lambda offer: offer['offerId'],
+        lambda offer: offer.get('price'),
+        lambda offer: offer.get('quantity'),
+    )
+    previous_snapshot_path = get_previous_snapshot(snapshot_path)
+
+    if previous_snapshot_path is None:
+        print('there is no previous version of the feed to compare with.')
+        changes = iter(())
+    else:
+        print(f'comparing with {previous_snapshot_path}')
+        changes = iter_feed_changes(previous_snapshot_path, snapshot_path, offer_ids)
+
+    result = {
+        'datetime': feed['datetime'],
+        'hit_link': feed['hit_link'],
+        'changes': changes,
+    }
+
+    return result
@@ -0,0 +1,153 @@
+"""Instrumentation of postgres and elasticsearch queries.
+
+Every executed query is recorded with its wall time, number of returned rows
+or hits and the parser method it was called from. What happens with records
+depends on ECOM_METRICS environment variable:
+    'jsonl' - every record is appended to d/metrics.jsonl as soon as it is done.
+    'summary' - a table aggregated by stage is printed at the end of the run.
+    '' - nothing, callers of queries are not even looked for (default).
+Only aggregated counters are kept in memory, so endless follow runs do not grow.
+"""
+
+import atexit
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Generator, Optional
+
+METRICS_MODE = os.environ.get('ECOM_METRICS', '')
+METRICS_FILE = os.path.join('d', 'metrics.jsonl')
+# share of postgres queries that are additionally run with EXPLAIN ANALYZE
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('POSTGRES_EXPLAIN_SAMPLE_RATE', 0))
+
+# (source, caller): counters of the stage
+_stages: dict[tuple[str, str], dict] = {}
+
+
+@dataclass
+class QueryRecord:
+    source: str  # 'postgres' or 'elastic'
+    caller: str
+    started_at: str
+    wall_ms: float = 0
+    rows: int = 0
+    bytes_received: int = 0
+    es_took_ms: Optional[int] = None
+    pg_planning_ms: Optional[float] = None
+    pg_execution_ms: Optional[float] = None
+    extra: dict = field(default_factory=dict)
+
+
+def get_caller() -> str:
+    """Find the nearest parser method (or script function) in the call stack.
+
+    Returns:
+        String like 'StocksMPParser.get_mp_stocks'.
+    """
+    # frames are walked lazily, inspect.stack() would read source lines of every frame
+    frame = sys._getframe(1)
+    while frame is not None:
+        module_name = frame.f_globals.get('__name__', '')
+        function_name = frame.f_code.co_name
+        if module_name.startswith('utils.') or module_name in (__name__, 'contextlib'):
+            frame = frame.f_back
+            continue
+
+        self_obj = frame.f_locals.get('self')
+        if self_obj is not None:
+            # the class where method is defined is more useful than the marketplace class
+            for cls in type(self_obj).__mro__:
+                if function_name in cls.__dict__:
+                    return f'{cls.__name__}.{function_name}'
+
+            return f'{type(self_obj).__name__}.{function_name}'
+
+        return f'{module_name}.{function_name}'
+
+    return 'unknown'
+
+
+def should_explain() -> bool:
+    """Decide if current postgres query should be sampled with EXPLAIN ANALYZE."""
+    return EXPLAIN_SAMPLE_RATE > 0 and random.random() < EXPLAIN_SAMPLE_RATE
+
+
+def add_record(record: QueryRecord) -> None:
+    """Add finished query record to counters of its stage and write it down if jsonl mode is on."""
+    stage = _stages.setdefault((record.source, record.caller), {
+        'queries': 0, 'wall_ms': 0, 'rows': 0, 'bytes': 0, 'es_took_ms': 0, 'pg_execution_ms': 0,
+    })
+    stage['queries'] += 1
+    stage['wall_ms'] += record.wall_ms
+    stage['rows'] += record.rows
+    stage['bytes'] += record.bytes_received
+    stage['es_took_ms'] += record.es_took_ms or 0
+    stage['pg_execution_ms'] += record.pg_execution_ms or 0
+
+    if METRICS_MODE == 'jsonl':
+        with open(METRICS_FILE, 'a', encoding='utf-8') as metrics_file:
+            metrics_file.write(json.dumps(asdict(record), ensure_ascii=False, default=str) + '\n')
+
+
+@contextmanager
+def measure(source: str, **extra) -> Generator[QueryRecord, None, None]:
+    """Measure wall time of the block. Caller fills rows, bytes and timings of the record.
+
+    Args:
+        source: 'postgres' or 'elastic'.
+        extra: any additional labels, i.e. index name.
+    Yields:
+        Record that will be saved when the block is finished. It is filled but
+        not saved if metrics are off.
+    """
+    if not METRICS_MODE:
+        yield QueryRecord(source=source, caller='', started_at='', extra=extra)
+        return
+
+    record = QueryRecord(
+        source=source,
+        caller=get_caller(),
+        started_at=datetime.now().isoformat(),
+        extra=extra,
+    )
+    started = time.perf_counter()
+
+    try:
+        yield record
+    finally:
+        record.wall_ms = round((time.perf_counter() - started) * 1000, 1)
+        add_record(record)
+
+
+def get_stages() -> dict[tuple[str, str], dict]:
+    """Get counters of the current run by source and caller."""
+    return {key: dict(stage) for key, stage in _stages.items()}
+
+
+def print_summary() -> None:
+    """Print records aggregated by source and caller."""
+    if not _stages:
+        return
+
+    header = (
+        f'{"source":<9}{"caller":<45}{"queries":>8}{"wall ms":>11}'
+        f'{"rows":>10}{"bytes":>12}{"es took":>9}{"pg exec":>9}'
+    )
+    print('\n' 'queries summary:')
+    print(header)
+    print('-' * len(header))
+
+    for (source, caller), stage in sorted(_stages.items(), key=lambda s: -s[1]['wall_ms']):
+        print(
+            f'{source:<9}{caller[:44]:<45}{stage["queries"]:>8}{stage["wall_ms"]:>11.0f}'
+            f'{stage["rows"]:>10}{stage["bytes"]:>12}{stage["es_took_ms"]:>9}{stage["pg_execution_ms"]:>9.0f}'
+        )
+
+
+if METRICS_MODE == 'summary':
+    atexit.register(print_summary)
@@ -2,20 +2,49 @@
 
 """Functions getting data from postgresql database go here."""
 
+import copy
+import fcntl
+import io
+import json
 import os
+import socket
 import sys
 from contextlib import contextmanager
-from typing import Generator, Union
+from dataclasses import dataclass
+from typing import Generator, Iterable, Optional, Union
 from uuid import UUID
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Result
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, Result, Row
 from sqlalchemy.orm import Session, sessionmaker
 from sshtunnel import BaseSSHTunnelForwarderError, SSHTunnelForwarder
 
+from utils.ecom_metrics import measure, should_explain
+from utils.other import CACHE_DIR
+
 load_dotenv()
 
+# how many rows are fetched from a server side cursor at once
+POSTGRES_FETCH_SIZE = int(os.environ.get('POSTGRES_FETCH_SIZE', 1000))
+# bigger sets of guids are copied into a temp table instead of an IN (...) list
+BULK_GUIDS_THRESHOLD = int(os.environ.get('POSTGRES_BULK_GUIDS_THRESHOLD', 1000))
+
+# ssh tunnel started by one script is registered here and reused by others
+TUNNEL_CACHE_DIR = CACHE_DIR
+TUNNEL_LOCK_FILE = os.path.join(TUNNEL_CACHE_DIR, 'ssh_tunnel.lock')
+TUNNEL_STATE_FILE = os.path.join(TUNNEL_CACHE_DIR, 'ssh_tunnel.json')
+SSH_KEEPALIVE = float(os.environ.get('SSH_KEEPALIVE', 30))
+
+# connection pool settings
+POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE', 5))
+POSTGRES_MAX_OVERFLOW = int(os.environ.get('POSTGRES_MAX_OVERFLOW', 5))
+POSTGRES_POOL_RECYCLE = int(os.environ.get('POSTGRES_POOL_RECYCLE', 1800))
+
+_engines: dict[str, Engine] = {}
+# get_parser_context results by its arguments
+_parser_contexts: dict[tuple, tuple[dict, dict, dict]] = {}
+
 # there is no straight and unambiguous way to determine region code
 # of organization from database at this moment (2022.06.18)
 org_names_region_codes = {
@@ -36,10 +65,71 @@ org_names_region_codes = {
 }
 
 
+@dataclass
+class SharedSSHTunnel:
+    """Ssh tunnel started by another process. Only the port is needed to use it."""
+
+    local_bind_port: int
+    owner_pid: int
+
+
+def _is_tunnel_alive(pid: int, port: int) -> bool:
+    """Check if the process that owns the tunnel is running and the port accepts connections."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def _get_shared_tunnel() -> Union[SharedSSHTunnel, None]:
+    """Get registered ssh tunnel if it is still alive."""
+    try:
+        with open(TUNNEL_STATE_FILE) as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+    if not _is_tunnel_alive(state['pid'], state['port']):
+        return None
+
+    return SharedSSHTunnel(local_bind_port=state['port'], owner_pid=state['pid'])
+
+
+def _register_tunnel(port: int) -> None:
+    """Save port and pid of the tunnel started by this process."""
+    with open(TUNNEL_STATE_FILE, 'w') as state_file:
+        json.dump({'pid': os.getpid(), 'port': port}, state_file)
+
+
+def _unregister_tunnel() -> None:
+    """Remove tunnel state if it was registered by this process."""
+    try:
+        with open(TUNNEL_STATE_FILE) as state_file:
+            state = json.load(state_file)
+        if state['pid'] == os.getpid():
+            os.remove(TUNNEL_STATE_FILE)
+    except (OSError, ValueError):
+        pass
+
+
 @contextmanager
-def get_ssh_tunnel() -> Generator[SSHTunnelForwarder, None, None]:
+def get_ssh_tunnel(share: bool = False) -> Generator[Union[SSHTunnelForwarder, SharedSSHTunnel], None, None]:
     """Get ssh credentials and postgres db ip and create connection.
 
+    If a shared tunnel is running it is reused instead of negotiating a new ssh
+    connection. Run ssh_tunnel.py to keep one tunnel open for a whole working session.
+
+    Args:
+        share: register a new tunnel so other scripts reuse it. Only long running
+            processes should share their tunnels, the tunnel is closed when the owner exits.
     Yields:
         Connected ssh tunnel.
     """
@@ -51,29 +141,66 @@ def get_ssh_tunnel() -> Generator[SSHTunnelForwarder, None, None]:
     pg_host = os.environ['POSTGRES_HOST']
     pg_port = int(os.environ['POSTGRES_PORT'])
 
-    ssh_tunnel = SSHTunnelForwarder(
-        (ssh_host, ssh_port),
-        ssh_username = ssh_username,
-        ssh_password = ssh_password,
-        remote_bind_address=(pg_host, pg_port),
-        allow_agent=False
-    )
+    os.makedirs(TUNNEL_CACHE_DIR, exist_ok=True)
 
-    try:
-        ssh_tunnel.start()
-    except BaseSSHTunnelForwarderError:
-        print('could not connect to ssh')
-        sys.exit(0)
+    # lock prevents parallel scripts from starting few tunnels at the same time
+    with open(TUNNEL_LOCK_FILE, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        shared_tunnel = _get_shared_tunnel()
+
+        if shared_tunnel is None:
+            ssh_tunnel = SSHTunnelForwarder(
+                (ssh_host, ssh_port),
+                ssh_username = ssh_username,
+                ssh_password = ssh_password,
+                remote_bind_address=(pg_host, pg_port),
+                allow_agent=False,
+                set_keepalive=SSH_KEEPALIVE,
+            )
+
+            try:
+                ssh_tunnel.start()
+            except BaseSSHTunnelForwarderError:
+                print('could not connect to ssh')
+                sys.exit(0)
+
+            if share:
+                _register_tunnel(ssh_tunnel.local_bind_port)
+
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    if shared_tunnel is not None:
+        print(f'reusing ssh tunnel of process {shared_tunnel.owner_pid}')
+        yield shared_tunnel
+        return
 
     print('connected to ssh')
 
-    yield ssh_tunnel
+    try:
+        yield ssh_tunnel
+    finally:
+        if share:
+            _unregister_tunnel()
+        ssh_tunnel.close()
+
+
+def _get_engine(url: str) -> Engine:
+    """Get engine with connection pool. Engines are created once per process."""
+    if url not in _engines:
+        _engines[url] = create_engine(
+            url,
+            pool_size=POSTGRES_POOL_SIZE,
+            max_overflow=POSTGRES_MAX_OVERFLOW,
+            pool_recycle=POSTGRES_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
 
-    ssh_tunnel.close()
+    return _engines[url]
 
 
 @contextmanager
-def get_postgres_session(ssh_tunnel: SSHTunnelForwarder) -> Generator[Session, None, None]:
+def get_postgres_session(ssh_tunnel: Union[SSHTunnelForwarder, SharedSSHTunnel]) -> Generator[Session, None, None]:
     """Get db credentials, connects to the db and returns.
 
     Args:
@@ -90,7 +217,7 @@ def get_postgres_session(ssh_tunnel: SSHTunnelForwarder) -> Generator[Session, N
 
     # connect to PostgreSQL
     db_port = str(ssh_tunnel.local_bind_port)
-    engine = create_engine(f'postgresql://{db_username}:{db_password}@{db_host}:{db_port}/{db_name}')
+    engine = _get_engine(f'postgresql://{db_username}:{db_password}@{db_host}:{db_port}/{db_name}')
 
     Session = sessionmaker(bind=engine)
     try:
@@ -115,12 +242,132 @@ def execute_query(pg_session: Session, query: str) -> Result:
     Returns:
         Data got from postgresql database.
     """
-    query_result = pg_session.execute(query)
+    plan_timings = _explain_query(pg_session, query) if should_explain() else (None, None)
+
+    with measure('postgres') as record:
+        record.pg_planning_ms, record.pg_execution_ms = plan_timings
+        query_result = pg_session.execute(query)
+        record.rows = max(query_result.rowcount, 0)
+
     print('executed sql query')
 
     return query_result
 
 
+def stream_query(
+    pg_session: Session,
+    query: str,
+    fetch_size: int = POSTGRES_FETCH_SIZE,
+) -> Generator[Row, None, None]:
+    """Streaming version of execute_query. Rows are read from a named server side
+    cursor by batches so the whole result is never kept in memory.
+
+    Args:
+        pg_session: Postgresql session.
+        query: string with sql query.
+        fetch_size: number of rows fetched from the server at once.
+    Yields:
+        Rows got from postgresql database.
+    """
+    plan_timings = _explain_query(pg_session, query) if should_explain() else (None, None)
+
+    # wall time includes processing of rows by the caller because they overlap
+    with measure('postgres', streaming=True) as record:
+        record.pg_planning_ms, record.pg_execution_ms = plan_timings
+        query_result = pg_session.execute(
+            text(query),
+            execution_options={'stream_results': True, 'max_row_buffer': fetch_size},
+        )
+        print('executed sql query (streaming)')
+
+        try:
+            for partition in query_result.partitions(fetch_size):
+                record.rows += len(partition)
+                yield from partition
+        finally:
+            query_result.close()
+
+
+def _explain_query(pg_session: Session, query: str) -> tuple[Optional[float], Optional[float]]:
+    """Run query with EXPLAIN ANALYZE to get its planning and execution time.
+
+    Args:
+        pg_session: Postgresql session.
+        query: string with sql query. Only SELECT queries are explained.
+    Returns:
+        Planning and execution time in milliseconds.
+    """
+    if not query.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return (None, None)
+
+    plan = pg_session.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {query}')).scalar()
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+
+    return (plan.get('Planning Time'), plan.get('Execution Time'))
+
+
+def copy_guids_to_temp_table(pg_session: Session, guids: list[str], table_name: str = 'tmp_guids') -> str:
+    """Copy passed guids into a session temp table with COPY.
+
+    Column type is text, so the table can be compared with columns of any type
+    casted to text. Valid uuids are also copied in lowercase because that is
+    how postgres casts uuid to text.
+
+    Args:
+        pg_session: Postgresql session.
+        guids: values that will be copied.
+        table_name: name of the temp table. It is recreated on every call.
+    Returns:
+        Name of the created temp table.
+    """
+    values = set(guids)
+    for guid in guids:
+        try:
+            values.add(str(UUID(guid)))
+        except ValueError:
+            pass
+
+    pg_session.execute(text(f'DROP TABLE IF EXISTS {table_name}'))
+    pg_session.execute(text(f'CREATE TEMP TABLE {table_name} (guid text PRIMARY KEY)'))
+
+    # COPY is only available in the raw psycopg2 cursor
+    cursor = pg_session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table_name} (guid) FROM STDIN', io.StringIO('\n'.join(sorted(values))))
+    cursor.close()
+
+    pg_session.execute(text(f'ANALYZE {table_name}'))
+    print(f'copied {len(guids)} guids to {table_name}')
+
+    return table_name
+
+
+def get_guids_filter(pg_session: Session, column: str, guids: Iterable, table_name: str = 'tmp_guids') -> str:
+    """Get sql condition 'column IN guids'.
+
+    Small sets are rendered as a list of literals, postgres casts them to the
+    column type. Sets bigger than BULK_GUIDS_THRESHOLD are copied into a temp
+    table and the column is casted to text, so the database resolves them with
+    a single join whatever the column type is.
+
+    Args:
+        pg_session: Postgresql session.
+        column: column or expression to filter, i.e. 'org_price.guid'.
+        guids: guids, codes or other identifiers.
+        table_name: temp table name. Different names are needed for several filters in one query.
+    Returns:
+        String like "org_price.guid IN ('a', 'b')" or "org_price.guid::text IN (SELECT guid FROM tmp_guids)".
+    """
+    guids = sorted({str(guid) for guid in guids})
+
+    if len(guids) > BULK_GUIDS_THRESHOLD:
+        table_name = copy_guids_to_temp_table(pg_session, guids, table_name)
+        if not column.endswith('::text'):
+            column += '::text'
+        return f'{column} IN (SELECT guid FROM {table_name})'
+
+    return f"{column} IN ('" + "\', \'".join(guids) + "')"
+
+
 def get_prices_data(
     pg_session: Session,
     marketplace: str,
@@ -135,7 +382,7 @@ def get_prices_data(
     Returns:
         Prices with related price type and org name.
     """
-    price_guids_str = "('" + "\', \'".join(price_guids) + "')"
+    price_guids_filter = get_guids_filter(pg_session, 'org_price.guid', price_guids)
 
     query_text = f"""
     SELECT
@@ -145,7 +392,7 @@ def get_prices_data(
     FROM price_organizationprice org_price
         INNER JOIN core_organization org
             ON org_price.organization_id = org.id
-            AND org_price.guid IN {price_guids_str}
+            AND {price_guids_filter}
             AND org.name IS NOT NULL
         INNER JOIN marketplace_marketplace mp
             ON org_price.marketplace_id = mp.id
@@ -154,7 +401,7 @@ def get_prices_data(
             AND user_.username = '{marketplace}'
     """
 
-    query_result = execute_query(pg_session, query_text)
+    query_result = stream_query(pg_session, query_text)
 
     price_org_dict = {}
     for row in query_result:
@@ -204,7 +451,7 @@ def get_related_products(
         product_fields.guid
     """
 
-    query_result = execute_query(pg_session, query_text)
+    query_result = stream_query(pg_session, query_text)
 
     related_products = [original_product_guid,]  # may be missing in query_result
     for row in query_result:
@@ -349,6 +596,120 @@ def get_product_data(pg_session: Session, identifier: str) -> dict:
     return product_data
 
 
+def _split_guids(identifiers: Iterable[str]) -> tuple[set[str], set[str]]:
+    """Split identifiers into valid uuids and everything else (codes, ids)."""
+    guids, others = set(), set()
+    for identifier in identifiers:
+        try:
+            UUID(identifier)
+            guids.add(identifier.lower())
+        except ValueError:
+            others.add(identifier)
+
+    return guids, others
+
+
+def get_products_data(pg_session: Session, identifiers: Iterable[str]) -> dict[str, dict]:
+    """Bulk version of get_product_data. All products are resolved by one query.
+
+    Args:
+        pg_session: Postgresql session.
+        identifiers: product guids and codes.
+    Returns:
+        Dict with product guids as keys and dicts with guid and code as values.
+    """
+    guids, codes = _split_guids(identifiers)
+
+    conditions = []
+    if guids:
+        conditions.append(get_guids_filter(pg_session, 'org_price.guid', guids, 'tmp_product_guids'))
+    if codes:
+        conditions.append(get_guids_filter(pg_session, 'org_price.code::text', codes, 'tmp_product_codes'))
+    if not conditions:
+        return {}
+
+    query_text = f"""
+    SELECT DISTINCT
+        org_price.guid,
+        org_price.code
+    FROM product_organizationproduct org_price
+    WHERE
+        {' OR '.join(conditions)}
+    """
+
+    products_data = {}
+    for row in stream_query(pg_session, query_text):
+        product_guid = str(row[0])
+        products_data[product_guid] = {'guid': product_guid, 'code': str(row[1])}
+
+    found = set(products_data.keys()) | {product['code'] for product in products_data.values()}
+    not_found = (guids | codes) - found
+    print(f'products found: {len(products_data)}, not found: {len(not_found)}')
+    if not_found:
+        print(f'not found products: {sorted(not_found)}')
+
+    return products_data
+
+
+def get_stores_data(pg_session: Session, identifiers: Iterable[str]) -> dict[str, dict]:
+    """Bulk version of get_store_data. All stores are resolved by one query.
+
+    Args:
+        pg_session: Postgresql session.
+        identifiers: store guids, ids or yandex outlet ids.
+    Returns:
+        Dict with store guids as keys and dicts like get_store_data returns as values.
+    """
+    guids, codes = _split_guids(identifiers)
+
+    conditions = []
+    if guids:
+        conditions.append(get_guids_filter(pg_session, 'org_address.address_guid', guids, 'tmp_store_guids'))
+    if codes:
+        conditions.append(get_guids_filter(pg_session, 'org_address.address_id::text', codes, 'tmp_store_ids'))
+        conditions.append(get_guids_filter(pg_session, 'org_address.outlet_id::text', codes, 'tmp_store_outlets'))
+    if not conditions:
+        return {}
+
+    # marketplace with id = 12 is broken
+    query_text = f"""
+    SELECT DISTINCT ON (org_address.address_guid)
+        org_address.address_guid,
+        org_address.address_id,
+        org_address.outlet_id,
+        org.name
+    FROM delivery_organizationaddress org_address
+        INNER JOIN core_organization org
+            ON org_address.organization_id = org.id
+            AND not org_address.marketplace_id = 12
+    WHERE
+        {' OR '.join(conditions)}
+    ORDER BY
+        org_address.address_guid,
+        org_address.outlet_id
+    """
+
+    stores_data = {}
+    for row in stream_query(pg_session, query_text):
+        store_guid = str(row[0])
+        stores_data[store_guid] = {
+            'guid': store_guid,
+            'id': row[1],
+            'outlet': str(row[2]) if row[2] is not None else '',
+            'org_name': row[3],
+        }
+
+    found = set()
+    for store in stores_data.values():
+        found.update((store['guid'], store['id'], store['outlet']))
+    not_found = (guids | codes) - found
+    print(f'stores found: {len(stores_data)}, not found: {len(not_found)}')
+    if not_found:
+        print(f'not found stores: {sorted(not_found)}')
+
+    return stores_data
+
+
 def get_store_data(pg_session: Session, identifier: str) -> dict:
     """Enrich store data by guid, id, outlet number.
 
@@ -643,7 +1004,7 @@ def get_organization_regions(pg_session: Session, org_name: str) -> tuple[int]:
         region.code
     """
 
-    query_result = execute_query(pg_session, query_text)
+    query_result = stream_query(pg_session, query_text)
 
     region_codes = []
     for row in query_result:
@@ -653,6 +1014,33 @@ def get_organization_regions(pg_session: Session, org_name: str) -> tuple[int]:
     return region_codes
 
 
+def get_organization_price_guids(pg_session: Session, marketplace: str, org_id: int) -> tuple[str, ...]:
+    """Get guids of price types of the organization configured for the marketplace.
+
+    Args:
+        pg_session: Postgresql session.
+        marketplace: MP name.
+        org_id: organization id.
+    Returns:
+        Price guids.
+    """
+    query_text = f"""
+    SELECT DISTINCT
+        org_price.guid
+    FROM price_organizationprice org_price
+        INNER JOIN marketplace_marketplace mp
+            ON org_price.marketplace_id = mp.id
+            AND org_price.organization_id = {org_id}
+        INNER JOIN users_user user_
+            ON mp.api_user_id = user_.id
+            AND user_.username = '{marketplace}'
+    """
+
+    query_result = stream_query(pg_session, query_text)
+
+    return tuple(str(row[0]) for row in query_result)
+
+
 def get_price_settings(
     pg_session: Session,
     marketplace: str,
@@ -708,7 +1096,7 @@ def get_price_settings(
         actual_prices.date_at
     """
 
-    query_result = execute_query(pg_session, query_text)
+    query_result = stream_query(pg_session, query_text)
     # we get pricelists for few days sorted by date and rewrite earlier keys values by newer keys values
     # until we get only latest pricelists.
     prices_settings_dict = {}
@@ -720,6 +1108,244 @@ def get_price_settings(
     return prices_settings_dict
 
 
+def _resolve_org_name(identifier: Union[str, int]) -> tuple[str, str]:
+    """Resolve organization identifier without database if it is possible.
+
+    Args:
+        identifier: organization's main region, partial or full name or yandex campaign id.
+    Returns:
+        Tuple with full organization name and campaign id. One of them is always empty.
+    """
+    if not identifier:
+        return ('', '')
+
+    try:
+        # if code passed as a string
+        identifier = int(identifier)
+    except ValueError:
+        pass
+
+    if isinstance(identifier, int):
+        region_codes_org_names = {v: k for k, v in org_names_region_codes.items()}
+        if region_codes_org_names.get(identifier) is not None:
+            return (region_codes_org_names[identifier], '')
+
+        # not a region code so it can only be a campaign id
+        return ('', str(identifier))
+
+    for key in org_names_region_codes.keys():
+        if key.lower().find(identifier.lower()) != -1:
+            return (key, '')
+
+    raise Exception(f'Could not find organization by {identifier}')
+
+
+def get_parser_context(
+    pg_session: Session,
+    org_identifier: Union[str, int],
+    store_identifier: str = '',
+    product_identifier: str = '',
+) -> tuple[dict, dict, dict]:
+    """Get store, organization and product data with a single query.
+
+    Does the same as get_store_data, get_organization_data and get_product_data
+    together but in one database round trip instead of up to ten.
+
+    Args:
+        pg_session: Postgresql session.
+        org_identifier: organization's main region, partial or full name or yandex campaign id.
+    Can be empty if store_identifier is passed.
+        store_identifier: store id, guid or yandex outlet id.
+        product_identifier: product code or guid.
+    Returns:
+        Tuple with store, organization and product data dicts.
+    Raises:
+        Exception: if store, organization or product could not be found.
+    """
+    # parsers of different marketplaces with the same filters share the context, i.e. in fleet mode
+    cache_key = (org_identifier, store_identifier, product_identifier)
+    if cache_key in _parser_contexts:
+        return copy.deepcopy(_parser_contexts[cache_key])
+
+    org_name, campaign_id = _resolve_org_name(org_identifier)
+    org_name_sql = f"'{org_name}'" if org_name else 'NULL'
+
+    store_guid = ''
+    if store_identifier:
+        try:
+            UUID(store_identifier)
+            store_guid = store_identifier.lower()
+        except ValueError:
+            pass
+
+    # marketplace with id = 12 is broken
+    # remember that multitoken price_type is text atm. it can be changed
+    # by ecom developers -_-_-
+    query_text = f"""
+    WITH store_ AS (
+        SELECT
+            org_address.address_guid,
+            org_address.address_id,
+            org_address.outlet_id,
+            org.name org_name
+        FROM delivery_organizationaddress org_address
+            INNER JOIN core_organization org
+                ON org_address.organization_id = org.id
+                AND not org_address.marketplace_id = 12
+        WHERE
+            '{store_identifier}' != ''
+            AND (
+                org_address.address_guid::text = '{store_guid}'
+                OR org_address.address_id = '{store_identifier}'
+                OR org_address.outlet_id::text = '{store_identifier}'
+            )
+        ORDER BY
+            org_address.outlet_id
+        LIMIT 1
+    ),
+    campaign_org AS (
+        SELECT
+            org.name
+        FROM marketplace_marketplaceapisettings mp_settings
+            INNER JOIN price_organizationprice org_price
+                ON mp_settings.price_type = org_price.guid
+                AND mp_settings.campaign_id = '{campaign_id}'
+                AND '{campaign_id}' != ''
+            INNER JOIN core_organization org
+                ON org_price.organization_id = org.id
+        LIMIT 1
+    ),
+    org_ AS (
+        SELECT
+            org.id,
+            org.name,
+            org.endpoint
+        FROM core_organization org
+        WHERE
+            org.name = COALESCE(
+                {org_name_sql},
+                (SELECT name FROM campaign_org),
+                (SELECT org_name FROM store_)
+            )
+        LIMIT 1
+    ),
+    mp_settings_ AS (
+        SELECT
+            user_.username,
+            mp_settings.campaign_id,
+            token_.metadata
+        FROM marketplace_marketplaceapisettings mp_settings
+            INNER JOIN price_organizationprice org_price
+                ON mp_settings.price_type = org_price.guid
+                AND mp_settings.campaign_id IS NOT NULL
+                AND org_price.organization_id = (SELECT id FROM org_)
+            INNER JOIN marketplace_marketplace mp
+                ON mp_settings.marketplace_id = mp.id
+            INNER JOIN users_user user_
+                ON mp.api_user_id = user_.id
+                AND user_.username IN ('yandexdbs', 'sbermm')
+            LEFT JOIN multitoken_multitoken token_
+                ON user_.id = token_.user_id
+                AND mp_settings.price_type::text = token_.price_type::text
+    ),
+    regions_ AS (
+        SELECT
+            array_agg(DISTINCT region.code ORDER BY region.code) codes
+        FROM address_region region
+            INNER JOIN delivery_organizationaddress org_address
+                ON region.name = org_address.region
+                AND region IS NOT NULL
+                AND org_address.organization_id = (SELECT id FROM org_)
+    ),
+    product_ AS (
+        SELECT
+            org_product.guid,
+            org_product.code
+        FROM product_organizationproduct org_product
+        WHERE
+            '{product_identifier}' != ''
+            AND (
+                org_product.guid::text = lower('{product_identifier}')
+                OR org_product.code::text = '{product_identifier}'
+            )
+        LIMIT 1
+    )
+    SELECT
+        (SELECT address_guid FROM store_),
+        (SELECT address_id FROM store_),
+        (SELECT outlet_id FROM store_),
+        (SELECT org_name FROM store_),
+        (SELECT id FROM org_),
+        (SELECT name FROM org_),
+        (SELECT endpoint FROM org_),
+        (SELECT campaign_id FROM mp_settings_ WHERE username = 'yandexdbs' LIMIT 1),
+        (SELECT metadata FROM mp_settings_ WHERE username = 'yandexdbs' LIMIT 1),
+        (SELECT campaign_id FROM mp_settings_ WHERE username = 'sbermm' LIMIT 1),
+        (SELECT codes FROM regions_),
+        (SELECT guid FROM product_),
+        (SELECT code FROM product_)
+    """
+
+    row = next(execute_query(pg_session, query_text))
+
+    store_data = {}
+    if store_identifier:
+        if row[0] is None:
+            raise Exception(f'Could not find organization by {store_identifier}')
+
+        store_data['guid'] = str(row[0])
+        store_data['id'] = row[1]
+        store_data['outlet'] = str(row[2]) if row[2] is not None else ''
+        store_data['org_name'] = row[3]
+        store_data['region_code'] = org_names_region_codes.get(store_data['org_name'], 0)
+
+        print('outlet id: ' + store_data['outlet'])
+
+    org_data = {}
+    if org_identifier or store_identifier:
+        if row[5] is None or row[5] not in org_names_region_codes:
+            raise Exception(f'Could not find organization by {org_identifier or store_identifier}')
+
+        org_data['org_name'] = row[5]
+        org_data['org_region_code'] = org_names_region_codes[row[5]]
+        org_data['endpoint'] = row[6]
+        org_data['org_id'] = row[4]
+        org_data['campaign_id'] = row[7]
+        org_data['org_name_latin'] = row[8]
+        org_data['related_region_codes'] = tuple(int(code) for code in row[10] or [])
+        org_data['sbermm_campaign_id'] = row[9]
+
+        print('\n' + 'getting organization data...')
+        print('organization:\t\t ' + org_data['org_name'])
+        print('endpoint:\t\t ' + str(org_data['endpoint']))
+        print('region code:\t\t ' + str(org_data['org_region_code']))
+        print('related region codes:\t ' + str(org_data['related_region_codes']))
+        print('yandex campaign id:\t ' + str(org_data['campaign_id']))
+        print('sbermm_campaign_id:\t ' + str(org_data['sbermm_campaign_id']))
+        print('latin organization name: ' + str(org_data['org_name_latin']))
+
+    product_data = {}
+    if product_identifier:
+        if row[11] is None:
+            raise Exception(f'Could not find product by {product_identifier}')
+
+        # keep the same keys order as get_product_data does
+        try:
+            UUID(product_identifier)
+            product_data['guid'] = product_identifier
+            product_data['code'] = str(row[12])
+        except ValueError:
+            product_data['code'] = product_identifier
+            product_data['guid'] = str(row[11])
+
+        print(f'product identifiers: {product_data.values()}')
+
+    _parser_contexts[cache_key] = (store_data, org_data, product_data)
+
+    # callers modify returned dicts
+    return copy.deepcopy(_parser_contexts[cache_key])
+
+
 if __name__ == '__main__':
     print('testing postgres connect')
 
@@ -0,0 +1,627 @@
+"""Reconciliation of data received from 1C with data sent to marketplaces.
+
+Records of both sides are split into columns per (product, organization, ...) key
+once and then every marketplace record is matched with the 1C value that was
+actual at its moment (as-of join) by binary search, so the work is O(n log n)
+and does not depend on how records of the two sides interleave.
+
+LatencyAnalyzer measures delays between 1C and marketplace values incrementally
+over chronologically sorted batches.
+"""
+
+import heapq
+import os
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Generator, Iterable, Optional
+
+from utils.ecom_dataclasses import Base, Price1C, PriceBase, StockBase
+
+# how long after the next 1C value the previous one still may be pushed to mp
+PUSH_GRACE_SECONDS = float(os.environ.get('RECONCILE_PUSH_GRACE_SECONDS', 60))
+# prices pushed later than that after they came from 1C are reported as delayed
+PRICE_DELAY_SECONDS = float(os.environ.get('RECONCILE_PRICE_DELAY_SECONDS', 600))
+
+
+@dataclass
+class StockDiscrepancy:
+    kind: str  # 'quantity mismatch', 'stale' or 'not pushed'
+    datetime: datetime
+    org_name: str = ''
+    product_identifier: str = ''
+    expiration_date: str = ''
+    price_guid: str = ''
+    region: str = ''
+    quantity_1c: Optional[float] = None
+    quantity_mp: Optional[float] = None
+    datetime_1c: Optional[datetime] = None
+    hit_link_1c: str = ''
+    hit_link_mp: str = ''
+
+
+@dataclass
+class PriceDiscrepancy:
+    kind: str  # 'price mismatch', 'stale', 'delayed' or 'no 1c price'
+    datetime: datetime
+    org_name: str = ''
+    product_identifier: str = ''
+    price_guid: str = ''
+    price_mp: Optional[float] = None
+    price_inc_vat_1c: Optional[float] = None
+    price_promo_1c: Optional[float] = None
+    b2c_used: Optional[bool] = None
+    datetime_1c: Optional[datetime] = None
+    delay_seconds: Optional[float] = None
+    hit_link_1c: str = ''
+    hit_link_mp: str = ''
+
+
+class _Columns:
+    """Records of one key, i.e. (product, organization, expiration date), split into sorted columns."""
+
+    def __init__(self, records: list[Base], get_value: Callable[[Base], Any]) -> None:
+        records.sort(key=lambda r: r.datetime)
+        self.records = records
+        self.times = [record.datetime.timestamp() for record in records]
+        self.values = [get_value(record) for record in records]
+
+
+def _to_number(quantity) -> Optional[float]:
+    """1C sends quantities as floats or strings, marketplaces as ints."""
+    try:
+        return float(quantity)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_quantity(stock: StockBase) -> Optional[float]:
+    return _to_number(stock.quantity)
+
+
+def _group_by_key(
+    records: Iterable[Base],
+    get_key: Callable[[Base], tuple],
+    get_value: Callable[[Base], Any],
+) -> dict[tuple, _Columns]:
+    groups = {}
+    for record in records:
+        groups.setdefault(get_key(record), []).append(record)
+
+    return {key: _Columns(key_records, get_value) for key, key_records in groups.items()}
+
+
+def _get_stock_key_getter(product_aliases: Optional[dict[str, str]]) -> Callable[[StockBase], tuple]:
+    """Stocks are compared per product, organization and expiration date.
+
+    Mp stocks are also split by price guid and region: 1C sends one stock for the
+    organization while mp gets it for every region or price type of the organization.
+    """
+    product_aliases = product_aliases or {}
+
+    def get_key(stock: StockBase) -> tuple[str, ...]:
+        key = (
+            product_aliases.get(stock.product_identifier, stock.product_identifier),
+            stock.org_name,
+            stock.expiration_date or '',
+        )
+        if stock.direction.startswith('->'):
+            return key
+
+        return key + (str(getattr(stock, 'price_guid', '')), str(getattr(stock, 'region', '')))
+
+    return get_key
+
+
+def reconcile_stocks(
+    stocks_1c: Iterable[StockBase],
+    stocks_mp: Iterable[StockBase],
+    product_aliases: Optional[dict[str, str]] = None,
+) -> Generator[StockDiscrepancy, None, None]:
+    """Compare stocks sent to marketplace with stocks received from 1C and yield only discrepancies.
+
+    Every mp record is compared with the latest 1C record of the same product,
+    organization and expiration date (1C sends one row per batch) received before it.
+    Mp records of every price guid and region are compared separately:
+        'quantity mismatch' - mp quantity is not equal to any 1C quantity received before.
+        'stale' - mp quantity is equal to one of older 1C quantities.
+    Every 1C value is looked for in mp records sent after it and before the next
+    different 1C value (plus PUSH_GRACE_SECONDS):
+        'not pushed' - there is no such mp record.
+    Mp records sent before the first 1C record and 1C records received after the last
+    mp record can not be judged and are skipped.
+
+    Args:
+        stocks_1c: records with direction '->e  '.
+        stocks_mp: records with direction '  e->'.
+        product_aliases: maps mp product identifiers (i.e. codes) to 1C product guids.
+    Yields:
+        Discrepancies grouped by product, organization, expiration date, price guid and region.
+    """
+    get_key = _get_stock_key_getter(product_aliases)
+    groups_1c = _group_by_key(stocks_1c, get_key, _get_quantity)
+    groups_mp = _group_by_key(stocks_mp, get_key, _get_quantity)
+
+    discrepancies_count = 0
+    for key in sorted(groups_mp.keys(), key=str):
+        columns_1c = groups_1c.get(key[:3])
+        columns_mp = groups_mp[key]
+        if columns_1c is None:
+            continue
+
+        for discrepancy in _reconcile_key(key, columns_1c, columns_mp):
+            yield discrepancy
+            discrepancies_count += 1
+
+    print(f'discrepancies: {discrepancies_count}')
+
+
+def _reconcile_key(
+    key: tuple[str, str, str, str, str],
+    columns_1c: _Columns,
+    columns_mp: _Columns,
+) -> Generator[StockDiscrepancy, None, None]:
+    product, org_name, expiration_date, price_guid, region = key
+
+    # index of the first 1C record where each quantity has appeared
+    first_seen = {}
+    for index, quantity in enumerate(columns_1c.values):
+        first_seen.setdefault(quantity, index)
+
+    for mp_index, mp_time in enumerate(columns_mp.times):
+        index_1c = bisect_right(columns_1c.times, mp_time) - 1
+        if index_1c < 0:
+            continue
+
+        quantity_1c = columns_1c.values[index_1c]
+        quantity_mp = columns_mp.values[mp_index]
+        if quantity_mp == quantity_1c:
+            continue
+
+        kind = 'stale' if first_seen.get(quantity_mp, index_1c) < index_1c else 'quantity mismatch'
+        record_1c = columns_1c.records[index_1c]
+        record_mp = columns_mp.records[mp_index]
+
+        yield StockDiscrepancy(
+            kind=kind,
+            datetime=record_mp.datetime,
+            org_name=org_name,
+            product_identifier=product,
+            expiration_date=expiration_date,
+            price_guid=price_guid,
+            region=region,
+            quantity_1c=quantity_1c,
+            quantity_mp=quantity_mp,
+            datetime_1c=record_1c.datetime,
+            hit_link_1c=getattr(record_1c, 'hit_link', ''),
+            hit_link_mp=getattr(record_mp, 'hit_link', ''),
+        )
+
+    # sorted times of mp records per quantity
+    mp_times_by_quantity = {}
+    for mp_time, quantity in zip(columns_mp.times, columns_mp.values):
+        mp_times_by_quantity.setdefault(quantity, []).append(mp_time)
+
+    last_mp_time = columns_mp.times[-1]
+    times_1c = columns_1c.times
+    quantities_1c = columns_1c.values
+
+    for index_1c, time_1c in enumerate(times_1c):
+        # repeated values are checked once, by their first record
+        if index_1c and quantities_1c[index_1c - 1] == quantities_1c[index_1c]:
+            continue
+        if time_1c > last_mp_time:
+            break
+
+        next_index = index_1c + 1
+        while next_index < len(times_1c) and quantities_1c[next_index] == quantities_1c[index_1c]:
+            next_index += 1
+        window_end = times_1c[next_index] + PUSH_GRACE_SECONDS if next_index < len(times_1c) else float('inf')
+
+        mp_times = mp_times_by_quantity.get(quantities_1c[index_1c], [])
+        mp_index = bisect_left(mp_times, time_1c)
+        if mp_index < len(mp_times) and mp_times[mp_index] < window_end:
+            continue
+
+        record_1c = columns_1c.records[index_1c]
+        yield StockDiscrepancy(
+            kind='not pushed',
+            datetime=record_1c.datetime,
+            org_name=org_name,
+            product_identifier=product,
+            expiration_date=expiration_date,
+            price_guid=price_guid,
+            region=region,
+            quantity_1c=quantities_1c[index_1c],
+            datetime_1c=record_1c.datetime,
+            hit_link_1c=getattr(record_1c, 'hit_link', ''),
+        )
+
+
+@dataclass
+class MarketplaceStocksSummary:
+    marketplace: str
+    status: str = 'ok'
+    stocks_1c: int = 0
+    stocks_mp: int = 0
+    last_quantity_1c: Optional[float] = None
+    last_quantity_mp: Optional[float] = None
+    quantity_mismatch: int = 0
+    stale: int = 0
+    not_pushed: int = 0
+
+
+def summarize_stocks(
+    marketplace: str,
+    stocks_1c: list[StockBase],
+    stocks_mp: list[StockBase],
+    product_aliases: Optional[dict[str, str]] = None,
+) -> MarketplaceStocksSummary:
+    """Reconcile stocks of one marketplace and count discrepancies by kind."""
+    summary = MarketplaceStocksSummary(
+        marketplace=marketplace,
+        stocks_1c=len(stocks_1c),
+        stocks_mp=len(stocks_mp),
+    )
+
+    if stocks_1c:
+        summary.last_quantity_1c = _get_quantity(max(stocks_1c, key=lambda s: s.datetime))
+    if stocks_mp:
+        summary.last_quantity_mp = _get_quantity(max(stocks_mp, key=lambda s: s.datetime))
+
+    for discrepancy in reconcile_stocks(stocks_1c, stocks_mp, product_aliases):
+        kind = discrepancy.kind.replace(' ', '_')
+        setattr(summary, kind, getattr(summary, kind) + 1)
+
+    return summary
+
+
+def _get_1c_price_values(price: Price1C) -> tuple[float, ...]:
+    """Marketplace gets either regular or promo price, both are valid values even if they are 0."""
+    values = (_to_number(price.price_inc_vat), _to_number(price.price_promo))
+    return tuple(value for value in values if value is not None)
+
+
+def _get_mp_price(price: PriceBase) -> Optional[float]:
+    return _to_number(getattr(price, 'price', None))
+
+
+def reconcile_prices(
+    prices_1c: Iterable[Price1C],
+    prices_mp: Iterable[PriceBase],
+    price_settings: Optional[dict[str, bool]] = None,
+    product_aliases: Optional[dict[str, str]] = None,
+) -> Generator[PriceDiscrepancy, None, None]:
+    """Compare prices sent to marketplace with prices received from 1C and yield only discrepancies.
+
+    The same rules as in get_1c_prices are used to choose the 1C source of a price:
+    if moduleb2c is enabled for the price guid only moduleb2c prices are applicable,
+    otherwise only PriceTime ones.
+
+    Mp price is mapped to 1C prices by product and price guid. Marketplaces which
+    send region or organization id instead of price guid are mapped by product and
+    organization. Every mp price is compared with the latest applicable 1C price
+    received before it:
+        'price mismatch' - mp price is not equal to any 1C price received before.
+        'stale' - mp price is equal to one of older 1C prices.
+        'delayed' - price is correct but it was pushed more than PRICE_DELAY_SECONDS
+            after it came from 1C.
+        'no 1c price' - there is no applicable 1C price before the mp price.
+
+    Args:
+        prices_1c: Price1C records.
+        prices_mp: records with direction '  e->' and price attribute.
+        price_settings: price guids and their b2c usage flags from get_price_settings.
+        product_aliases: maps mp product identifiers (i.e. codes) to 1C product guids.
+    Yields:
+        Discrepancies grouped by product and price guid or organization.
+    """
+    price_settings = price_settings or {}
+    product_aliases = product_aliases or {}
+
+    def get_product(price: PriceBase) -> str:
+        return product_aliases.get(price.product_identifier, price.product_identifier)
+
+    applicable_1c = [
+        price for price in prices_1c
+        if price_settings.get(price.price_guid, price.b2c_used) == price.b2c_used
+    ]
+    price_guids_1c = {price.price_guid for price in applicable_1c}
+
+    groups_by_guid = _group_by_key(
+        applicable_1c,
+        lambda p: (get_product(p), p.price_guid),
+        _get_1c_price_values,
+    )
+    groups_by_org = _group_by_key(
+        applicable_1c,
+        lambda p: (get_product(p), p.org_name),
+        _get_1c_price_values,
+    )
+
+    def get_key_mp(price: PriceBase) -> tuple[str, str, str]:
+        price_guid = str(price.price_guid)
+        if price_guid in price_guids_1c:
+            return 'guid', get_product(price), price_guid
+        return 'org', get_product(price), price.org_name
+
+    groups_mp = _group_by_key(prices_mp, get_key_mp, _get_mp_price)
+
+    discrepancies_count = 0
+    for key in sorted(groups_mp.keys(), key=str):
+        mapping, product, guid_or_org = key
+        groups_1c = groups_by_guid if mapping == 'guid' else groups_by_org
+
+        for discrepancy in _reconcile_prices_key(groups_1c.get((product, guid_or_org)), groups_mp[key]):
+            yield discrepancy
+            discrepancies_count += 1
+
+    print(f'discrepancies: {discrepancies_count}')
+
+
+def _reconcile_prices_key(
+    columns_1c: Optional[_Columns],
+    columns_mp: _Columns,
+) -> Generator[PriceDiscrepancy, None, None]:
+    times_1c = columns_1c.times if columns_1c else []
+    values_1c = columns_1c.values if columns_1c else []
+
+    # index of the first 1C record where each price has appeared
+    first_seen = {}
+    # index of the record where the current run of equal prices has started
+    run_start = []
+    for index, values in enumerate(values_1c):
+        for value in values:
+            first_seen.setdefault(value, index)
+        run_start.append(run_start[-1] if index and values_1c[index - 1] == values else index)
+
+    for mp_index, mp_time in enumerate(columns_mp.times):
+        record_mp = columns_mp.records[mp_index]
+        price_mp = columns_mp.values[mp_index]
+        index_1c = bisect_right(times_1c, mp_time) - 1
+
+        discrepancy = PriceDiscrepancy(
+            kind='',
+            datetime=record_mp.datetime,
+            org_name=record_mp.org_name,
+            product_identifier=record_mp.product_identifier,
+            price_guid=str(record_mp.price_guid),
+            price_mp=price_mp,
+            hit_link_mp=getattr(record_mp, 'hit_link', ''),
+        )
+
+        if index_1c < 0:
+            discrepancy.kind = 'no 1c price'
+            yield discrepancy
+            continue
+
+        record_1c = columns_1c.records[index_1c]
+        discrepancy.product_identifier = record_1c.product_identifier
+        discrepancy.price_inc_vat_1c = _to_number(record_1c.price_inc_vat)
+        discrepancy.price_promo_1c = _to_number(record_1c.price_promo)
+        discrepancy.b2c_used = record_1c.b2c_used
+        discrepancy.hit_link_1c = record_1c.hit_link
+
+        if price_mp in values_1c[index_1c]:
+            source_time = times_1c[run_start[index_1c]]
+            discrepancy.datetime_1c = columns_1c.records[run_start[index_1c]].datetime
+            discrepancy.delay_seconds = round(mp_time - source_time, 3)
+            if discrepancy.delay_seconds <= PRICE_DELAY_SECONDS:
+                continue
+            discrepancy.kind = 'delayed'
+        elif first_seen.get(price_mp, index_1c) < index_1c:
+            discrepancy.kind = 'stale'
+            discrepancy.datetime_1c = record_1c.datetime
+        else:
+            discrepancy.kind = 'price mismatch'
+            discrepancy.datetime_1c = record_1c.datetime
+
+        yield discrepancy
+
+
+# upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600, float('inf'))
+LATENCY_TOP_N = int(os.environ.get('LATENCY_TOP_N', 20))
+
+
+@dataclass
+class LatencyStats:
+    marketplace: str
+    org_name: str = ''
+    product_identifier: str = ''
+    expiration_date: str = ''
+    price_guid: str = ''
+    pushed: int = 0
+    not_pushed: int = 0
+    mean_seconds: Optional[float] = None
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    p99_seconds: Optional[float] = None
+    max_seconds: Optional[float] = None
+
+
+@dataclass
+class LatencySample:
+    latency_seconds: float
+    marketplace: str
+    org_name: str = ''
+    product_identifier: str = ''
+    expiration_date: str = ''
+    price_guid: str = ''
+    value: str = ''
+    datetime_1c: Optional[datetime] = None
+    datetime_mp: Optional[datetime] = None
+    hit_link_1c: str = ''
+    hit_link_mp: str = ''
+
+
+class _Histogram:
+    """Latency counts by LATENCY_BUCKETS, percentiles are upper bounds of buckets."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, latency: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.total += 1
+        self.sum += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self.total:
+            return None
+
+        rank = self.total * percent / 100
+        accumulated = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            accumulated += count
+            if accumulated >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+
+class LatencyAnalyzer:
+    """Delays between a value coming from 1C and the same value being pushed to marketplace.
+
+    Records are consumed by batches in chronological order, only per key state and
+    histograms are kept so any window length can be analyzed. A 1C value starts
+    waiting when it differs from the previous 1C value of the same product,
+    organization and expiration date for stocks (and price guid for prices). The first mp record
+    with the same value and key ends the waiting and its delay is added to statistics.
+    """
+
+    def __init__(
+        self,
+        marketplace: str,
+        kind: str,
+        product_aliases: Optional[dict[str, str]] = None,
+        top_n: int = LATENCY_TOP_N,
+    ) -> None:
+        """
+        Args:
+            marketplace: MP name, used as a label.
+            kind: 'stocks' or 'prices'.
+            product_aliases: maps mp product identifiers (i.e. codes) to 1C product guids.
+            top_n: how many worst delays are kept.
+        """
+        self.marketplace = marketplace
+        self.product_aliases = product_aliases or {}
+        self.top_n = top_n
+
+        if kind == 'stocks':
+            self._get_values_1c = lambda r: (_get_quantity(r),)
+            self._get_value_mp = _get_quantity
+        else:
+            self._get_values_1c = _get_1c_price_values
+            self._get_value_mp = _get_mp_price
+        # 1C stocks have no price guid, prices of different price types are different values
+        self._by_price_guid = kind != 'stocks'
+
+        # (org, product, expiration date, price guid): last 1C values
+        self._last_1c: dict[tuple, tuple] = {}
+        # (org, product, expiration date, price guid): {value: waiting 1C record}
+        self._waiting: dict[tuple, dict] = {}
+        self._histograms: dict[tuple, _Histogram] = {}
+        self.total = _Histogram()
+        # min-heap of (latency, counter, sample)
+        self._worst: list = []
+        self._counter = 0
+
+    def add_batch(self, records: Iterable[Base]) -> None:
+        """Process records of both directions sorted by datetime."""
+        for record in records:
+            product = self.product_aliases.get(record.product_identifier, record.product_identifier)
+            # 1C sends one stock row per expiration batch, prices have no expiration date
+            key = (
+                record.org_name,
+                product,
+                getattr(record, 'expiration_date', '') or '',
+                str(record.price_guid) if self._by_price_guid else '',
+            )
+
+            if record.direction.startswith('->'):
+                values = self._get_values_1c(record)
+                if self._last_1c.get(key) == values:
+                    continue
+                self._last_1c[key] = values
+
+                waiting = self._waiting.setdefault(key, {})
+                for value in values:
+                    waiting.setdefault(value, record)
+                continue
+
+            value = self._get_value_mp(record)
+            record_1c = self._waiting.get(key, {}).pop(value, None)
+            if record_1c is None:
+                continue
+
+            latency = (record.datetime - record_1c.datetime).total_seconds()
+            self._histograms.setdefault(key, _Histogram()).add(latency)
+            self.total.add(latency)
+            self._add_worst(LatencySample(
+                latency_seconds=latency,
+                marketplace=self.marketplace,
+                org_name=record.org_name,
+                product_identifier=product,
+                expiration_date=key[2],
+                price_guid=key[3],
+                value=str(value),
+                datetime_1c=record_1c.datetime,
+                datetime_mp=record.datetime,
+                hit_link_1c=getattr(record_1c, 'hit_link', ''),
+                hit_link_mp=getattr(record, 'hit_link', ''),
+            ))
+
+    def _add_worst(self, sample: LatencySample) -> None:
+        self._counter += 1
+        item = (sample.latency_seconds, self._counter, sample)
+        if len(self._worst) < self.top_n:
+            heapq.heappush(self._worst, item)
+        elif item > self._worst[0]:
+            heapq.heapreplace(self._worst, item)
+
+    def get_stats(self) -> Generator[LatencyStats, None, None]:
+        """Statistics per organization, product, expiration date and price guid, slowest first."""
+        keys = self._histograms.keys() | {key for key, waiting in self._waiting.items() if waiting}
+
+        stats = []
+        for key in keys:
+            org_name, product, expiration_date, price_guid = key
+            histogram = self._histograms.get(key, _Histogram())
+            stats.append(LatencyStats(
+                marketplace=self.marketplace,
+                org_name=org_name,
+                product_identifier=product,
+                expiration_date=expiration_date,
+                price_guid=price_guid,
+                pushed=histogram.total,
+                not_pushed=len(self._waiting.get(key, {})),
+                mean_seconds=round(histogram.sum / histogram.total, 3) if histogram.total else None,
+                p50_seconds=histogram.percentile(50),
+                p90_seconds=histogram.percentile(90),
+                p99_seconds=histogram.percentile(99),
+                max_seconds=histogram.max if histogram.total else None,
+            ))
+
+        yield from sorted(stats, key=lambda s: (-(s.max_seconds or 0), -s.not_pushed))
+
+    def get_worst(self) -> list[LatencySample]:
+        """The slowest pushes, slowest first."""
+        return [item[2] for item in sorted(self._worst, reverse=True)]
+
+    def print_histogram(self) -> None:
+        """Print overall latency histogram with percentiles."""
+        print('\n' f'latency histogram ({self.total.total} pushes):')
+
+        lower = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.total.counts):
+            share = count / self.total.total if self.total.total else 0
+            print(f'{lower:>7}-{bound:<7} {count:>9} {"#" * round(share * 50)}')
+            lower = bound
+
+        for percent in (50, 90, 99):
+            print(f'p{percent}: {self.total.percentile(percent)} s')
@@ -0,0 +1,126 @@
+"""Cache of parsed records of a time window.
+
+Records of all products are parsed once per (parser class, method, window)
+and saved under the cache dir as columns - one list per dataclass field.
+Next runs over the same window with other products or stores do not request
+elastic and do not decode JSON: only the product column is scanned and
+dataclasses are built for matching rows.
+
+Windows ending later than RECORDS_CACHE_SETTLE_MINUTES before now can still
+get new hits, they are not saved. Windows not used for RECORDS_CACHE_MAX_AGE_DAYS
+are removed, then least recently used ones until the cache fits
+RECORDS_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import os
+import pickle
+import time
+from dataclasses import fields
+from datetime import datetime, timedelta
+from typing import Callable, Collection, Iterable
+
+from utils.other import CACHE_DIR
+
+RECORDS_CACHE_DIR = os.path.join(CACHE_DIR, 'records')
+RECORDS_CACHE_SETTLE_MINUTES = float(os.environ.get('RECORDS_CACHE_SETTLE_MINUTES', 5))
+RECORDS_CACHE_MAX_BYTES = int(os.environ.get('RECORDS_CACHE_MAX_BYTES', 1024 ** 3))
+RECORDS_CACHE_MAX_AGE_DAYS = float(os.environ.get('RECORDS_CACHE_MAX_AGE_DAYS', 30))
+
+
+class _RecordColumns:
+    """Records of one dataclass stored column by column."""
+
+    def __init__(self, record_class: type, records: list) -> None:
+        self.record_class = record_class
+        self.names = [field.name for field in fields(record_class)]
+        self.columns = {name: [getattr(record, name) for record in records] for name in self.names}
+        self.size = len(records)
+
+    def select(self, column_name: str, values: Collection) -> list:
+        """Build records which have one of values in the column, all records if values are empty."""
+        if values:
+            column = self.columns[column_name]
+            indices = [i for i in range(self.size) if column[i] in values]
+        else:
+            indices = range(self.size)
+
+        columns = [self.columns[name] for name in self.names]
+        return [
+            self.record_class(**dict(zip(self.names, [column[i] for column in columns])))
+            for i in indices
+        ]
+
+
+def _is_settled(end_dt: str) -> bool:
+    # end_dt is elastic utc time like '2022-11-26T09:00:00.000Z'
+    settled_before = datetime.utcnow() - timedelta(minutes=RECORDS_CACHE_SETTLE_MINUTES)
+    return datetime.fromisoformat(end_dt.rstrip('Z')) < settled_before
+
+
+def _evict_records_cache(keep_path: str) -> None:
+    """Remove expired windows, then least recently used ones until the cache fits RECORDS_CACHE_MAX_BYTES."""
+    cached_files = []
+    for dirpath, _, filenames in os.walk(RECORDS_CACHE_DIR):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            cached_files.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(cached_file[1] for cached_file in cached_files)
+    expired_before = time.time() - RECORDS_CACHE_MAX_AGE_DAYS * 24 * 60 * 60
+
+    for mtime, size, path in sorted(cached_files):
+        if total_size <= RECORDS_CACHE_MAX_BYTES and mtime >= expired_before:
+            break
+        if path == keep_path:
+            continue
+
+        os.remove(path)
+        total_size -= size
+        print(f'removed cached records {path}')
+
+
+def get_cached_records(
+    name: str,
+    begin_dt: str,
+    end_dt: str,
+    record_class: type,
+    parse_records: Callable[[], Iterable],
+    column_name: str,
+    values: Collection,
+) -> list:
+    """Get records of the window filtered by a column, parsing the window only if it is not cached.
+
+    Args:
+        name: identifies parser class, method and everything else but the window
+            records depend on, i.e. endpoint.
+        begin_dt: begin of the window.
+        end_dt: end of the window.
+        record_class: dataclass of the records.
+        parse_records: function getting unfiltered records of the window.
+        column_name: field to filter by, i.e. 'product_identifier'.
+        values: values to keep, all records are kept if it is empty.
+    Returns:
+        Records in the order they were parsed.
+    """
+    cache_key = hashlib.sha1(f'{name}|{begin_dt}|{end_dt}'.encode()).hexdigest()
+    cache_path = os.path.join(RECORDS_CACHE_DIR, f'{cache_key}.pickle')
+
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            record_columns = pickle.load(cache_file)
+        # mtime is the last use of the window for eviction
+        os.utime(cache_path)
+        print(f'{record_columns.size} parsed records are loaded from cache')
+    except FileNotFoundError:
+        record_columns = _RecordColumns(record_class, list(parse_records()))
+
+        if _is_settled(end_dt):
+            os.makedirs(RECORDS_CACHE_DIR, exist_ok=True)
+            with open(cache_path + '.part', 'wb') as cache_file:
+                pickle.dump(record_columns, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + '.part', cache_path)
+            _evict_records_cache(cache_path)
+
+    return record_columns.select(column_name, values)
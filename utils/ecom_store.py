@@ -0,0 +1,149 @@
+"""Local store of parsed records.
+
+Records of all parsers are appended into a sqlite database under the cache dir,
+one table per kind (stocks, prices, stores). Columns are fields of record
+dataclasses plus marketplace, day and hit id; a column is added when a parser
+brings a field the table does not have yet. Every record is saved once - its
+hash is the primary key, so overlapping ingestions do not make duplicates.
+
+Ingestion is incremental: the end of the last ingested period is kept per
+marketplace, organization and parser method and the next period begins there.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from dataclasses import asdict, fields
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from utils.other import CACHE_DIR, parse_datetime, parse_listing_datetime
+
+STORE_PATH = os.environ.get('LOCAL_STORE_PATH', os.path.join(CACHE_DIR, 'records.sqlite'))
+# hits may get into elastic with a delay, so the next period overlaps the previous one
+INGEST_OVERLAP_MINUTES = float(os.environ.get('INGEST_OVERLAP_MINUTES', 10))
+
+STORE_KINDS = ('stocks', 'prices', 'stores')
+SERVICE_COLUMNS = ('record_hash', 'marketplace', 'day', 'hit_id')
+
+
+def open_store(path: str = STORE_PATH) -> sqlite3.Connection:
+    """Open the store creating it if needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS watermarks (name TEXT PRIMARY KEY, end_dt TEXT)')
+
+    for kind in STORE_KINDS:
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {kind} '
+            '(record_hash TEXT PRIMARY KEY, marketplace TEXT, day TEXT, hit_id TEXT)'
+        )
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {kind}_marketplace_day ON {kind} (marketplace, day)')
+
+    connection.commit()
+
+    return connection
+
+
+def get_watermark(connection: sqlite3.Connection, name: str) -> Optional[str]:
+    """Get the end of the last ingested period."""
+    row = connection.execute('SELECT end_dt FROM watermarks WHERE name = ?', (name,)).fetchone()
+
+    return row[0] if row else None
+
+
+def save_watermark(connection: sqlite3.Connection, name: str, end_dt: str) -> None:
+    connection.execute(
+        'INSERT INTO watermarks (name, end_dt) VALUES (?, ?) '
+        'ON CONFLICT (name) DO UPDATE SET end_dt = excluded.end_dt',
+        (name, end_dt),
+    )
+    connection.commit()
+
+
+def _to_column_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+
+    return str(value)
+
+
+def get_record_datetime(value) -> Optional[datetime]:
+    """Get datetime of a record. Feed records keep it as a string from ftp listing."""
+    if isinstance(value, datetime):
+        return value
+
+    if isinstance(value, str) and value:
+        for parse in (parse_datetime, datetime.fromisoformat, parse_listing_datetime):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+
+    return None
+
+
+def _get_hit_id(hit_link: str) -> str:
+    # kibana doc links end with '?id=<doc id>'
+    return hit_link.rsplit('id=', 1)[-1] if hit_link else ''
+
+
+def _add_columns(connection: sqlite3.Connection, kind: str, columns: Iterable[str]) -> None:
+    existing_columns = {row[1] for row in connection.execute(f'PRAGMA table_info({kind})')}
+
+    for column in columns:
+        if column not in existing_columns:
+            connection.execute(f'ALTER TABLE {kind} ADD COLUMN "{column}"')
+
+
+def save_records(connection: sqlite3.Connection, kind: str, marketplace: str, records: Iterable) -> int:
+    """Append records into the table of their kind skipping already saved ones.
+
+    Args:
+        connection: store connection.
+        kind: one of STORE_KINDS.
+        marketplace: marketplace of the parser.
+        records: dataclasses of any parser.
+    Returns:
+        Number of new records.
+    """
+    inserted = 0
+    checked_classes = set()
+
+    for record in records:
+        record_class = type(record)
+        columns = [field.name for field in fields(record_class) if field.name not in SERVICE_COLUMNS]
+        if record_class not in checked_classes:
+            _add_columns(connection, kind, columns)
+            checked_classes.add(record_class)
+
+        record_dict = asdict(record)
+        record_datetime = get_record_datetime(record_dict.get('datetime'))
+        values = [_to_column_value(record_dict[column]) for column in columns]
+        record_hash = hashlib.blake2b(
+            json.dumps([marketplace, record_class.__name__, *values], ensure_ascii=False).encode(),
+            digest_size=16,
+        ).hexdigest()
+
+        all_columns = ', '.join(f'"{column}"' for column in (*SERVICE_COLUMNS, *columns))
+        placeholders = ', '.join('?' * (len(SERVICE_COLUMNS) + len(columns)))
+        cursor = connection.execute(
+            f'INSERT OR IGNORE INTO {kind} ({all_columns}) VALUES ({placeholders})',
+            (
+                record_hash,
+                marketplace,
+                record_datetime.date().isoformat() if record_datetime else '',
+                _get_hit_id(record_dict.get('hit_link', '')),
+                *values,
+            ),
+        )
+        inserted += cursor.rowcount
+
+    connection.commit()
+
+    return inserted
@@ -0,0 +1,225 @@
+"""Protection of the shared elasticsearch balancer from parallel extraction.
+
+Every elastic request goes through call_elastic which combines:
+    token bucket - no more than ELASTIC_RATE_LIMIT requests per second per index.
+    AIMD limiter - number of concurrent requests grows by one while responses are fast,
+        stays while they are slow and is halved on 429 or timeouts.
+    retries - overloaded requests are repeated with jittered exponential backoff.
+    circuit breaker - after ELASTIC_BREAKER_FAILURES overload failures in a row requests wait
+        ELASTIC_BREAKER_COOLDOWN seconds, then one probe request decides if they can go.
+
+Rate limits per index can be set like
+    ELASTIC_RATE_LIMITS='apm-*prod-ecom-0*=5,k8s-production-*=2'
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Callable
+
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch import ConnectionTimeout, TransportError
+
+RATE_LIMIT = float(os.environ.get('ELASTIC_RATE_LIMIT', 10))
+RATE_LIMITS = dict(
+    (index, float(rate)) for index, rate in (
+        limit.split('=') for limit in os.environ.get('ELASTIC_RATE_LIMITS', '').split(',') if limit
+    )
+)
+CONCURRENCY_START = int(os.environ.get('ELASTIC_CONCURRENCY_START', 2))
+CONCURRENCY_MAX = int(os.environ.get('ELASTIC_CONCURRENCY_MAX', 8))
+LATENCY_TARGET_MS = float(os.environ.get('ELASTIC_LATENCY_TARGET_MS', 5000))
+RETRIES = int(os.environ.get('ELASTIC_RETRIES', 4))
+BACKOFF_BASE = float(os.environ.get('ELASTIC_BACKOFF_BASE', 1))
+BACKOFF_MAX = float(os.environ.get('ELASTIC_BACKOFF_MAX', 30))
+BREAKER_FAILURES = int(os.environ.get('ELASTIC_BREAKER_FAILURES', 5))
+BREAKER_COOLDOWN = float(os.environ.get('ELASTIC_BREAKER_COOLDOWN', 30))
+
+# statuses meaning the cluster is overloaded and the request can be repeated later
+OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 0) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, start: int = CONCURRENCY_START, maximum: int = CONCURRENCY_MAX) -> None:
+        self.limit = float(max(1, min(start, maximum)))
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, overloaded: bool, slow: bool = False) -> None:
+        """Decrease the limit on overload, keep it on slow responses and increase it on fast ones."""
+        with self.condition:
+            self.in_flight -= 1
+
+            if overloaded:
+                self.limit = max(1.0, self.limit / 2)
+                print(f'elastic is overloaded, concurrency limit decreased to {int(self.limit)}')
+            elif not slow:
+                # +1 after every `limit` fast responses
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+
+class CircuitBreaker:
+    """Stops requests for a cooldown after too many overload failures in a row.
+
+    States:
+        closed - requests go as usual.
+        open - requests wait until the cooldown is over.
+        half-open - the cooldown is over, one probe request goes and the others wait.
+            The circuit is closed if the probe succeeds and opened again if it fails.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self.failures_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.condition = threading.Condition()
+
+    def before_call(self) -> None:
+        """Wait until a request is allowed."""
+        with self.condition:
+            while True:
+                if self.state == 'closed':
+                    return
+
+                if self.state == 'open':
+                    wait = self.opened_at + self.cooldown - time.monotonic()
+                    if wait > 0:
+                        print(f'elastic circuit is open, waiting {wait:.0f} s')
+                        self.condition.wait(wait)
+                        continue
+                    self.state = 'half-open'
+
+                if not self.probe_in_flight:
+                    self.probe_in_flight = True
+                    return
+
+                self.condition.wait()
+
+    def record(self, success: bool) -> None:
+        """Record result of the request: success or overload failure."""
+        with self.condition:
+            self.probe_in_flight = False
+
+            if success:
+                self.failures = 0
+                self.state = 'closed'
+            else:
+                self.failures += 1
+                if self.state == 'half-open' or self.failures >= self.failures_threshold:
+                    self.state = 'open'
+                    self.opened_at = time.monotonic()
+
+            self.condition.notify_all()
+
+    def release(self) -> None:
+        """Forget the request that failed not because of overload, i.e. wrong query."""
+        with self.condition:
+            self.probe_in_flight = False
+            self.condition.notify_all()
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+_limiter = AIMDLimiter()
+_breaker = CircuitBreaker()
+
+
+def _get_bucket(index: str) -> TokenBucket:
+    with _buckets_lock:
+        if index not in _buckets:
+            _buckets[index] = TokenBucket(RATE_LIMITS.get(index, RATE_LIMIT))
+        return _buckets[index]
+
+
+def _is_overload(error: Exception) -> bool:
+    if isinstance(error, (ConnectionTimeout, ESConnectionError)):
+        return True
+
+    return isinstance(error, TransportError) and error.status_code in OVERLOAD_STATUSES
+
+
+def call_elastic(index: str, request: Callable[[], Any]) -> Any:
+    """Execute elastic request within rate and concurrency limits, retrying it on overload.
+
+    Args:
+        index: index pattern, used to choose rate limit.
+        request: function making the request.
+    Returns:
+        Whatever request returns.
+    Raises:
+        The last error if retries are over, other errors at once.
+    """
+    bucket = _get_bucket(index)
+
+    for attempt in range(RETRIES + 1):
+        _breaker.before_call()
+        bucket.acquire()
+        _limiter.acquire()
+
+        started = time.perf_counter()
+        try:
+            result = request()
+        except Exception as e:
+            overloaded = _is_overload(e)
+            _limiter.release(overloaded=overloaded)
+            if overloaded:
+                _breaker.record(success=False)
+            else:
+                _breaker.release()
+
+            if not overloaded or attempt == RETRIES:
+                raise
+
+            # full jitter spreads retries of parallel workers
+            backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            print(f'elastic request failed ({type(e).__name__}), retry in {backoff:.1f} s')
+            time.sleep(backoff)
+            continue
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        # slow but successful queries are not overload, they only stop the growth
+        _limiter.release(overloaded=False, slow=latency_ms > LATENCY_TARGET_MS)
+        _breaker.record(success=True)
+
+        return result
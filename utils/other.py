@@ -5,16 +5,21 @@ import logging
 from dataclasses import asdict, fields
 from datetime import datetime, timedelta
 import os
+import sys
 from urllib.parse import urlparse
 
+# local data that is reused between runs (feeds, tunnel state etc.)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ecom-tech-support')
 
-def write_down_csv(filename: str, fields_list: list[str], obj_list: list) -> None:
+
+def write_down_csv(filename: str, fields_list: list[str], obj_list: list, flush: bool = False) -> None:
     """Create a *.csv file and write down passed data.
 
     Args:
         filename: name should be with extension.
         fields_list: columns that should be in the file.
         obj_list: list of dataclasses.
+        flush: write every row to disk at once, for endless generators.
     """
     data_dir = 'd'
     filepath = os.path.join(data_dir, filename)
@@ -25,10 +30,26 @@ def write_down_csv(filename: str, fields_list: list[str], obj_list: list) -> Non
 
         for obj in obj_list:
             data_file_dw.writerow(asdict(obj))
+            if flush:
+                data_file.flush()
 
     print('\n' f'created file "{data_file.name}"')
 
 
+def read_identifiers(filepath: str) -> list[str]:
+    """Read products or stores identifiers from a file, one per line.
+
+    Empty lines and lines starting with '#' are skipped. '-' reads standard input.
+    """
+    if filepath == '-':
+        identifiers = [line.strip() for line in sys.stdin]
+    else:
+        with open(filepath, encoding='utf-8') as identifiers_file:
+            identifiers = [line.strip() for line in identifiers_file]
+
+    return [identifier for identifier in identifiers if identifier and not identifier.startswith('#')]
+
+
 def parse_datetime(dt_str: str) -> datetime:
     """
     Parse datetime from string.
@@ -60,6 +81,25 @@ def parse_datetime(dt_str: str) -> datetime:
     return dt
 
 
+def parse_listing_datetime(dt_str: str) -> datetime:
+    """Parse file date from ftp LIST output like 'Nov 26 12:00' or 'Nov 26 2021'.
+
+    LIST shows time instead of year for files changed within half a year, so their
+    year is the current one or the previous one if the date would be in the future.
+    """
+    month, day, time_or_year = dt_str.split()
+
+    if ':' not in time_or_year:
+        return datetime.strptime(f'{month} {day} {time_or_year}', '%b %d %Y')
+
+    now = datetime.now()
+    dt = datetime.strptime(f'{month} {day} {now.year} {time_or_year}', '%b %d %Y %H:%M')
+    if dt > now + timedelta(days=1):
+        dt = dt.replace(year=now.year - 1)
+
+    return dt
+
+
 def convert_timezone(dt: datetime, timezone: str) -> datetime:
     """Calculate datetime basing on passed datetime and direction of converting.
 